@@ -0,0 +1,89 @@
+"""
+Synthetic tweet corpus for benchmarks.
+
+Tweets are assembled from Flow-flavoured templates and word lists, so
+they look enough like the real feed to exercise the local scorer and
+the prompt sizes. A tunable share of the corpus repeats earlier tweets,
+either verbatim or as near-duplicates that only differ in handles,
+hashtags, links and emojis (the way campaign templates do).
+
+    python3 corpus.py 10000 --duplicate-rate 0.3 > tweets.jsonl
+"""
+import argparse
+import json
+import random
+import sys
+from typing import Any, Dict, List, Optional
+
+SUBJECTS = ["Flow", "The Flow blockchain", "Flow's new release", "Cadence", "The Flow ecosystem", "Flow EVM", "This dapp on Flow"]
+POSITIVE = ["is absolutely amazing", "feels fast and smooth", "has the best developer experience", "is incredibly scalable",
+            "keeps getting better", "made onboarding easy", "is a solid bet for builders", "looks bullish"]
+NEGATIVE = ["is such a disappointment", "feels slow and expensive", "has terrible documentation", "keeps failing for me",
+            "is buggy again today", "is a waste of time", "looks bearish", "broke my deployment"]
+NEUTRAL = ["shipped an update today", "is hosting a community call", "changed its fee model", "has a new roadmap",
+           "announced a partnership", "is migrating some contracts", "published new docs", "has a testnet reset"]
+FILLERS = ["Thoughts?", "Not sure yet.", "Anyone else seeing this?", "Trying it this weekend.", "Long thread below.",
+           "Been building for a month.", "Just my two cents.", "More soon."]
+HASHTAGS = ["#Flow", "#Blockchain", "#Web3", "#NFT", "#Crypto", "#BuildOnFlow", "#DeFi", "#Cadence"]
+EMOJIS = ["🚀", "🔥", "😤", "🤔", "💯", "👀", "😬", "✨"]
+
+
+def _tweet(rng: random.Random) -> str:
+    mood = rng.choice((POSITIVE, NEGATIVE, NEUTRAL))
+    parts = [rng.choice(SUBJECTS), rng.choice(mood) + rng.choice((".", "!", "..."))]
+    parts += rng.sample(FILLERS, rng.randint(0, 2))
+    if rng.random() < 0.6:
+        parts += rng.sample(HASHTAGS, rng.randint(1, 3))
+    if rng.random() < 0.3:
+        parts.append(rng.choice(EMOJIS))
+    return " ".join(parts)
+
+
+def _near_duplicate(text: str, rng: random.Random) -> str:
+    """
+    Vary only what templated posts vary: handles, hashtags, links, emojis
+    """
+    words = [w for w in text.split() if not w.startswith("#") and w not in EMOJIS]
+    extras = [f"@user{rng.randint(1, 99999)}"] + rng.sample(HASHTAGS, rng.randint(1, 3))
+    if rng.random() < 0.5:
+        extras.append(f"https://t.co/{rng.randint(10 ** 6, 10 ** 7)}")
+    if rng.random() < 0.5:
+        extras.append(rng.choice(EMOJIS))
+    return " ".join(words + extras)
+
+
+def generate(
+    count: int,
+    duplicate_rate: float = 0.2,
+    near_duplicate_share: float = 0.5,
+    authors: int = 1000,
+    seed: Optional[int] = 1,
+) -> List[Dict[str, Any]]:
+    """
+    `count` tweets; a `duplicate_rate` fraction repeats an earlier tweet,
+    `near_duplicate_share` of those as a near-duplicate rather than an
+    exact copy
+    """
+    rng = random.Random(seed)
+    tweets: List[Dict[str, Any]] = []
+    for i in range(count):
+        if tweets and rng.random() < duplicate_rate:
+            original = rng.choice(tweets)["content"]
+            content = _near_duplicate(original, rng) if rng.random() < near_duplicate_share else original
+        else:
+            content = _tweet(rng)
+        tweets.append({"id": i + 1, "content": content, "author": f"@author{rng.randint(1, authors)}"})
+    return tweets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic tweet corpus as JSON lines")
+    parser.add_argument("count", type=int)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--near-duplicate-share", type=float, default=0.5)
+    parser.add_argument("--authors", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for tweet in generate(args.count, args.duplicate_rate, args.near_duplicate_share, args.authors, args.seed):
+        sys.stdout.write(json.dumps(tweet, ensure_ascii=False) + "\n")
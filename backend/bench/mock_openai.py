@@ -0,0 +1,293 @@
+"""
+Local mock of the OpenAI chat-completions API for benchmarks.
+
+Answers POST /v1/chat/completions in the shapes the scorer asks for
+(single tweet, compact profiles and batched {"results": [...]}) with
+deterministic scores derived from the tweet text, and can inject:
+
+- latency: base + uniform jitter, plus a per-output-token cost
+- 429s with a Retry-After header, at a given rate
+- malformed replies (prose instead of JSON, or truncated JSON), at a
+  given rate
+- indented JSON replies, the way JSON mode often answers (--indent)
+
+Replies longer than the request's max_tokens are cut off there with
+finish_reason "length", like the real API, so an output budget that is
+too small shows up as truncated replies and extra calls.
+
+Point the scorer at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+GET /stats returns the request/token counters, POST /reset clears them.
+
+    python3 mock_openai.py --port 8900 --latency-ms 300 --rate-429 0.02 --malformed 0.05
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+_BATCH_RE = re.compile(r"Tweets \(JSON\): (\[.*?\])\n\s*\n\s*Respond with JSON", re.DOTALL)
+_FULL_PROMPT_RE = re.compile(r'Tweet: "(.*?)"\n\s*\n\s*Respond in JSON', re.DOTALL)
+# The cl100k pre-tokenizer split; common words, numbers and JSON
+# punctuation come out as one token each, within a few percent of the
+# real tokenizer's counts for these replies
+_TOKEN_RE = re.compile(r"'(?:[sdmt]|ll|ve|re)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+|\S")
+
+
+def _score_of(text: str) -> int:
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=2).digest()
+    return int.from_bytes(digest, "little") % 201 - 100
+
+
+def _sentiment_of(score: int) -> str:
+    if score > 15:
+        return "Positive"
+    if score < -15:
+        return "Negative"
+    return "Neutral"
+
+
+def _item(text: str, wants_sentiment: bool, wants_explanation: bool) -> Dict[str, Any]:
+    score = _score_of(text)
+    item: Dict[str, Any] = {"score": score}
+    if wants_sentiment:
+        item["sentiment"] = _sentiment_of(score)
+    if wants_explanation:
+        item["explanation"] = "Mock analysis"
+    return item
+
+
+def tokens_of(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(tokens_of(text))
+
+
+class MockState:
+    """
+    Injection settings and counters shared by the request threads
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 200.0,
+        jitter_ms: float = 100.0,
+        ms_per_output_token: float = 0.0,
+        rate_429: float = 0.0,
+        retry_after: float = 0.5,
+        malformed: float = 0.0,
+        indent: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.ms_per_output_token = ms_per_output_token
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.malformed = malformed
+        self.indent = indent
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters = {
+                "requests": 0,
+                "completions": 0,
+                "rate_limited": 0,
+                "malformed": 0,
+                "truncated": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+            }
+
+    def count(self, **values: int) -> None:
+        with self.lock:
+            for name, value in values.items():
+                self.counters[name] += value
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return self.random.random() < rate
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+
+def build_reply(messages: List[Dict[str, str]], indent: Optional[int] = None) -> str:
+    """
+    The well-formed JSON reply the real model is asked to produce
+    """
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = [m["content"] for m in messages if m["role"] == "user"]
+    prompt = user[0] if user else ""
+
+    batch = _BATCH_RE.search(prompt)
+    if batch:
+        shape = prompt[batch.end():]
+        items = json.loads(batch.group(1))
+        results = [
+            dict(_item(it["text"], '"sentiment"' in shape, '"explanation"' in shape), id=it["id"])
+            for it in items
+        ]
+        return json.dumps({"results": results}, indent=indent)
+
+    full = _FULL_PROMPT_RE.search(prompt)
+    if full:
+        return json.dumps(_item(full.group(1), True, True), indent=indent)
+    # Compact profiles: the tweet is the whole user message
+    return json.dumps(_item(prompt, '"sentiment"' in system, '"explanation"' in system), indent=indent)
+
+
+def malformed_reply(reply: str, rng: random.Random) -> str:
+    if rng.random() < 0.5:
+        # Prose the regex repair can still read a score from
+        try:
+            score = json.loads(reply).get("score", 0)
+        except (ValueError, AttributeError):
+            score = 0
+        return f"Sure! I'd rate this tweet a score of {score}."
+    return reply[: max(1, len(reply) // 2)]
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                self._send(200, state.stats())
+            else:
+                self._send(404, {"error": {"message": "Not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if self.path.rstrip("/").endswith("/reset"):
+                state.reset()
+                self._send(200, {"ok": True})
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "Not found"}})
+                return
+
+            request = json.loads(body)
+            state.count(requests=1)
+            if state.roll(state.rate_429):
+                state.count(rate_limited=1)
+                self._send(
+                    429,
+                    {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                    {"retry-after": str(state.retry_after)}
+                )
+                return
+
+            messages = request.get("messages", [])
+            reply = build_reply(messages, state.indent)
+            if state.roll(state.malformed):
+                state.count(malformed=1)
+                reply = malformed_reply(reply, state.random)
+
+            finish_reason = "stop"
+            tokens = tokens_of(reply)
+            max_tokens = request.get("max_tokens")
+            if max_tokens and len(tokens) > max_tokens:
+                state.count(truncated=1)
+                reply = "".join(tokens[:max_tokens])
+                finish_reason = "length"
+
+            prompt_tokens = sum(estimate_tokens(m.get("content", "")) + 4 for m in messages)
+            completion_tokens = min(len(tokens), max_tokens or len(tokens))
+            delay = state.latency_ms + state.random.uniform(0, state.jitter_ms)
+            time.sleep((delay + completion_tokens * state.ms_per_output_token) / 1000.0)
+
+            state.count(completions=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            self._send(200, {
+                "id": f"chatcmpl-mock-{time.monotonic_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start(state: MockState, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Run the mock server on a background thread; port 0 picks a free port
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--ms-per-output-token", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--malformed", type=float, default=0.0)
+    parser.add_argument("--indent", type=int, default=None, help="Indent JSON replies like JSON mode often does")
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def state_from(args: argparse.Namespace) -> MockState:
+    return MockState(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        ms_per_output_token=args.ms_per_output_token,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after,
+        malformed=args.malformed,
+        indent=args.indent,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = start(state_from(args), args.host, args.port)
+    print(f"Mock OpenAI on http://{args.host}:{server.server_port}/v1", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,475 @@
+"""
+Scoring throughput/latency benchmarks against a local mock OpenAI server.
+
+Each mode runs in a fresh child process with its own empty score cache
+and near-duplicate index, against the same synthetic corpus:
+
+- analyze-tweet  one `my_first_agent.py --analyze-tweet` process per tweet
+                 (the original path), on the first --per-process-limit tweets
+- chat           the chat-protocol handler in-process, with
+                 "score tweets a-b" messages sent concurrently
+- batch          one `--analyze-batch` process for the whole corpus
+- worker         the long-lived `--serve-stdio` worker, fed batched
+                 requests the way TweetScoringService does
+- worker-async   the same with `--serve-stdio --async`
+
+For every mode it records tweets/sec, p50/p99 per-tweet latency, peak
+RSS, tokens and OpenAI requests per tweet (as seen by the mock server)
+and failures, and writes them as JSON. With --baseline it compares
+against an earlier results file and exits 1 on a regression beyond
+--tolerance.
+
+    python3 run_bench.py --tweets 2000 --duplicate-rate 0.3 --latency-ms 300 --rate-429 0.02 --malformed 0.03
+    python3 run_bench.py --modes worker-async,batch --baseline results/main.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+AGENT_DIR = os.path.join(BACKEND_DIR, "src", "agent")
+AGENT = os.path.join(AGENT_DIR, "my_first_agent.py")
+
+sys.path.insert(0, BENCH_DIR)
+import corpus  # noqa: E402
+import mock_openai  # noqa: E402
+
+MODES = ("analyze-tweet", "chat", "batch", "worker", "worker-async")
+
+# Compared against the baseline: metric -> True if higher is better
+REGRESSION_METRICS = {"tweets_per_sec": True, "p99_ms": False, "tokens_per_tweet": False, "requests_per_tweet": False}
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _summary(latencies_ms: List[float], seconds: float, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    failed = sum(1 for r in results if not isinstance(r, dict) or r.get("score") is None)
+    return {
+        "tweets": len(results),
+        "seconds": round(seconds, 3),
+        "tweets_per_sec": round(len(results) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 0.5), 1),
+        "p99_ms": round(percentile(latencies_ms, 0.99), 1),
+        "failed": failed,
+    }
+
+
+def _agent_env(args: argparse.Namespace, workdir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": args.mock_url,
+        "OPENAI_API_KEY": "bench",
+        "SCORING_PROFILE": args.profile,
+        "SCORE_CACHE_PATH": os.path.join(workdir, "score_cache.sqlite3"),
+        "NEAR_DUP_INDEX_PATH": os.path.join(workdir, "near_dup_index.sqlite3"),
+        "PYTHONWARNINGS": "ignore",
+    })
+    if args.no_cache:
+        env["SCORE_CACHE_BYPASS"] = "1"
+        env["NEAR_DUP_DISABLE"] = "1"
+    if args.no_local_scorer:
+        env["LOCAL_SCORER_DISABLE"] = "1"
+    return env
+
+
+def bench_analyze_tweet(args: argparse.Namespace, tweets: List[Dict[str, Any]], env: Dict[str, str]) -> Dict[str, Any]:
+    tweets = tweets[:args.per_process_limit]
+    latencies: List[float] = []
+    results: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    for tweet in tweets:
+        t0 = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, AGENT, "--analyze-tweet", json.dumps({"content": tweet["content"]}), "--profile", args.profile],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+        )
+        latencies.append((time.perf_counter() - t0) * 1000)
+        try:
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        except (ValueError, IndexError):
+            results.append({"score": None, "error": out.stderr[-300:]})
+    summary = _summary(latencies, time.perf_counter() - started, results)
+    summary["peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    return summary
+
+
+def bench_batch(args: argparse.Namespace, tweets: List[Dict[str, Any]], env: Dict[str, str], workdir: str) -> Dict[str, Any]:
+    metrics_path = os.path.join(workdir, "metrics.json")
+    started = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, AGENT, "--analyze-batch", "-", "--profile", args.profile, "--metrics-out", metrics_path],
+        cwd=BACKEND_DIR, env=env, input=json.dumps([t["content"] for t in tweets]),
+        capture_output=True, text=True
+    )
+    seconds = time.perf_counter() - started
+    try:
+        results = json.loads(out.stdout.strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        results = None
+    if not isinstance(results, list):
+        return {"error": (out.stderr or out.stdout)[-500:]}
+
+    # Every tweet waits for the whole run
+    summary = _summary([seconds * 1000] * len(results), seconds, results)
+    summary["peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    if os.path.exists(metrics_path):
+        with open(metrics_path) as f:
+            summary["stages"] = json.load(f).get("stages", {})
+    return summary
+
+
+def bench_worker(args: argparse.Namespace, tweets: List[Dict[str, Any]], env: Dict[str, str], use_async: bool) -> Dict[str, Any]:
+    command = [sys.executable, AGENT, "--serve-stdio"] + (["--async"] if use_async else [])
+    t0 = time.perf_counter()
+    worker = subprocess.Popen(
+        command, cwd=BACKEND_DIR, env=env, text=True, bufsize=1,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    assert worker.stdin is not None and worker.stdout is not None
+
+    responses: Dict[str, Dict[str, Any]] = {}
+    done_at: Dict[str, float] = {}
+    arrived = threading.Condition()
+
+    def read():
+        for line in worker.stdout:
+            try:
+                response = json.loads(line)
+            except ValueError:
+                continue
+            with arrived:
+                responses[str(response.get("id"))] = response
+                done_at[str(response.get("id"))] = time.perf_counter()
+                arrived.notify_all()
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+
+    def call(request_id: str, payload: Dict[str, Any]) -> None:
+        worker.stdin.write(json.dumps(dict(payload, id=request_id)) + "\n")
+        worker.stdin.flush()
+
+    def wait(request_ids: List[str]) -> None:
+        with arrived:
+            arrived.wait_for(lambda: all(r in responses for r in request_ids), timeout=args.timeout)
+
+    call("ping", {"op": "ping"})
+    wait(["ping"])
+    startup_ms = (time.perf_counter() - t0) * 1000
+
+    batches = [tweets[i:i + args.batch_size] for i in range(0, len(tweets), args.batch_size)]
+    sent_at: Dict[str, float] = {}
+    started = time.perf_counter()
+    in_flight: List[str] = []
+    for n, batch in enumerate(batches):
+        # Same shape as TweetScoringService: a few batches in flight
+        while len(in_flight) >= args.in_flight:
+            with arrived:
+                arrived.wait_for(lambda: any(r in responses for r in in_flight), timeout=args.timeout)
+            in_flight = [r for r in in_flight if r not in responses]
+        request_id = str(n)
+        sent_at[request_id] = time.perf_counter()
+        call(request_id, {"tweets": [t["content"] for t in batch], "profile": args.profile})
+        in_flight.append(request_id)
+    wait([str(n) for n in range(len(batches))])
+    seconds = time.perf_counter() - started
+
+    call("metrics", {"op": "metrics"})
+    wait(["metrics"])
+    worker.stdin.close()
+    worker.wait(timeout=30)
+
+    latencies: List[float] = []
+    results: List[Dict[str, Any]] = []
+    for n, batch in enumerate(batches):
+        response = responses.get(str(n), {})
+        batch_results = response.get("results") or [{"score": None, "error": response.get("error", "no response")}] * len(batch)
+        results.extend(batch_results)
+        latency = (done_at.get(str(n), time.perf_counter()) - sent_at[str(n)]) * 1000
+        latencies.extend([latency] * len(batch))
+
+    summary = _summary(latencies, seconds, results)
+    summary["startup_ms"] = round(startup_ms, 1)
+    summary["peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    summary["stages"] = responses.get("metrics", {}).get("stages", {})
+    return summary
+
+
+def bench_chat(args: argparse.Namespace, tweets: List[Dict[str, Any]], env: Dict[str, str]) -> Dict[str, Any]:
+    os.environ.update(env)
+    sys.path.insert(0, AGENT_DIR)
+    t0 = time.perf_counter()
+    try:
+        import my_first_agent as agent_module
+    except ImportError as e:
+        return {"error": f"Chat handler unavailable: {e}"}
+    startup_ms = (time.perf_counter() - t0) * 1000
+
+    agent_module.tweet_index.clear()
+    agent_module.tweet_index.update(
+        (i + 1, {"id": i + 1, "content": t["content"], "author": t["author"]}) for i, t in enumerate(tweets)
+    )
+
+    sent_at: Dict[int, float] = {}
+    results: Dict[int, Dict[str, Any]] = {}
+    finished_at: Dict[int, float] = {}
+
+    class Logger:
+        def info(self, *a):
+            pass
+
+        warning = error = info
+
+    class BenchContext:
+        logger = Logger()
+
+        async def send(self, recipient: str, message: Any):
+            for item in getattr(message, "content", None) or []:
+                payload = json.loads(getattr(item, "text", "{}"))
+                result = payload.get("result")
+                if result and result.get("tweet_id") is not None:
+                    results[result["tweet_id"]] = result
+                    finished_at[result["tweet_id"]] = time.perf_counter()
+
+    chunk = min(args.batch_size * 5, agent_module.MAX_TWEETS_PER_COMMAND)
+
+    async def run():
+        ctx = BenchContext()
+        messages = []
+        for start in range(0, len(tweets), chunk):
+            end = min(start + chunk, len(tweets))
+            for tweet_id in range(start + 1, end + 1):
+                sent_at[tweet_id] = time.perf_counter()
+            message = agent_module.ChatMessage(
+                timestamp=datetime.now(timezone.utc),
+                msg_id=f"bench-{start}",
+                content=[agent_module.TextContent(type="text", text=f"score tweets {start + 1}-{end}")]
+            )
+            messages.append(agent_module.handle_message(ctx, "bench", message))
+        await asyncio.gather(*messages)
+        # The handler returns once the stream is started
+        while agent_module.stream_tasks:
+            await asyncio.gather(*agent_module.stream_tasks)
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    seconds = time.perf_counter() - started
+
+    ordered = [results.get(i, {"score": None}) for i in range(1, len(tweets) + 1)]
+    latencies = [(finished_at[i] - sent_at[i]) * 1000 for i in finished_at]
+    summary = _summary(latencies, seconds, ordered)
+    summary["startup_ms"] = round(startup_ms, 1)
+    summary["peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_SELF)
+    summary["stages"] = agent_module.metrics.snapshot()["stages"]
+    return summary
+
+
+def run_child(args: argparse.Namespace) -> None:
+    """
+    Run one mode and print its summary as JSON on stdout
+    """
+    with open(args.corpus_file) as f:
+        tweets = [json.loads(line) for line in f if line.strip()]
+    with tempfile.TemporaryDirectory(prefix=f"bench-{args.child}-") as workdir:
+        env = _agent_env(args, workdir)
+        if args.child == "analyze-tweet":
+            summary = bench_analyze_tweet(args, tweets, env)
+        elif args.child == "batch":
+            summary = bench_batch(args, tweets, env, workdir)
+        elif args.child in ("worker", "worker-async"):
+            summary = bench_worker(args, tweets, env, args.child == "worker-async")
+        else:
+            # The agent prints to stdout, which carries our result
+            protocol_out = sys.stdout
+            sys.stdout = sys.stderr
+            try:
+                summary = bench_chat(args, tweets, env)
+            finally:
+                sys.stdout = protocol_out
+    sys.stdout.write(json.dumps(summary) + "\n")
+    sys.stdout.flush()
+    # Skip interpreter teardown of the agent's threads and exit hooks
+    os._exit(0)
+
+
+def _mock_request(url: str, method: str = "GET") -> Dict[str, Any]:
+    req = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(req, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def run_mode(args: argparse.Namespace, mode: str, corpus_file: str) -> Dict[str, Any]:
+    base = args.mock_url.rsplit("/v1", 1)[0]
+    _mock_request(f"{base}/reset", "POST")
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--corpus-file", corpus_file] + args.child_args
+    out = subprocess.run(command, capture_output=True, text=True, timeout=args.timeout * 10)
+    try:
+        summary = json.loads(out.stdout.strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        summary = {"error": (out.stderr or out.stdout)[-500:] or f"exit code {out.returncode}"}
+    if "error" in summary:
+        return summary
+
+    stats = _mock_request(f"{base}/stats")
+    tweets = max(summary.get("tweets", 0), 1)
+    summary["openai"] = stats
+    summary["tokens_per_tweet"] = round((stats["prompt_tokens"] + stats["completion_tokens"]) / tweets, 2)
+    summary["requests_per_tweet"] = round(stats["requests"] / tweets, 4)
+    return summary
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Describe every metric that got worse than the baseline by more than
+    `tolerance` (a fraction)
+    """
+    regressions = []
+    for mode, current in results["modes"].items():
+        previous = baseline.get("modes", {}).get(mode)
+        if not previous or "error" in current or "error" in previous:
+            continue
+        for metric, higher_is_better in REGRESSION_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{mode}.{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Scoring benchmarks against a mock OpenAI server")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated, from {', '.join(MODES)}")
+    parser.add_argument("--tweets", type=int, default=1000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--near-duplicate-share", type=float, default=0.5)
+    parser.add_argument("--per-process-limit", type=int, default=20, help="tweets for the analyze-tweet mode")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--profile", default="score")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--no-local-scorer", action="store_true")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--mock-url", help="use an already running mock server instead of starting one")
+    parser.add_argument("--out", help="results file (default: results/bench-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--corpus-file", help=argparse.SUPPRESS)
+    # --latency-ms, --rate-429, --malformed, --seed, ...
+    mock_openai.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(unknown)}")
+
+    server = None
+    if not args.mock_url:
+        server = mock_openai.start(mock_openai.state_from(args))
+        args.mock_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    # Options the child processes need to rebuild the same setup
+    args.child_args = [
+        "--mock-url", args.mock_url, "--profile", args.profile,
+        "--per-process-limit", str(args.per_process_limit),
+        "--batch-size", str(args.batch_size), "--in-flight", str(args.in_flight),
+        "--timeout", str(args.timeout),
+    ] + (["--no-cache"] if args.no_cache else []) + (["--no-local-scorer"] if args.no_local_scorer else [])
+
+    tweets = corpus.generate(args.tweets, args.duplicate_rate, args.near_duplicate_share, seed=args.seed)
+    results: Dict[str, Any] = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("tweets", "duplicate_rate", "near_duplicate_share", "seed", "per_process_limit",
+                        "batch_size", "in_flight", "profile", "no_cache", "no_local_scorer",
+                        "latency_ms", "jitter_ms", "ms_per_output_token", "rate_429", "retry_after", "malformed", "indent")
+        },
+        "modes": {},
+    }
+
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+        for tweet in tweets:
+            f.write(json.dumps(tweet, ensure_ascii=False) + "\n")
+        corpus_file = f.name
+    try:
+        for mode in modes:
+            print(f"Running {mode}...", file=sys.stderr)
+            summary = run_mode(args, mode, corpus_file)
+            results["modes"][mode] = summary
+            if "error" in summary:
+                print(f"  {mode} failed: {summary['error']}", file=sys.stderr)
+            else:
+                print(
+                    f"  {summary['tweets']} tweets, {summary['tweets_per_sec']} tweets/s, "
+                    f"p50 {summary['p50_ms']} ms, p99 {summary['p99_ms']} ms, "
+                    f"{summary['peak_rss_mb']} MB, {summary['tokens_per_tweet']} tokens/tweet",
+                    file=sys.stderr
+                )
+    finally:
+        os.unlink(corpus_file)
+        if server is not None:
+            server.shutdown()
+
+    out = args.out or os.path.join(BENCH_DIR, "results", f"bench-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,540 @@
+"""
+Asyncio scoring engine for the Twitter scorer agent.
+
+Scores many tweets concurrently with the async OpenAI client. Throughput
+is bounded by a concurrency limit and by request/token-per-minute token
+buckets that back off on 429s (honouring Retry-After) and slowly recover
+afterwards, instead of a fixed sleep between tweets.
+
+This is the only place GPT is called from: the blocking scoring paths
+(CLI modes, thread-pool workers, the backlog pipeline) go through
+SyncScorer, which runs the engine on an event loop thread of its own.
+"""
+import asyncio
+import concurrent.futures
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterable, List, Optional, Tuple
+
+import openai
+
+from local_scorer import LocalScorer
+from metrics import metrics
+from near_duplicates import NearDuplicateIndex
+from score_cache import ScoreCache
+from scoring_cascade import ScoringCascade
+from tweet_prompts import (
+    DEFAULT_PROFILE,
+    MAX_TOKENS,
+    MODEL,
+    REPAIR_PROMPT,
+    add_usage,
+    batch_max_tokens,
+    build_batch_messages,
+    build_messages,
+    check_profile,
+    estimate_message_tokens,
+    failed_result,
+    parse_batch_response,
+    parse_tweet_response,
+    plan_batches,
+    public_result,
+    retry_groups,
+    truncated,
+    usage_of,
+)
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at `rate_per_minute`
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_minute / 60.0)
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """
+        Wait until `amount` tokens are available and take them
+        """
+        # Never ask for more than the bucket can ever hold
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                missing = amount - self.tokens
+                await asyncio.sleep(missing * 60.0 / self.rate_per_minute)
+
+    def adjust(self, amount: float) -> None:
+        """
+        Return (positive) or charge (negative) tokens after the fact, e.g.
+        once the real token usage of a call is known
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def block_for(self, seconds: float) -> None:
+        """
+        Hand out no tokens for the next `seconds`
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits that adapt to 429s:
+    every rate limit cuts the effective rate, every success slowly
+    restores it towards the configured quota
+    """
+
+    def __init__(self, rpm: float, tpm: float, min_fraction: float = 0.1):
+        self.max_rpm = rpm
+        self.max_tpm = tpm
+        self.min_fraction = min_fraction
+        self.fraction = 1.0
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.rate_limited = 0
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        if actual_tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def _apply_fraction(self) -> None:
+        self.requests.rate_per_minute = self.max_rpm * self.fraction
+        self.tokens.rate_per_minute = self.max_tpm * self.fraction
+
+    def on_success(self) -> None:
+        if self.fraction < 1.0:
+            self.fraction = min(1.0, self.fraction + 0.02)
+            self._apply_fraction()
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> None:
+        self.rate_limited += 1
+        self.fraction = max(self.min_fraction, self.fraction * 0.5)
+        self._apply_fraction()
+        if retry_after:
+            self.requests.block_for(retry_after)
+            self.tokens.block_for(retry_after)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Read the Retry-After header (seconds) from an OpenAI API error
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for name in ("retry-after-ms", "retry-after"):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            continue
+        return seconds / 1000.0 if name == "retry-after-ms" else seconds
+    return None
+
+
+class AsyncScoringEngine:
+    """
+    Concurrent tweet scorer built on openai.AsyncOpenAI
+    """
+
+    def __init__(
+        self,
+        client: Optional[Any] = None,
+        model: str = MODEL,
+        concurrency: int = int(os.getenv("SCORING_CONCURRENCY", "8")),
+        rpm: float = float(os.getenv("OPENAI_RPM", "3500")),
+        tpm: float = float(os.getenv("OPENAI_TPM", "90000")),
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        cascade: Optional[ScoringCascade] = None,
+    ):
+        # Retries are handled here so the limiter sees every 429
+        self.client = client or openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.limiter = RateLimiter(rpm, tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self.cascade = cascade
+
+    async def _complete(self, messages: List[Dict[str, str]], max_tokens: int) -> Tuple[str, Dict[str, int], bool]:
+        """
+        Run one JSON-mode chat completion under the concurrency and rate
+        limits, retrying transient failures with jittered exponential
+        backoff. Returns the text, the token usage and whether the reply
+        was cut off at max_tokens.
+        """
+        estimated = estimate_message_tokens(messages) + max_tokens
+        attempt = 0
+        while True:
+            with metrics.time("rate_limit_wait"):
+                await self.limiter.acquire(estimated)
+            try:
+                async with self.semaphore:
+                    with metrics.time("openai_call"):
+                        response = await self.client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            temperature=0.3,
+                            max_tokens=max_tokens,
+                            response_format={"type": "json_object"}
+                        )
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                retry_after = _retry_after(e)
+                if isinstance(e, openai.RateLimitError):
+                    self.limiter.on_rate_limited(retry_after)
+                    metrics.inc("rate_limited_total")
+                if attempt > self.max_retries:
+                    raise
+                self.retries += 1
+                metrics.inc("retries_total")
+                # Full jitter keeps concurrent retries from re-colliding
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                await asyncio.sleep(max(delay, retry_after or 0))
+                continue
+
+            usage = usage_of(response)
+            metrics.inc("openai_requests_total")
+            metrics.add_usage(usage)
+            self.limiter.record_usage(estimated, usage["total_tokens"] or None)
+            self.limiter.on_success()
+            if truncated(response):
+                metrics.inc("truncated_replies_total")
+            return response.choices[0].message.content.strip(), usage, truncated(response)
+
+    async def score(self, content: str, profile: str = DEFAULT_PROFILE) -> Dict[str, Any]:
+        """
+        Score a single tweet, reusing a known score when there is one
+        """
+        return (await self.score_many([content], batched=False, profile=profile))[0]
+
+    async def _score_one(self, content: str, profile: str) -> Dict[str, Any]:
+        try:
+            with metrics.time("prompt_build"):
+                messages = build_messages(content, profile)
+            started = time.perf_counter()
+            response_text, usage, cut_off = await self._complete(messages, MAX_TOKENS[profile])
+            with metrics.time("json_parse"):
+                result = parse_tweet_response(response_text, profile)
+
+            if result is None:
+                # One cheap repair round instead of throwing away the paid
+                # call, with more room if the reply was cut off
+                metrics.inc("parse_failures_total")
+                with metrics.time("fallback"):
+                    repair = messages + [
+                        {"role": "assistant", "content": response_text},
+                        {"role": "user", "content": REPAIR_PROMPT}
+                    ]
+                    max_tokens = MAX_TOKENS[profile] * (2 if cut_off else 1)
+                    response_text, repair_usage, _ = await self._complete(repair, max_tokens)
+                    usage = add_usage(usage, repair_usage)
+                    result = parse_tweet_response(response_text, profile)
+                if result is None:
+                    metrics.inc("parse_failures_total")
+
+            usage["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            if result is None:
+                return dict(failed_result("Could not parse GPT response", response_text), usage=usage)
+            return dict(result, gpt_response=response_text, usage=usage)
+        except Exception as e:
+            print(f"Error in GPT analysis: {e}", file=sys.stderr)
+            return failed_result(f"GPT analysis failed: {str(e)}")
+
+    async def score_batch(self, tweets: List[str], profile: str = DEFAULT_PROFILE) -> List[Dict[str, Any]]:
+        """
+        Score several tweets in one completion, splitting and retrying
+        only the items that fail validation or are missing from a reply
+        cut off at max_tokens. If the call itself fails after _complete's
+        retries, the whole batch fails: splitting it would only multiply
+        the calls against the quota that failed.
+        """
+        if len(tweets) == 1:
+            return [await self._score_one(tweets[0], profile)]
+
+        try:
+            with metrics.time("prompt_build"):
+                messages = build_batch_messages(tweets, profile)
+            started = time.perf_counter()
+            response_text, usage, _ = await self._complete(messages, batch_max_tokens(len(tweets), profile))
+        except Exception as e:
+            print(f"Error in batched GPT analysis: {e}", file=sys.stderr)
+            return [failed_result(f"GPT analysis failed: {str(e)}") for _ in tweets]
+
+        usage = dict(
+            usage,
+            batch_size=len(tweets),
+            latency_ms=round((time.perf_counter() - started) * 1000, 1)
+        )
+        with metrics.time("json_parse"):
+            # A truncated reply keeps its complete entries
+            parsed = parse_batch_response(response_text, len(tweets), profile)
+        metrics.inc("parse_failures_total", parsed.count(None))
+
+        results: List[Any] = [
+            dict(item, gpt_response=response_text, usage=usage) if item else None
+            for item in parsed
+        ]
+
+        groups = retry_groups(results)
+        metrics.inc("batch_item_retries_total", sum(map(len, groups)))
+        retried = await asyncio.gather(
+            *(self.score_batch([tweets[i] for i in group], profile) for group in groups)
+        )
+        for group, group_results in zip(groups, retried):
+            for i, item in zip(group, group_results):
+                results[i] = item
+        return results
+
+    async def stream(
+        self,
+        tweets: Iterable[str],
+        batched: bool = True,
+        profile: str = DEFAULT_PROFILE,
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Yield (index, result) pairs as soon as each tweet is scored.
+        At most a few batches per concurrency slot are in flight, so very
+        long inputs don't pile up pending tasks.
+        """
+        tweets = list(tweets)
+        if batched:
+            groups = plan_batches(tweets, profile=profile)
+        else:
+            groups = [[i] for i in range(len(tweets))]
+
+        async def run(group: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+            if len(group) == 1:
+                results = [await self._score_one(tweets[group[0]], profile)]
+            else:
+                results = await self.score_batch([tweets[i] for i in group], profile)
+            return list(zip(group, results))
+
+        window = self.concurrency * 2
+        pending = set()
+        next_group = 0
+        while next_group < len(groups) or pending:
+            while next_group < len(groups) and len(pending) < window:
+                pending.add(asyncio.ensure_future(run(groups[next_group])))
+                next_group += 1
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for item in task.result():
+                    yield item
+
+    async def stream_scored(
+        self,
+        tweets: List[str],
+        batched: bool = True,
+        profile: str = DEFAULT_PROFILE,
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Yield (index, result) pairs through the cascade: known scores
+        right away, then each GPT result as soon as its batch is done
+        """
+        if self.cascade is None:
+            async for item in self.stream(tweets, batched=batched, profile=profile):
+                yield item
+            return
+
+        results, pending = self.cascade.resolve(tweets, profile)
+        for i, result in enumerate(results):
+            if result is not None:
+                yield i, result
+        scored: List[Any] = [None] * len(pending)
+        async for j, result in self.stream([item.text for item in pending], batched=batched, profile=profile):
+            scored[j] = result
+            for i in pending[j].indexes:
+                yield i, result
+        self.cascade.complete(results, pending, scored)
+
+    async def score_many(
+        self,
+        tweets: List[str],
+        batched: bool = True,
+        profile: str = DEFAULT_PROFILE,
+    ) -> List[Dict[str, Any]]:
+        """
+        Score a list of tweets concurrently; results keep the input order
+        """
+        results: List[Any] = [None] * len(tweets)
+        async for i, result in self.stream_scored(tweets, batched=batched, profile=profile):
+            results[i] = result
+        return results
+
+
+async def serve_request(engine: AsyncScoringEngine, request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Answer one worker request: {"content": ...} (or {"tweet": {"content":
+    ...}}) for a single tweet, {"tweets": [...]} for a batch
+    """
+    if request.get("op") == "ping":
+        return {"ok": True, "pid": os.getpid()}
+    if request.get("op") == "metrics":
+        return metrics.snapshot()
+
+    profile = check_profile(request.get("profile") or DEFAULT_PROFILE)
+
+    if isinstance(request.get("tweets"), list):
+        contents = [
+            t.get("content") if isinstance(t, dict) else t
+            for t in request["tweets"]
+        ]
+        if not all(isinstance(c, str) for c in contents):
+            raise ValueError("Every item in 'tweets' needs a 'content' string")
+        results = await engine.score_many(contents, profile=profile)
+        return {"results": [public_result(r, profile) for r in results]}
+
+    content = request.get("content")
+    if content is None and isinstance(request.get("tweet"), dict):
+        content = request["tweet"].get("content")
+    if not isinstance(content, str):
+        raise ValueError("Request needs a 'content' string")
+    return public_result(await engine.score(content, profile), profile)
+
+
+class SyncScorer:
+    """
+    Blocking front end for an AsyncScoringEngine. The engine runs on one
+    event loop thread, so every caller shares its client, concurrency
+    limit and rate limits.
+    """
+
+    def __init__(self, engine: AsyncScoringEngine):
+        self.engine = engine
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def submit(self, coroutine: Awaitable[Any]) -> "concurrent.futures.Future[Any]":
+        """
+        Schedule a coroutine on the engine's loop, starting the loop
+        thread on first use
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="scoring-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def run(self, coroutine: Awaitable[Any]) -> Any:
+        return self.submit(coroutine).result()
+
+    def score(self, content: str, profile: str = DEFAULT_PROFILE) -> Dict[str, Any]:
+        return self.run(self.engine.score(content, profile))
+
+    def score_many(self, tweets: List[str], profile: str = DEFAULT_PROFILE) -> List[Dict[str, Any]]:
+        return self.run(self.engine.score_many(tweets, profile=profile))
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return self.run(serve_request(self.engine, request))
+
+    async def stream(self, tweets: List[str], profile: str = DEFAULT_PROFILE) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        The engine's stream_scored(), for a caller on another event loop
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        async def produce():
+            try:
+                async for item in self.engine.stream_scored(tweets, profile=profile):
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        future = asyncio.wrap_future(self.submit(produce()))
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            yield item
+        # Raises whatever stopped the stream early
+        await future
+
+
+async def serve_stdio_async(engine: Optional[AsyncScoringEngine] = None) -> None:
+    """
+    Async variant of the JSON-lines stdio worker: every request runs as
+    its own task, bounded only by the engine's limits
+    """
+    engine = engine or AsyncScoringEngine(
+        cascade=ScoringCascade(ScoreCache(), NearDuplicateIndex(preload=True), LocalScorer())
+    )
+    loop = asyncio.get_running_loop()
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+    tasks = set()
+
+    async def process(line: str):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+            request_id = request.get("id")
+            response = await serve_request(engine, request)
+        except Exception as e:
+            response = {"error": str(e)}
+        response["id"] = request_id
+        protocol_out.write(json.dumps(response) + "\n")
+        protocol_out.flush()
+
+    try:
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.ensure_future(process(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        sys.stdout = protocol_out
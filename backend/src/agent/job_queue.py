@@ -0,0 +1,495 @@
+"""
+Durable priority job queue for scoring work.
+
+Jobs live in a local SQLite database in WAL mode, so any number of worker
+processes on the machine can share one queue without a coordination
+service: leasing is a single write transaction, and SQLite's write lock
+makes sure every job is handed to one worker at a time.
+
+- priority: fresh tweets go ahead of backfill, plus a per-campaign boost
+  (JOB_CAMPAIGN_PRIORITIES="campaign_a:50,campaign_b:10")
+- leases: a leased job becomes visible again once its visibility timeout
+  runs out without being completed or extended (e.g. the worker crashed)
+- dead letters: jobs that failed JOB_MAX_ATTEMPTS times are parked with
+  their last error instead of being retried forever
+- backpressure: QueueWorker sizes its leases from the rate limiter, and
+  leases nothing while the API is telling us to back off
+
+    python3 job_queue.py enqueue [--backfill] [--campaign c] [--rescore] < tweets.jsonl
+    python3 job_queue.py stats
+    python3 job_queue.py requeue-dead
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from metrics import metrics
+from tweet_prompts import BATCH_MAX_SIZE, public_result
+
+DEFAULT_QUEUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_queue.sqlite3")
+
+FRESH_PRIORITY = 100
+BACKFILL_PRIORITY = 0
+
+# Queue jobs feed a score column, so by default they ask for nothing more
+JOB_PROFILE = os.getenv("JOB_PROFILE", "score")
+
+
+def _campaign_priorities(spec: str) -> Dict[str, int]:
+    priorities = {}
+    for item in spec.split(","):
+        name, _, boost = item.strip().rpartition(":")
+        if name and boost.lstrip("-").isdigit():
+            priorities[name] = int(boost)
+    return priorities
+
+
+CAMPAIGN_PRIORITIES = _campaign_priorities(os.getenv("JOB_CAMPAIGN_PRIORITIES", ""))
+
+
+def priority_for(fresh: bool = True, campaign: Optional[str] = None) -> int:
+    """
+    Queue priority of a tweet; higher runs first
+    """
+    base = FRESH_PRIORITY if fresh else BACKFILL_PRIORITY
+    return base + CAMPAIGN_PRIORITIES.get(campaign or "", 0)
+
+
+class Job(NamedTuple):
+    id: int
+    tweet_id: Optional[str]
+    content: str
+    campaign: Optional[str]
+    profile: str
+    priority: int
+    attempts: int
+
+
+_JOB_COLUMNS = "id, tweet_id, content, campaign, profile, priority, attempts"
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue; one instance per process
+    """
+
+    def __init__(
+        self,
+        path: str = os.getenv("JOB_QUEUE_PATH", DEFAULT_QUEUE_PATH),
+        max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", "5")),
+        visibility_timeout: float = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "120")),
+        retry_delay: float = 5.0,
+        retry_delay_max: float = 300.0,
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.visibility_timeout = visibility_timeout
+        self.retry_delay = retry_delay
+        self.retry_delay_max = retry_delay_max
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Autocommit mode: transactions are opened explicitly with
+            # BEGIN IMMEDIATE, which takes the write lock up front
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    tweet_id TEXT UNIQUE,
+                    content TEXT NOT NULL,
+                    campaign TEXT,
+                    profile TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    leased_by TEXT,
+                    lease_expires_at REAL,
+                    last_error TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_leases ON jobs (status, lease_expires_at)")
+            self._conn = conn
+        return self._conn
+
+    def _write(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """
+        Run `fn` inside one write transaction
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def enqueue(
+        self,
+        tweets: Iterable[Dict[str, Any]],
+        fresh: bool = True,
+        campaign: Optional[str] = None,
+        profile: str = JOB_PROFILE,
+        rescore: bool = False,
+    ) -> int:
+        """
+        Add tweets ({"content", optional "tweet_id", "campaign", "fresh"})
+        to the queue. A tweet that is already queued keeps one job, at
+        the higher of the two priorities. Tweets whose job is done or
+        dead are skipped unless `rescore` is set (e.g. after a prompt
+        change), which queues them again with fresh attempts; leased
+        jobs are always left alone. Returns the number of rows written.
+        """
+        now = time.time()
+        rows = []
+        for tweet in tweets:
+            tweet_campaign = tweet.get("campaign", campaign)
+            tweet_id = tweet.get("tweet_id", tweet.get("id"))
+            rows.append((
+                None if tweet_id is None else str(tweet_id),
+                tweet["content"],
+                tweet_campaign,
+                tweet.get("profile", profile),
+                priority_for(tweet.get("fresh", fresh), tweet_campaign),
+                now, now, now,
+            ))
+        if not rows:
+            return 0
+
+        if rescore:
+            on_conflict = """DO UPDATE SET
+                content = excluded.content, campaign = excluded.campaign, profile = excluded.profile,
+                priority = CASE WHEN status = 'queued' THEN max(priority, excluded.priority) ELSE excluded.priority END,
+                status = 'queued', attempts = 0, available_at = excluded.available_at,
+                last_error = NULL, result = NULL, updated_at = excluded.updated_at
+            WHERE status != 'leased'"""
+        else:
+            on_conflict = """DO UPDATE SET
+                priority = max(priority, excluded.priority),
+                updated_at = excluded.updated_at
+            WHERE status = 'queued'"""
+
+        def insert(conn: sqlite3.Connection) -> int:
+            before = conn.total_changes
+            conn.executemany(
+                f"""INSERT INTO jobs (tweet_id, content, campaign, profile, priority, available_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (tweet_id) {on_conflict}""",
+                rows
+            )
+            return conn.total_changes - before
+
+        written = self._write(insert)
+        metrics.inc("jobs_enqueued_total", written)
+        return written
+
+    def lease(self, worker_id: str, limit: int, visibility_timeout: Optional[float] = None) -> List[Job]:
+        """
+        Lease up to `limit` of the highest-priority ready jobs. Expired
+        leases are returned to the queue first, or dead-lettered when
+        they have used up their attempts.
+        """
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+
+        def take(conn: sqlite3.Connection) -> List[Job]:
+            now = time.time()
+            expired = conn.execute(
+                """UPDATE jobs SET
+                    status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'queued' END,
+                    last_error = coalesce(last_error, 'lease expired'),
+                    leased_by = NULL, lease_expires_at = NULL, updated_at = ?
+                WHERE status = 'leased' AND lease_expires_at <= ?""",
+                (self.max_attempts, now, now)
+            ).rowcount
+            metrics.inc("job_leases_expired_total", expired)
+
+            rows = conn.execute(
+                f"""UPDATE jobs SET
+                    status = 'leased', leased_by = ?, lease_expires_at = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE id IN (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' AND available_at <= ?
+                    ORDER BY priority DESC, id
+                    LIMIT ?
+                )
+                RETURNING {_JOB_COLUMNS}""",
+                (worker_id, now + timeout, now, now, max(0, limit))
+            ).fetchall()
+            return sorted((Job(*row) for row in rows), key=lambda job: (-job.priority, job.id))
+
+        if limit <= 0:
+            return []
+        with metrics.time("queue_lease"):
+            return self._write(take)
+
+    def extend(self, worker_id: str, job_ids: List[int], visibility_timeout: Optional[float] = None) -> None:
+        """
+        Push back the lease expiry of jobs that are still being worked on
+        """
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        if not job_ids:
+            return
+
+        def touch(conn: sqlite3.Connection) -> None:
+            now = time.time()
+            conn.executemany(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND leased_by = ? AND status = 'leased'",
+                [(now + timeout, now, job_id, worker_id) for job_id in job_ids]
+            )
+
+        self._write(touch)
+
+    def complete(self, worker_id: str, results: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """
+        Mark leased jobs done and keep their results
+        """
+        if not results:
+            return
+
+        def finish(conn: sqlite3.Connection) -> None:
+            now = time.time()
+            conn.executemany(
+                """UPDATE jobs SET status = 'done', result = ?, last_error = NULL,
+                    leased_by = NULL, lease_expires_at = NULL, updated_at = ?
+                WHERE id = ? AND leased_by = ? AND status = 'leased'""",
+                [(json.dumps(result), now, job_id, worker_id) for job_id, result in results]
+            )
+
+        self._write(finish)
+        metrics.inc("jobs_completed_total", len(results))
+
+    def fail(self, worker_id: str, failures: List[Tuple[Job, str]]) -> None:
+        """
+        Put failed jobs back with exponential backoff, or dead-letter them
+        once they have used up their attempts
+        """
+        if not failures:
+            return
+
+        def release(conn: sqlite3.Connection) -> int:
+            now = time.time()
+            rows = []
+            dead = 0
+            for job, error in failures:
+                if job.attempts >= self.max_attempts:
+                    dead += 1
+                    status, available_at = "dead", now
+                else:
+                    delay = min(self.retry_delay_max, self.retry_delay * 2 ** (job.attempts - 1))
+                    status, available_at = "queued", now + random.uniform(delay / 2, delay)
+                rows.append((status, available_at, error, now, job.id, worker_id))
+            conn.executemany(
+                """UPDATE jobs SET status = ?, available_at = ?, last_error = ?,
+                    leased_by = NULL, lease_expires_at = NULL, updated_at = ?
+                WHERE id = ? AND leased_by = ? AND status = 'leased'""",
+                rows
+            )
+            return dead
+
+        dead = self._write(release)
+        metrics.inc("jobs_failed_total", len(failures) - dead)
+        metrics.inc("jobs_dead_lettered_total", dead)
+
+    def requeue_dead(self) -> int:
+        """
+        Give every dead-lettered job a fresh set of attempts
+        """
+        def requeue(conn: sqlite3.Connection) -> int:
+            now = time.time()
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? WHERE status = 'dead'",
+                (now, now)
+            ).rowcount
+
+        return self._write(requeue)
+
+    def purge_done(self, older_than_seconds: float = 7 * 86400) -> int:
+        def purge(conn: sqlite3.Connection) -> int:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND updated_at < ?",
+                (time.time() - older_than_seconds,)
+            ).rowcount
+
+        return self._write(purge)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._connect()
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            (oldest,) = conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()
+        return {
+            "queued": counts.get("queued", 0),
+            "leased": counts.get("leased", 0),
+            "done": counts.get("done", 0),
+            "dead": counts.get("dead", 0),
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+ResultSink = Callable[[List[Tuple[Job, Dict[str, Any]]]], None]
+
+
+class QueueWorker:
+    """
+    Leases jobs and scores them with an AsyncScoringEngine. Run one per
+    process; add processes to add throughput.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        engine: Any,
+        worker_id: Optional[str] = None,
+        lease_size: int = int(os.getenv("JOB_LEASE_SIZE", str(BATCH_MAX_SIZE))),
+        idle_sleep: float = 1.0,
+        on_results: Optional[ResultSink] = None,
+    ):
+        self.queue = queue
+        self.engine = engine
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_size = max(1, lease_size)
+        self.idle_sleep = idle_sleep
+        self.on_results = on_results
+        self._in_flight: Dict[int, Job] = {}
+
+    def _next_lease_size(self) -> int:
+        """
+        Lease less while the limiter is running below its quota after
+        429s, so jobs don't sit leased behind a throttled API
+        """
+        return max(1, int(self.lease_size * self.engine.limiter.fraction))
+
+    async def _process(self, jobs: List[Job]) -> None:
+        by_profile: Dict[str, List[Job]] = {}
+        for job in jobs:
+            by_profile.setdefault(job.profile, []).append(job)
+
+        done: List[Tuple[Job, Dict[str, Any]]] = []
+        failed: List[Tuple[Job, str]] = []
+        for profile, group in by_profile.items():
+            try:
+                results = await self.engine.score_many([job.content for job in group], profile=profile)
+            except Exception as e:
+                failed.extend((job, f"Scoring failed: {e}") for job in group)
+                continue
+            for job, result in zip(group, results):
+                if result.get("error") or result.get("score") is None:
+                    failed.append((job, result.get("error") or "No score"))
+                else:
+                    done.append((job, public_result(result, profile)))
+
+        # The sink and the queue do blocking I/O (HTTP writes, SQLite
+        # transactions), so run them off the event loop
+        if done and self.on_results is not None:
+            try:
+                await asyncio.to_thread(self.on_results, done)
+            except Exception as e:
+                # Not written anywhere yet, so let the jobs run again
+                print(f"Error writing job results: {e}", file=sys.stderr)
+                failed.extend((job, f"Result write failed: {e}") for job, _ in done)
+                done = []
+
+        await asyncio.to_thread(self.queue.complete, self.worker_id, [(job.id, result) for job, result in done])
+        await asyncio.to_thread(self.queue.fail, self.worker_id, failed)
+        for job in jobs:
+            self._in_flight.pop(job.id, None)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout / 3)
+            if not self._in_flight:
+                continue
+            try:
+                await asyncio.to_thread(self.queue.extend, self.worker_id, list(self._in_flight))
+            except Exception as e:
+                # Keep beating: a lost extend only risks one lease expiring,
+                # a dead heartbeat would let every later one expire
+                print(f"Error extending job leases: {e}", file=sys.stderr)
+                metrics.inc("job_heartbeat_errors_total")
+
+    async def run(self, drain: bool = False) -> None:
+        """
+        Lease and score jobs until stopped, or with `drain` until the
+        queue has nothing ready
+        """
+        limiter = self.engine.limiter
+        max_in_flight = self.engine.concurrency
+        tasks = set()
+        heartbeat = asyncio.ensure_future(self._heartbeat())
+        try:
+            while True:
+                # Backpressure: lease nothing while the API asked us to wait
+                # or enough work is already in flight
+                blocked = limiter.requests.blocked_until - time.monotonic()
+                if blocked > 0:
+                    await asyncio.sleep(blocked)
+                    continue
+                if len(tasks) >= max_in_flight:
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                jobs = await asyncio.to_thread(self.queue.lease, self.worker_id, self._next_lease_size())
+                if not jobs:
+                    if tasks:
+                        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                        continue
+                    if drain:
+                        break
+                    await asyncio.sleep(self.idle_sleep)
+                    continue
+
+                self._in_flight.update((job.id, job) for job in jobs)
+                task = asyncio.ensure_future(self._process(jobs))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            heartbeat.cancel()
+
+
+if __name__ == "__main__":
+    queue = JobQueue()
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "enqueue":
+        campaign = None
+        if "--campaign" in sys.argv:
+            campaign = sys.argv[sys.argv.index("--campaign") + 1]
+        tweets = [json.loads(line) for line in sys.stdin if line.strip()]
+        rescore = "--rescore" in sys.argv
+        count = queue.enqueue(tweets, fresh="--backfill" not in sys.argv, campaign=campaign, rescore=rescore)
+        print(f"Enqueued {count} jobs")
+        if count < len(tweets):
+            hint = "" if rescore else "; pass --rescore to score done and dead ones again"
+            print(f"Skipped {len(tweets) - count} tweets whose job is already leased, done or dead{hint}")
+    elif command == "stats":
+        print(json.dumps(queue.stats()))
+    elif command == "requeue-dead":
+        print(f"Requeued {queue.requeue_dead()} dead jobs")
+    else:
+        print("Usage: python3 job_queue.py enqueue [--backfill] [--campaign c] [--rescore] < tweets.jsonl | stats | requeue-dead")
@@ -0,0 +1,627 @@
+"""
+Incremental leaderboard rollups over scored tweets.
+
+Per author (overall and per campaign) and per campaign, keeps:
+
+- count and sum of scores
+- a time-decayed score: sum of score * 2^(-age / half-life)
+- a rolling window (last LEADERBOARD_WINDOW_DAYS UTC days, 7 by default)
+  sum and count, from one bucket per day
+
+Everything lives in growable NumPy arrays indexed by name, so updates are
+O(1) per score and top-K / rank-of-user queries are single vectorized
+passes. The decayed score is stored relative to a movable reference
+time, which keeps ranking free of any per-query rescaling. State is
+checkpointed to one .npz file (written atomically) together with the id
+of the last tweet applied.
+
+Only one process owns the checkpoint at a time (a lock file next to
+it); others can read it but not write it. catch_up_from_db() brings it
+in line with the database: it applies rows scored above last_tweet_id
+(e.g. after a crash between a database write and the next checkpoint),
+then compares the number of scored rows with the number applied. Rows
+scored below last_tweet_id in the meantime (by parallel workers, the
+Node service, the queue worker, or retried after a failure) show up as
+a difference, and the leaderboard is rebuilt. A rescore that changes
+existing scores keeps the count, so rebuild after one.
+
+After a scoring-formula change, rebuild() recomputes everything from the
+raw (author, campaign, score, time) columns with bincount passes:
+
+    python3 leaderboard.py rebuild         # from collected_tweets via PostgREST
+    python3 leaderboard.py catch-up        # rows scored since, rebuilding on a gap
+    python3 leaderboard.py top [k] [--metric decayed] [--campaign c]
+    python3 leaderboard.py rank <author> [--metric decayed] [--campaign c]
+
+`my_first_agent.py --score-backlog --leaderboard` feeds it as the
+pipeline writes scores and catches up on startup and after every pass.
+"""
+import math
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "leaderboard.npz")
+
+DAY = 86400.0
+METRICS = ("count", "sum", "decayed", "window", "window_count")
+
+# Re-anchor the decay reference once stored values grow by e^REBASE_AT
+_REBASE_AT = 30.0
+
+
+class Rollups:
+    """
+    Array-backed rollups for one leaderboard (e.g. all authors)
+    """
+
+    def __init__(
+        self,
+        half_life_days: float = float(os.getenv("LEADERBOARD_HALF_LIFE_DAYS", "7")),
+        window_days: int = int(os.getenv("LEADERBOARD_WINDOW_DAYS", "7")),
+        capacity: int = 1024,
+    ):
+        self.tau = half_life_days * DAY / math.log(2)
+        self.window_days = window_days
+        # One extra slot so a new day never lands on a live bucket
+        self.slots = window_days + 1
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.total = np.zeros(capacity, dtype=np.float64)
+        self.decayed = np.zeros(capacity, dtype=np.float64)
+        self.window = np.zeros(capacity, dtype=np.float64)
+        self.window_count = np.zeros(capacity, dtype=np.int64)
+        self.day_sums = np.zeros((capacity, self.slots), dtype=np.float64)
+        self.day_counts = np.zeros((capacity, self.slots), dtype=np.int64)
+        self.slot_days = np.full((capacity, self.slots), -1, dtype=np.int64)
+        # decayed holds values as of `epoch`; current_day is the newest
+        # day the window has been rolled forward to
+        self.epoch = 0.0
+        self.current_day = -1
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    _ARRAYS = ("count", "total", "decayed", "window", "window_count", "day_sums", "day_counts", "slot_days")
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.count)
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity)
+        for name in self._ARRAYS:
+            old = getattr(self, name)
+            fill = -1 if name == "slot_days" else 0
+            grown = np.full((capacity,) + old.shape[1:], fill, dtype=old.dtype)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+
+    def _ids(self, names: Iterable[str]) -> np.ndarray:
+        index = self.index
+        ids = []
+        for name in names:
+            i = index.get(name)
+            if i is None:
+                i = index[name] = len(self.names)
+                self.names.append(name)
+            ids.append(i)
+        self._grow(len(self.names))
+        return np.array(ids, dtype=np.int64)
+
+    def _rebase(self, timestamp: float) -> None:
+        """
+        Move the decay reference time forward so stored values stay small
+        """
+        if self.epoch == 0.0:
+            self.epoch = timestamp
+        elif (timestamp - self.epoch) / self.tau > _REBASE_AT:
+            n = len(self.names)
+            self.decayed[:n] *= math.exp((self.epoch - timestamp) / self.tau)
+            self.epoch = timestamp
+
+    def advance(self, day: int) -> None:
+        """
+        Roll the window forward to `day`, dropping buckets that fell out
+        """
+        if day <= self.current_day:
+            return
+        self.current_day = day
+        n = len(self.names)
+        expired = (self.slot_days[:n] >= 0) & (self.slot_days[:n] <= day - self.window_days)
+        if expired.any():
+            self.window[:n] -= np.where(expired, self.day_sums[:n], 0).sum(axis=1)
+            self.window_count[:n] -= np.where(expired, self.day_counts[:n], 0).sum(axis=1)
+            self.day_sums[:n][expired] = 0
+            self.day_counts[:n][expired] = 0
+            self.slot_days[:n][expired] = -1
+
+    def add_many(self, names: List[str], scores: np.ndarray, timestamps: np.ndarray) -> None:
+        """
+        Apply newly scored tweets
+        """
+        if not len(names):
+            return
+        ids = self._ids(names)
+        scores = np.asarray(scores, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+
+        np.add.at(self.count, ids, 1)
+        np.add.at(self.total, ids, scores)
+        self._rebase(float(timestamps.max()))
+        np.add.at(self.decayed, ids, scores * np.exp((timestamps - self.epoch) / self.tau))
+
+        days = (timestamps // DAY).astype(np.int64)
+        self.advance(int(days.max()))
+        live = days > self.current_day - self.window_days
+        if live.any():
+            ids, days, scores = ids[live], days[live], scores[live]
+            slots = days % self.slots
+            self.slot_days[ids, slots] = days
+            np.add.at(self.day_sums, (ids, slots), scores)
+            np.add.at(self.day_counts, (ids, slots), 1)
+            np.add.at(self.window, ids, scores)
+            np.add.at(self.window_count, ids, 1)
+
+    def values(self, metric: str, now: Optional[float] = None) -> np.ndarray:
+        """
+        Current value of a metric for every name, in index order. The
+        decayed score is only scaled to `now` when it is given, as the
+        scaling doesn't change the ordering.
+        """
+        n = len(self.names)
+        if metric == "count":
+            return self.count[:n]
+        if metric == "sum":
+            return self.total[:n]
+        if metric == "decayed":
+            if now is None:
+                return self.decayed[:n]
+            return self.decayed[:n] * math.exp((self.epoch - now) / self.tau)
+        if metric in ("window", "window_count"):
+            self.advance(int((now if now is not None else time.time()) // DAY))
+            return self.window[:n] if metric == "window" else self.window_count[:n]
+        raise ValueError(f"Unknown metric '{metric}', expected one of {', '.join(METRICS)}")
+
+    def top_k(self, k: int, metric: str = "decayed", now: Optional[float] = None) -> List[Tuple[str, float]]:
+        values = self.values(metric, now)
+        k = min(k, len(values))
+        if k <= 0:
+            return []
+        ids = np.argpartition(values, len(values) - k)[-k:] if k < len(values) else np.arange(len(values))
+        ids = ids[np.argsort(-values[ids], kind="stable")]
+        scale = 1.0
+        if metric == "decayed" and now is None:
+            scale = math.exp((self.epoch - time.time()) / self.tau)
+        return [(self.names[i], float(values[i]) * scale) for i in ids.tolist()]
+
+    def rank(self, name: str, metric: str = "decayed", now: Optional[float] = None) -> Optional[int]:
+        """
+        1-based rank of `name` (ties share the better rank), or None
+        """
+        i = self.index.get(name)
+        if i is None:
+            return None
+        values = self.values(metric, now)
+        return int(np.count_nonzero(values > values[i])) + 1
+
+    def get(self, name: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        i = self.index.get(name)
+        if i is None:
+            return None
+        now = time.time() if now is None else now
+        self.advance(int(now // DAY))
+        return {
+            "count": int(self.count[i]),
+            "sum": float(self.total[i]),
+            "decayed": float(self.decayed[i] * math.exp((self.epoch - now) / self.tau)),
+            "window": float(self.window[i]),
+            "window_count": int(self.window_count[i]),
+        }
+
+    @classmethod
+    def build(
+        cls,
+        names: np.ndarray,
+        scores: np.ndarray,
+        timestamps: np.ndarray,
+        now: Optional[float] = None,
+        **kwargs: Any,
+    ) -> "Rollups":
+        """
+        Compute rollups from scratch with vectorized passes
+        """
+        rollups = cls(capacity=1, **kwargs)
+        if not len(names):
+            return rollups
+        unique, inverse = np.unique(np.asarray(names, dtype=str), return_inverse=True)
+        scores = np.asarray(scores, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        n = len(unique)
+
+        rollups.names = unique.tolist()
+        rollups.index = {name: i for i, name in enumerate(rollups.names)}
+        rollups._grow(n)
+        rollups.epoch = float(timestamps.max())
+        rollups.count[:n] = np.bincount(inverse, minlength=n)
+        rollups.total[:n] = np.bincount(inverse, weights=scores, minlength=n)
+        rollups.decayed[:n] = np.bincount(
+            inverse, weights=scores * np.exp((timestamps - rollups.epoch) / rollups.tau), minlength=n
+        )
+
+        days = (timestamps // DAY).astype(np.int64)
+        rollups.current_day = int(days.max()) if now is None else int(now // DAY)
+        live = (days > rollups.current_day - rollups.window_days) & (days <= rollups.current_day)
+        slots = days[live] % rollups.slots
+        cells = inverse[live] * rollups.slots + slots
+        size = n * rollups.slots
+        day_sums = np.bincount(cells, weights=scores[live], minlength=size).reshape(n, rollups.slots)
+        day_counts = np.bincount(cells, minlength=size).reshape(n, rollups.slots)
+        rollups.day_sums[:n] = day_sums
+        rollups.day_counts[:n] = day_counts
+        slot_days = rollups.current_day - (rollups.current_day - np.arange(rollups.slots)) % rollups.slots
+        rollups.slot_days[:n] = np.where(day_counts > 0, slot_days[None, :], -1)
+        rollups.window[:n] = day_sums.sum(axis=1)
+        rollups.window_count[:n] = day_counts.sum(axis=1)
+        return rollups
+
+    def state(self, prefix: str) -> Dict[str, np.ndarray]:
+        n = len(self.names)
+        arrays = {f"{prefix}/{name}": getattr(self, name)[:n] for name in self._ARRAYS}
+        arrays[f"{prefix}/names"] = np.array(self.names, dtype=str)
+        arrays[f"{prefix}/meta"] = np.array([self.tau, self.window_days, self.epoch, self.current_day], dtype=np.float64)
+        return arrays
+
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], prefix: str) -> "Rollups":
+        tau, window_days, epoch, current_day = arrays[f"{prefix}/meta"].tolist()
+        rollups = cls(half_life_days=tau * math.log(2) / DAY, window_days=int(window_days), capacity=1)
+        rollups.names = arrays[f"{prefix}/names"].tolist()
+        rollups.index = {name: i for i, name in enumerate(rollups.names)}
+        rollups._grow(len(rollups.names))
+        for name in cls._ARRAYS:
+            stored = arrays[f"{prefix}/{name}"]
+            getattr(rollups, name)[:len(stored)] = stored
+        rollups.epoch = epoch
+        rollups.current_day = int(current_day)
+        return rollups
+
+
+class Leaderboard:
+    """
+    Author leaderboards (overall and per campaign) plus campaign totals,
+    with periodic checkpoints
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = os.getenv("LEADERBOARD_PATH", DEFAULT_CHECKPOINT_PATH),
+        checkpoint_every: int = int(os.getenv("LEADERBOARD_CHECKPOINT_EVERY", "10000")),
+    ):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.authors = Rollups()
+        self.campaigns = Rollups()
+        self.campaign_authors: Dict[str, Rollups] = {}
+        # Highest tweet id applied so far, so a restart can resume
+        self.last_tweet_id = 0
+        self._since_checkpoint = 0
+        self._lock = threading.Lock()
+        # Open lock file while this process owns the checkpoint
+        self._owner: Optional[Any] = None
+        self._loaded_mtime: Optional[int] = None
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def acquire(self) -> bool:
+        """
+        Become the only process writing the checkpoint, picking up
+        whatever the previous owner saved since it was loaded. Call
+        before applying anything. Returns False if another process owns
+        it.
+        """
+        if not self.path:
+            return True
+        if not self._lock_checkpoint():
+            return False
+        if os.path.exists(self.path) and os.stat(self.path).st_mtime_ns != self._loaded_mtime:
+            self._load(self.path)
+        return True
+
+    def _lock_checkpoint(self) -> bool:
+        import fcntl
+        if self._owner is not None:
+            return True
+        lock = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._owner = lock
+        return True
+
+    def board(self, campaign: Optional[str] = None) -> Rollups:
+        """
+        The author leaderboard overall, or within one campaign
+        """
+        if campaign is None:
+            return self.authors
+        return self.campaign_authors.get(campaign) or Rollups(capacity=1)
+
+    def add_many(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Apply scored tweets: {"author", "score", "timestamp" (epoch
+        seconds), optional "campaign" and "id"}. Returns how many were
+        applied.
+        """
+        rows = [row for row in rows if row.get("author") and row.get("score") is not None]
+        if not rows:
+            return 0
+        scores = np.array([row["score"] for row in rows], dtype=np.float64)
+        timestamps = np.array([row.get("timestamp") or time.time() for row in rows], dtype=np.float64)
+
+        with self._lock:
+            self.authors.add_many([row["author"] for row in rows], scores, timestamps)
+            by_campaign: Dict[str, List[int]] = {}
+            for i, row in enumerate(rows):
+                if row.get("campaign"):
+                    by_campaign.setdefault(row["campaign"], []).append(i)
+            if by_campaign:
+                campaign_rows = [i for rows_of in by_campaign.values() for i in rows_of]
+                self.campaigns.add_many(
+                    [rows[i]["campaign"] for i in campaign_rows], scores[campaign_rows], timestamps[campaign_rows]
+                )
+                for campaign, indexes in by_campaign.items():
+                    board = self.campaign_authors.setdefault(campaign, Rollups())
+                    board.add_many([rows[i]["author"] for i in indexes], scores[indexes], timestamps[indexes])
+
+            ids = [row["id"] for row in rows if isinstance(row.get("id"), int)]
+            if ids:
+                self.last_tweet_id = max(self.last_tweet_id, max(ids))
+            self._since_checkpoint += len(rows)
+            due = self.path and self._since_checkpoint >= self.checkpoint_every
+        if due:
+            self.checkpoint()
+        return len(rows)
+
+    def applied(self) -> int:
+        """
+        How many scored tweets the rollups hold
+        """
+        with self._lock:
+            return int(self.authors.count.sum())
+
+    def add(self, author: str, score: float, timestamp: Optional[float] = None, campaign: Optional[str] = None) -> None:
+        self.add_many([{"author": author, "score": score, "timestamp": timestamp, "campaign": campaign}])
+
+    def top_k(self, k: int = 10, metric: str = "decayed", campaign: Optional[str] = None) -> List[Tuple[str, float]]:
+        with self._lock:
+            return self.board(campaign).top_k(k, metric)
+
+    def rank(self, author: str, metric: str = "decayed", campaign: Optional[str] = None) -> Optional[int]:
+        with self._lock:
+            return self.board(campaign).rank(author, metric)
+
+    def rebuild(
+        self,
+        authors: np.ndarray,
+        scores: np.ndarray,
+        timestamps: np.ndarray,
+        campaigns: Optional[np.ndarray] = None,
+        last_tweet_id: int = 0,
+        now: Optional[float] = None,
+    ) -> None:
+        """
+        Replace all rollups with ones recomputed from the full history
+        """
+        authors = np.asarray(authors, dtype=str)
+        scores = np.asarray(scores, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        now = time.time() if now is None else now
+
+        board = Rollups.build(authors, scores, timestamps, now)
+        campaign_rollups = Rollups(capacity=1)
+        campaign_authors: Dict[str, Rollups] = {}
+        if campaigns is not None:
+            campaigns = np.asarray(campaigns, dtype=str)
+            tagged = campaigns != ""
+            campaign_rollups = Rollups.build(campaigns[tagged], scores[tagged], timestamps[tagged], now)
+            # Group rows by campaign once, then build each board from its slice
+            order = np.argsort(campaigns, kind="stable")
+            names, starts = np.unique(campaigns[order], return_index=True)
+            for name, start, end in zip(names.tolist(), starts, list(starts[1:]) + [len(order)]):
+                if name:
+                    rows = order[start:end]
+                    campaign_authors[name] = Rollups.build(authors[rows], scores[rows], timestamps[rows], now)
+
+        with self._lock:
+            self.authors = board
+            self.campaigns = campaign_rollups
+            self.campaign_authors = campaign_authors
+            self.last_tweet_id = last_tweet_id
+        if self.path:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """
+        Write the full state to the checkpoint file atomically
+        """
+        if not self._lock_checkpoint():
+            raise RuntimeError(f"{self.path} is owned by another process")
+        with self._lock:
+            arrays = self.authors.state("authors")
+            arrays.update(self.campaigns.state("campaigns"))
+            for i, (campaign, board) in enumerate(self.campaign_authors.items()):
+                arrays.update(board.state(f"campaign{i}"))
+            arrays["campaign_names"] = np.array(list(self.campaign_authors), dtype=str)
+            arrays["last_tweet_id"] = np.array([self.last_tweet_id], dtype=np.int64)
+            self._since_checkpoint = 0
+
+            # The arrays are views of live state, so write before unlocking
+            tmp = f"{self.path}.tmp.npz"
+            np.savez(tmp, **arrays)
+            os.replace(tmp, self.path)
+            self._loaded_mtime = os.stat(self.path).st_mtime_ns
+
+    def _load(self, path: str) -> None:
+        with np.load(path) as stored:
+            arrays = dict(stored)
+        self.authors = Rollups.from_state(arrays, "authors")
+        self.campaigns = Rollups.from_state(arrays, "campaigns")
+        self.campaign_authors = {
+            campaign: Rollups.from_state(arrays, f"campaign{i}")
+            for i, campaign in enumerate(arrays["campaign_names"].tolist())
+        }
+        self.last_tweet_id = int(arrays["last_tweet_id"][0])
+        self._loaded_mtime = os.stat(path).st_mtime_ns
+
+
+def _timestamp(value: Optional[str]) -> float:
+    """
+    Epoch seconds of a PostgREST timestamp string
+    """
+    from datetime import datetime
+    if not value:
+        return time.time()
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def pipeline_rows(scored: List[Tuple[Dict[str, Any], float]]) -> List[Dict[str, Any]]:
+    """
+    Leaderboard rows for (collected_tweets row, score) pairs coming out of
+    TweetPipeline
+    """
+    campaign_column = os.getenv("LEADERBOARD_CAMPAIGN_COLUMN", "")
+    return [
+        {
+            "id": row["id"],
+            "author": row.get("author_username"),
+            "score": score,
+            "timestamp": _timestamp(row.get("posted_at")),
+            "campaign": row.get(campaign_column) if campaign_column else None,
+        }
+        for row, score in scored
+    ]
+
+
+def _columns() -> List[str]:
+    campaign_column = os.getenv("LEADERBOARD_CAMPAIGN_COLUMN", "")
+    return ["id", "author_username", "score", "posted_at"] + ([campaign_column] if campaign_column else [])
+
+
+def _scored_pages(client: Any, after_id: int, page_size: int) -> Iterable[List[Dict[str, Any]]]:
+    """
+    Pages of scored collected_tweets rows with ids above `after_id`, by
+    keyset pagination
+    """
+    from tweet_pipeline import TABLE
+
+    while True:
+        rows = client.select(TABLE, [
+            ("select", ",".join(_columns())),
+            ("score", "not.is.null"),
+            ("id", f"gt.{after_id}"),
+            ("order", "id.asc"),
+            ("limit", str(page_size)),
+        ])
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1]["id"]
+
+
+def rebuild_from_db(leaderboard: Leaderboard, page_size: int = 10000, client: Any = None) -> int:
+    """
+    Rebuild from every scored row of collected_tweets, reading
+    author_username, score, posted_at and (if LEADERBOARD_CAMPAIGN_COLUMN
+    is set) the campaign column
+    """
+    from tweet_pipeline import PostgrestClient
+
+    campaign_column = os.getenv("LEADERBOARD_CAMPAIGN_COLUMN", "")
+    authors: List[str] = []
+    campaigns: List[str] = []
+    scores: List[float] = []
+    timestamps: List[float] = []
+    last_id = 0
+    for rows in _scored_pages(client or PostgrestClient(), 0, page_size):
+        for row in rows:
+            last_id = max(last_id, row["id"])
+            if row.get("author_username"):
+                authors.append(row["author_username"])
+                campaigns.append(str(row.get(campaign_column) or "") if campaign_column else "")
+                scores.append(row["score"])
+                timestamps.append(_timestamp(row.get("posted_at")))
+
+    leaderboard.rebuild(
+        np.array(authors, dtype=str),
+        np.array(scores, dtype=np.float64),
+        np.array(timestamps, dtype=np.float64),
+        np.array(campaigns, dtype=str) if campaign_column else None,
+        last_tweet_id=last_id
+    )
+    return len(authors)
+
+
+def catch_up_from_db(leaderboard: Leaderboard, page_size: int = 10000, client: Any = None) -> int:
+    """
+    Apply the rows scored above last_tweet_id, then rebuild if the
+    database still holds scored rows the leaderboard has not seen, and
+    checkpoint. Returns how many rows were applied (all of them after a
+    rebuild).
+    """
+    from tweet_pipeline import TABLE, PostgrestClient
+
+    client = client or PostgrestClient()
+    applied = 0
+    for rows in _scored_pages(client, leaderboard.last_tweet_id, page_size):
+        applied += leaderboard.add_many(pipeline_rows([(row, row["score"]) for row in rows]))
+        # Rows without an author still move the starting point forward
+        leaderboard.last_tweet_id = max(leaderboard.last_tweet_id, rows[-1]["id"])
+
+    # The same rows rebuild_from_db() counts: scored, with an author
+    expected = client.count(TABLE, [("score", "not.is.null"), ("author_username", "neq.")])
+    if expected != leaderboard.applied():
+        print(
+            f"Leaderboard holds {leaderboard.applied()} of {expected} scored tweets; rebuilding",
+            file=sys.stderr
+        )
+        return rebuild_from_db(leaderboard, page_size, client)
+    if leaderboard.path:
+        leaderboard.checkpoint()
+    return applied
+
+
+if __name__ == "__main__":
+    def option(name: str, default: Optional[str] = None) -> Optional[str]:
+        if name in sys.argv:
+            return sys.argv[sys.argv.index(name) + 1]
+        return default
+
+    leaderboard = Leaderboard()
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    metric = option("--metric", "decayed")
+    campaign = option("--campaign")
+    if command in ("rebuild", "catch-up") and not leaderboard.acquire():
+        print(f"Error: another process owns {leaderboard.path}", file=sys.stderr)
+        sys.exit(1)
+    if command == "rebuild":
+        started = time.perf_counter()
+        count = rebuild_from_db(leaderboard)
+        print(f"Rebuilt from {count} scored tweets in {time.perf_counter() - started:.1f}s")
+    elif command == "catch-up":
+        print(f"Applied {catch_up_from_db(leaderboard)} scored tweets the leaderboard was missing")
+    elif command == "top":
+        k = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isdigit() else 10
+        for position, (author, value) in enumerate(leaderboard.top_k(k, metric, campaign), 1):
+            print(f"{position:>4}. {author:<30} {value:.1f}")
+    elif command == "rank" and len(sys.argv) > 2:
+        print(leaderboard.rank(sys.argv[2], metric, campaign))
+    else:
+        print("Usage: python3 leaderboard.py rebuild | catch-up | top [k] [--metric m] [--campaign c] | rank <author>")
@@ -0,0 +1,209 @@
+"""
+Fast local sentiment scorer used as the first tier before GPT.
+
+A linear model over hashed unigrams and bigrams, evaluated in NumPy. The
+weights start from a small crypto-flavoured sentiment lexicon and can be
+refined offline from GPT-scored tweets:
+
+    python3 local_scorer.py train scored.jsonl   # {"content": ..., "score": ...} per line
+
+Every prediction comes with a confidence; only confident predictions
+are used, everything else still goes to GPT.
+"""
+import json
+import os
+import re
+import sys
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import metrics
+from tweet_prompts import sentiment_for
+
+DEFAULT_WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_scorer_weights.npy")
+
+FEATURE_BITS = 18
+# Output scale: score = 100 * tanh(raw / SCALE)
+SCALE = 3.0
+
+_TOKEN_RE = re.compile(r"[a-z][a-z']+")
+_NEGATORS = {"not", "no", "never", "dont", "don't", "isn't", "isnt", "aren't", "wasn't", "cant", "can't", "won't", "nothing"}
+
+LEXICON = {
+    # positive
+    "amazing": 2.0, "awesome": 2.0, "incredible": 2.0, "excellent": 2.0, "love": 1.5,
+    "best": 1.5, "great": 1.5, "fantastic": 2.0, "impressive": 1.5, "innovation": 1.0,
+    "innovative": 1.0, "fast": 1.0, "scalable": 1.0, "scalability": 0.8, "bullish": 1.5,
+    "excited": 1.5, "exciting": 1.5, "good": 1.0, "easy": 0.8, "smooth": 1.0,
+    "cheap": 0.5, "solid": 1.0, "win": 1.0, "winning": 1.0, "moon": 1.0,
+    "thrilled": 1.5, "recommend": 1.0, "happy": 1.0, "powerful": 1.0, "brilliant": 2.0,
+    # negative
+    "disappointment": -2.0, "disappointed": -2.0, "disappointing": -2.0, "terrible": -2.0,
+    "awful": -2.0, "garbage": -2.0, "scam": -2.5, "rug": -2.0, "rugged": -2.0,
+    "worst": -2.0, "hate": -1.5, "slow": -1.0, "expensive": -1.0, "broken": -1.5,
+    "bad": -1.0, "avoid": -1.5, "waste": -1.5, "bearish": -1.5, "dead": -1.5,
+    "useless": -2.0, "buggy": -1.5, "fail": -1.5, "failed": -1.5, "down": -0.5,
+    "dump": -1.0, "fraud": -2.5, "frustrated": -1.5, "frustrating": -1.5, "poor": -1.0,
+}
+
+
+def _feature(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8")) & ((1 << FEATURE_BITS) - 1)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens; words right after a negator get a "not_" prefix
+    """
+    tokens = []
+    negate = 0
+    for word in _TOKEN_RE.findall(text.lower()):
+        if word in _NEGATORS:
+            negate = 3
+            continue
+        if negate:
+            tokens.append("not_" + word)
+            negate -= 1
+        else:
+            tokens.append(word)
+    return tokens
+
+
+class LocalScorer:
+    """
+    Hashed n-gram linear sentiment model with a confidence estimate
+    """
+
+    def __init__(
+        self,
+        weights_path: Optional[str] = os.getenv("LOCAL_SCORER_WEIGHTS", DEFAULT_WEIGHTS_PATH),
+        threshold: float = float(os.getenv("LOCAL_SCORER_THRESHOLD", "0.85")),
+    ):
+        self.threshold = threshold
+        self._features: Dict[str, int] = {}
+        if weights_path and os.path.exists(weights_path):
+            self.weights = np.load(weights_path)
+        else:
+            self.weights = self.lexicon_weights()
+
+    @staticmethod
+    def lexicon_weights() -> np.ndarray:
+        weights = np.zeros(1 << FEATURE_BITS, dtype=np.float32)
+        for word, value in LEXICON.items():
+            weights[_feature(word)] = value
+            weights[_feature("not_" + word)] = -0.5 * value
+        return weights
+
+    def _featurize(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Row (text) and column (hashed feature) indexes of every unigram
+        and bigram in the batch
+        """
+        rows: List[int] = []
+        cols: List[int] = []
+        cache = self._features
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            grams = tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]
+            for gram in grams:
+                if gram not in cache:
+                    cache[gram] = _feature(gram)
+            cols.extend(map(cache.__getitem__, grams))
+            rows.extend([row] * len(grams))
+        return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+    def _raw(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Summed positive and negative evidence per text, plus the number of
+        features that carried any weight
+        """
+        rows, cols = self._featurize(texts)
+        values = self.weights[cols].astype(np.float64)
+        positive = np.bincount(rows, weights=np.maximum(values, 0), minlength=len(texts))
+        negative = np.bincount(rows, weights=np.minimum(values, 0), minlength=len(texts))
+        matched = np.bincount(rows, weights=(values != 0), minlength=len(texts))
+        return positive, negative, matched
+
+    def score_many(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores in [-100, 100] and confidences in [0, 1] for a batch of tweets
+        """
+        if not texts:
+            return np.zeros(0), np.zeros(0)
+        positive, negative, matched = self._raw(texts)
+        raw = positive + negative
+        scores = np.round(100 * np.tanh(raw / SCALE))
+
+        # Confident when the evidence is strong, comes from several
+        # features, and mostly points one way
+        strength = np.tanh(np.abs(raw) / SCALE)
+        support = np.minimum(1.0, matched / 3.0)
+        evidence = positive - negative
+        agreement = np.divide(np.abs(raw), evidence, out=np.zeros(len(texts)), where=evidence > 0)
+        return scores, strength * support * agreement
+
+    def predict(self, texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Results for the texts the local model is confident about, None for
+        the ones that should go to GPT
+        """
+        scores, confidences = self.score_many(texts)
+        metrics.inc("local_checked_total", len(texts))
+        results: List[Optional[Dict[str, Any]]] = []
+        for score, confidence in zip(scores.tolist(), confidences.tolist()):
+            if confidence < self.threshold:
+                results.append(None)
+                continue
+            results.append({
+                "score": int(score),
+                "sentiment": sentiment_for(score),
+                "explanation": f"Scored locally (confidence {confidence:.2f})",
+                "gpt_response": None,
+                "local": True,
+                "confidence": round(confidence, 3)
+            })
+        return results
+
+    def fit(self, texts: List[str], scores: List[float], epochs: int = 20, learning_rate: float = 0.5, l2: float = 1e-4) -> None:
+        """
+        Refine the weights on GPT-scored tweets with full-batch gradient
+        descent on squared error
+        """
+        rows, cols = self._featurize(texts)
+        target = np.clip(np.asarray(scores, dtype=np.float64) / 100.0, -0.999, 0.999)
+        counts = np.maximum(np.bincount(rows, minlength=len(texts)), 1)
+        weights = self.weights.astype(np.float64)
+
+        for _ in range(epochs):
+            raw = np.bincount(rows, weights=weights[cols], minlength=len(texts))
+            predicted = np.tanh(raw / SCALE)
+            # d(loss)/d(raw) per text, spread over that text's features
+            grad_raw = (predicted - target) * (1 - predicted ** 2) / SCALE
+            grad = np.bincount(cols, weights=(grad_raw / counts)[rows], minlength=len(weights))
+            weights -= learning_rate * (grad + l2 * weights)
+
+        self.weights = weights.astype(np.float32)
+
+    def save(self, path: str = DEFAULT_WEIGHTS_PATH) -> None:
+        np.save(path, self.weights)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "train":
+        texts, targets = [], []
+        with open(sys.argv[2]) as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    texts.append(row["content"])
+                    targets.append(row["score"])
+
+        scorer = LocalScorer(weights_path=None)
+        scorer.fit(texts, targets)
+        path = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_WEIGHTS_PATH
+        scorer.save(path)
+        print(f"Trained on {len(texts)} tweets, weights saved to {path}")
+    else:
+        print("Usage: python3 local_scorer.py train <scored.jsonl> [weights.npy]")
@@ -0,0 +1,277 @@
+"""
+Lightweight in-process metrics for the scoring pipeline.
+
+Per-stage latency histograms and plain counters, cheap enough to leave on
+in production (one perf_counter pair, a bisect and a locked add per
+observation). Exposed as Prometheus text or JSON:
+
+- serve modes: GET /metrics and /metrics.json on the HTTP worker, a
+  {"op": "metrics"} request on the JSON-lines workers, or a separate
+  metrics port (--metrics-port)
+- CLI modes: a summary on stderr at exit (--metrics-out file.json for
+  the full snapshot)
+
+Set METRICS_DISABLE=1 to turn recording off.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# Upper bounds in seconds; covers sub-millisecond cache lookups up to
+# slow, retried OpenAI calls
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PREFIX = "tylo_scorer_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram (Prometheus style)
+    """
+
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile by interpolating inside its bucket, clamped to
+        the observed range
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / bucket_count
+                return max(self.min, min(self.max, estimate))
+            seen += bucket_count
+        return self.max
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics: "Metrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """
+    Registry of stage histograms and counters, safe to share between
+    threads and asyncio tasks
+    """
+
+    def __init__(self, enabled: bool = os.getenv("METRICS_DISABLE", "") not in ("1", "true", "yes")):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def time(self, stage: str) -> _Timer:
+        """
+        Context manager that records the wall time of its block under `stage`
+        """
+        return _Timer(self, stage)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled or not value:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_usage(self, usage: Dict[str, int]) -> None:
+        """
+        Count the tokens of one completion
+        """
+        self.inc("prompt_tokens_total", usage.get("prompt_tokens", 0))
+        self.inc("completion_tokens_total", usage.get("completion_tokens", 0))
+
+    def counter(self, name: str, **labels: str) -> float:
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        All metrics as a JSON-friendly dict, with latencies in milliseconds
+        """
+        with self._lock:
+            histograms = {
+                stage: {
+                    "count": h.count,
+                    "sum_ms": round(h.sum * 1000, 3),
+                    "mean_ms": round(h.sum * 1000 / h.count, 3) if h.count else 0.0,
+                    "p50_ms": round(h.quantile(0.5) * 1000, 3),
+                    "p90_ms": round(h.quantile(0.9) * 1000, 3),
+                    "p99_ms": round(h.quantile(0.99) * 1000, 3),
+                    "max_ms": round(h.max * 1000, 3),
+                }
+                for stage, h in sorted(self._histograms.items())
+            }
+            counters: Dict[str, Any] = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                if labels:
+                    key = ",".join(f"{k}={v}" for k, v in labels)
+                    counters.setdefault(name, {})[key] = value
+                else:
+                    counters[name] = value
+        return {
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "stages": histograms,
+            "counters": counters,
+        }
+
+    def render_prometheus(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format
+        """
+        lines: List[str] = []
+        with self._lock:
+            name = f"{PREFIX}stage_seconds"
+            lines.append(f"# HELP {name} Latency of each scoring stage")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, h.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {h.sum:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {h.count}')
+
+            declared = set()
+            for (counter, labels), value in sorted(self._counters.items()):
+                full = PREFIX + counter
+                if full not in declared:
+                    declared.add(full)
+                    lines.append(f"# TYPE {full} counter")
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                value_text = str(int(value)) if value == int(value) else repr(value)
+                lines.append(f"{full}{{{label_text}}} {value_text}" if label_text else f"{full} {value_text}")
+
+        lines.append(f"# TYPE {PREFIX}uptime_seconds gauge")
+        lines.append(f"{PREFIX}uptime_seconds {time.time() - self.started_at:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """
+        Short human-readable report for the end of a CLI run
+        """
+        snapshot = self.snapshot()
+        lines = ["Scoring metrics:"]
+        for stage, h in snapshot["stages"].items():
+            lines.append(
+                f"  {stage:<22} n={h['count']:<6} mean={h['mean_ms']:.1f}ms "
+                f"p50={h['p50_ms']:.1f}ms p99={h['p99_ms']:.1f}ms max={h['max_ms']:.1f}ms"
+            )
+        for counter, value in snapshot["counters"].items():
+            lines.append(f"  {counter:<22} {json.dumps(value)}")
+        return "\n".join(lines)
+
+
+# Shared by every module of the scorer
+metrics = Metrics()
+
+
+def dump_on_exit(path: Optional[str] = None) -> None:
+    """
+    Print the summary to stderr at exit, and write the JSON snapshot to
+    `path` when given
+    """
+    import atexit
+
+    def dump():
+        if not metrics.enabled:
+            return
+        print(metrics.summary(), file=sys.stderr)
+        if path:
+            with open(path, "w") as f:
+                json.dump(metrics.snapshot(), f, indent=2)
+
+    atexit.register(dump)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    GET /metrics (Prometheus text) and /metrics.json
+    """
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            payload = metrics.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            payload = json.dumps(metrics.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics_http(host: str = "127.0.0.1", port: int = 9464) -> ThreadingHTTPServer:
+    """
+    Serve the metrics endpoints from a background thread
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    print(f"Metrics on http://{host}:{port}/metrics", file=sys.stderr)
+    return server
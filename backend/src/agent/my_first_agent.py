@@ -1,12 +1,22 @@
+import time
+_import_started = time.perf_counter()
 from uagents import Agent, Context, Model, Protocol
 import re
 import json
+import asyncio
 import os
-import openai
-from typing import Dict, Any
+from typing import Dict, Any, List, Set, Tuple
 from uuid import uuid4
 from datetime import datetime
 from dotenv import load_dotenv
+from async_scoring import AsyncScoringEngine, SyncScorer
+from local_scorer import LocalScorer
+from metrics import dump_on_exit, metrics, serve_metrics_http
+from near_duplicates import NearDuplicateIndex
+from score_cache import ScoreCache
+from scoring_cascade import ScoringCascade
+from tweet_ids import MAX_TWEETS_PER_COMMAND, parse_tweet_ids
+from tweet_prompts import DEFAULT_PROFILE, check_profile, public_result
 
 #import the necessary components from the chat protocol
 from uagents_core.contrib.protocols.chat import (
@@ -27,8 +37,16 @@ agent = Agent(
     publish_agent_details=True
     )
 
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Persistent score cache and near-duplicate index in front of GPT
+# (set SCORE_CACHE_BYPASS=1 or pass --no-cache to skip both), then a
+# local scorer that answers the obvious tweets (LOCAL_SCORER_DISABLE=1
+# or --no-local-scorer to turn it off)
+score_cache = ScoreCache()
+scoring_cascade = ScoringCascade(
+    score_cache,
+    NearDuplicateIndex() if os.getenv("NEAR_DUP_DISABLE", "") not in ("1", "true", "yes") else None,
+    LocalScorer() if os.getenv("LOCAL_SCORER_DISABLE", "") not in ("1", "true", "yes") else None
+)
 
 # Mock Twitter posts for testing
 mock_tweets = [
@@ -44,95 +62,39 @@ mock_tweets = [
     }
 ]
 
-def analyze_tweet_with_gpt(tweet_content: str) -> Dict[str, Any]:
+# Tweets by id for chat lookups
+tweet_index = {t["id"]: t for t in mock_tweets}
+
+# One async scoring engine (OpenAI client, batching, retries and rate
+# limits) behind every scoring path; the blocking ones reach it through
+# its own event loop thread
+scoring_engine = AsyncScoringEngine(cascade=scoring_cascade)
+scorer = SyncScorer(scoring_engine)
+
+# Imports plus client, cache and model setup
+metrics.observe("startup", time.perf_counter() - _import_started)
+
+def score_tweet_content(content: str, profile: str = DEFAULT_PROFILE) -> dict:
     """
-    Analyze tweet content using ChatGPT and return score and sentiment
+    Score a tweet using ChatGPT analysis, reusing known scores for
+    identical or near-duplicate text
     """
-    try:
-        if not client:
-            raise ValueError("OpenAI client not found in environment variables")
-        
-        prompt = f"""
-        Analyze the following tweet about Flow blockchain and provide:
-        1. A sentiment score between -100 and +100 (negative to positive)
-        2. A sentiment category: "Positive", "Neutral", or "Negative"
-        3. A brief explanation of your analysis
-        
-        Tweet: "{tweet_content}"
-        
-        Respond in JSON format:
-        {{
-            "score": <number between -100 and 100>,
-            "sentiment": "<Positive/Neutral/Negative>",
-            "explanation": "<brief explanation>"
-        }}
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a sentiment analysis expert. Always respond with valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=200
-        )
-        
-        # Extract and parse JSON response
-        response_text = response.choices[0].message.content.strip()
-        
-        # Try to extract JSON from the response
-        try:
-            # Look for JSON in the response
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            if start_idx != -1 and end_idx != 0:
-                json_str = response_text[start_idx:end_idx]
-                result = json.loads(json_str)
-            else:
-                raise ValueError("No JSON found in response")
-                
-        except json.JSONDecodeError:
-            # Fallback: create a basic response
-            result = {
-                "score": 0,
-                "sentiment": "Neutral",
-                "explanation": "Could not parse GPT response"
-            }
-        
-        # Ensure score is within bounds
-        score = max(-100, min(100, result.get("score", 0)))
-        
-        return {
-            "score": score,
-            "sentiment": result.get("sentiment", "Neutral"),
-            "explanation": result.get("explanation", "Analysis completed"),
-            "gpt_response": response_text
-        }
-        
-    except Exception as e:
-        print(f"Error in GPT analysis: {e}")
-        # Fallback to basic scoring
-        return {
-            "score": 0,
-            "sentiment": "Neutral",
-            "explanation": f"GPT analysis failed: {str(e)}",
-            "gpt_response": None
-        }
-
-def score_tweet_content(content: str) -> dict:
+    return scorer.score(content, profile)
+
+def score_tweets(tweets: List[str], profile: str = DEFAULT_PROFILE) -> List[Dict[str, Any]]:
     """
-    Score a tweet using ChatGPT analysis
+    Score a list of tweets using batched ChatGPT analysis.
+    Results are returned in the same order as the input; tweets with a
+    known score (cached, near-duplicate or repeated) are not sent to GPT.
     """
-    # Use GPT for analysis
-    gpt_result = analyze_tweet_with_gpt(content)
-    
-    return {
-        "score": gpt_result["score"],
-        "sentiment": gpt_result["sentiment"],
-        "explanation": gpt_result["explanation"],
-        "gpt_response": gpt_result.get("gpt_response")
-    }
+    return scorer.score_many(tweets, profile)
+
+def handle_worker_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Score one request coming from the long-lived worker
+    (--serve-stdio / --serve-unix / --serve-http)
+    """
+    return scorer.handle(request)
 
 # startup handler
 @agent.on_event("startup")
@@ -141,11 +103,69 @@ async def startup_function(ctx: Context):
     ctx.logger.info("Twitter post scoring agent with GPT integration is ready!")
     
     # Check if OpenAI API key is available
-    if not client:
+    if not scoring_engine.client:
         ctx.logger.warning("OpenAI client not found! GPT analysis will not work.")
     else:
         ctx.logger.info("OpenAI client found. GPT analysis is enabled.")
 
+async def send_chat_json(ctx: Context, recipient: str, payload: Dict[str, Any]):
+    """
+    Send a JSON payload as a chat message
+    """
+    response = ChatMessage(
+        timestamp=datetime.utcnow(),
+        msg_id=str(uuid4()),
+        content=[TextContent(type="text", text=json.dumps(payload, indent=2))]
+    )
+    await ctx.send(recipient, response)
+
+# Running "score tweets" streams; the references keep them from being
+# garbage-collected before they finish
+stream_tasks: Set["asyncio.Task[None]"] = set()
+
+async def stream_tweet_scores(ctx: Context, sender: str, tweet_ids: List[int]):
+    """
+    Score the requested tweets in batches (on the engine's own loop, so
+    the agent keeps serving other senders meanwhile) and send each result
+    as soon as it is ready
+    """
+    missing = [tweet_id for tweet_id in tweet_ids if tweet_id not in tweet_index]
+    if missing:
+        await send_chat_json(ctx, sender, {
+            "status": "error",
+            "message": f"Tweet with ID {', '.join(map(str, missing))} not found",
+            "available_tweets": list(tweet_index)
+        })
+
+    tweets = [tweet_index[tweet_id] for tweet_id in tweet_ids if tweet_id in tweet_index]
+    if not tweets:
+        return
+    ctx.logger.info(f"Analyzing {len(tweets)} tweet(s) with GPT...")
+
+    try:
+        async for i, result in scorer.stream([tweet["content"] for tweet in tweets]):
+            tweet = tweets[i]
+            tweet_result = {
+                "user": tweet["author"],
+                "score": result["score"],
+                "sentiment": result.get("sentiment"),
+                "tweet_id": tweet["id"],
+                "content": tweet["content"],
+                "explanation": result.get("explanation"),
+                "gpt_used": result.get("gpt_response") is not None
+            }
+            await send_chat_json(ctx, sender, {
+                "status": "error" if result.get("error") else "success",
+                "result": tweet_result,
+                "message": f"Analyzed tweet #{tweet['id']} with GPT successfully"
+                if not result.get("error") else f"Could not analyze tweet #{tweet['id']}"
+            })
+    except Exception as e:
+        await send_chat_json(ctx, sender, {
+            "status": "error",
+            "message": f"Error processing request: {str(e)}"
+        })
+
 # Message Handler - Process received messages and send acknowledgements
 @chat_proto.on_message(ChatMessage)
 async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
@@ -162,122 +182,58 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
             await ctx.send(sender, ack)
             
             # Process the message content
-            message_text = item.text.lower()
+            message_text = item.text.lower().strip()
             
-            # Check if message is a request to score a specific tweet
+            # Check if message is a request to score tweets,
+            # e.g. "score tweet 1" or "score tweets 1,2,5-40"
             if message_text.startswith("score tweet"):
+                spec = message_text[len("score tweet"):]
+                if spec.startswith("s"):
+                    spec = spec[1:]
                 try:
-                    # Extract tweet ID from message (e.g., "score tweet 1" or "score tweet 2")
-                    parts = message_text.split()
-                    if len(parts) >= 3 and parts[2].isdigit():
-                        tweet_id = int(parts[2])
-                        
-                        # Find the tweet with the specified ID
-                        tweet = None
-                        for t in mock_tweets:
-                            if t["id"] == tweet_id:
-                                tweet = t
-                                break
-                        
-                        if tweet:
-                            ctx.logger.info(f"Analyzing tweet #{tweet_id} with GPT...")
-                            result = score_tweet_content(tweet["content"])
-                            
-                            tweet_result = {
-                                "user": tweet["author"],
-                                "score": result["score"],
-                                "sentiment": result["sentiment"],
-                                "tweet_id": tweet["id"],
-                                "content": tweet["content"],
-                                "explanation": result["explanation"],
-                                "gpt_used": result["gpt_response"] is not None
-                            }
-                            
-                            # Send response message with tweet analysis
-                            response_text = json.dumps({
-                                "status": "success",
-                                "result": tweet_result,
-                                "message": f"Analyzed tweet #{tweet_id} with GPT successfully"
-                            }, indent=2)
-                            
-                            response = ChatMessage(
-                                timestamp=datetime.utcnow(),
-                                msg_id=str(uuid4()),
-                                content=[TextContent(type="text", text=response_text)]
-                            )
-                            await ctx.send(sender, response)
-                        else:
-                            error_text = json.dumps({
-                                "status": "error",
-                                "message": f"Tweet with ID {tweet_id} not found",
-                                "available_tweets": [t["id"] for t in mock_tweets]
-                            }, indent=2)
-                            
-                            response = ChatMessage(
-                                timestamp=datetime.utcnow(),
-                                msg_id=str(uuid4()),
-                                content=[TextContent(type="text", text=error_text)]
-                            )
-                            await ctx.send(sender, response)
-                    else:
-                        error_text = json.dumps({
-                            "status": "error",
-                            "message": "Please specify tweet ID. Use 'score tweet 1' or 'score tweet 2'",
-                            "available_tweets": [t["id"] for t in mock_tweets]
-                        }, indent=2)
-                        
-                        response = ChatMessage(
-                            timestamp=datetime.utcnow(),
-                            msg_id=str(uuid4()),
-                            content=[TextContent(type="text", text=error_text)]
-                        )
-                        await ctx.send(sender, response)
-                except Exception as e:
-                    error_text = json.dumps({
+                    tweet_ids = parse_tweet_ids(spec)
+                except ValueError as e:
+                    await send_chat_json(ctx, sender, {
+                        "status": "error",
+                        "message": str(e),
+                        "available_tweets": list(tweet_index)
+                    })
+                    continue
+                
+                if not tweet_ids:
+                    await send_chat_json(ctx, sender, {
                         "status": "error",
-                        "message": f"Error processing request: {str(e)}"
-                    }, indent=2)
-                    
-                    response = ChatMessage(
-                        timestamp=datetime.utcnow(),
-                        msg_id=str(uuid4()),
-                        content=[TextContent(type="text", text=error_text)]
-                    )
-                    await ctx.send(sender, response)
+                        "message": "Please specify tweet ID. Use 'score tweet 1' or 'score tweets 1,2'",
+                        "available_tweets": list(tweet_index)
+                    })
+                    continue
+                
+                # Stream in the background so this sender's long request
+                # doesn't hold up the messages of everyone else
+                task = asyncio.create_task(stream_tweet_scores(ctx, sender, tweet_ids))
+                stream_tasks.add(task)
+                task.add_done_callback(stream_tasks.discard)
             
             elif message_text == "help":
-                help_text = json.dumps({
+                await send_chat_json(ctx, sender, {
                     "status": "help",
                     "available_commands": [
                         "score tweet 1 - Analyze the first mock tweet with GPT",
                         "score tweet 2 - Analyze the second mock tweet with GPT",
+                        "score tweets 1,2 - Analyze several tweets (ranges like 5-40 work too); results arrive one message per tweet",
                         "help - Show this help message"
                     ],
                     "scoring_range": "Scores range from -100 to +100 (analyzed by GPT)",
-                    "available_tweets": [t["id"] for t in mock_tweets],
-                    "gpt_enabled": client is not None
-                }, indent=2)
-                
-                response = ChatMessage(
-                    timestamp=datetime.utcnow(),
-                    msg_id=str(uuid4()),
-                    content=[TextContent(type="text", text=help_text)]
-                )
-                await ctx.send(sender, response)
+                    "available_tweets": list(tweet_index),
+                    "gpt_enabled": scoring_engine.client is not None
+                })
             
             else:
-                error_text = json.dumps({
+                await send_chat_json(ctx, sender, {
                     "status": "error",
                     "message": "Unknown command. Use 'help' to see available commands.",
                     "received_message": item.text
-                }, indent=2)
-                
-                response = ChatMessage(
-                    timestamp=datetime.utcnow(),
-                    msg_id=str(uuid4()),
-                    content=[TextContent(type="text", text=error_text)]
-                )
-                await ctx.send(sender, response)
+                })
 
 # Acknowledgement Handler - Process received acknowledgements
 @chat_proto.on_message(ChatAcknowledgement)
@@ -288,12 +244,154 @@ async def handle_acknowledgement(ctx: Context, sender: str, msg: ChatAcknowledge
 # This allows the agent to send/receive messages and handle acknowledgements using the chat protocol
 agent.include(chat_proto, publish_manifest=True)
 
+def _get_option(name: str, default: str) -> str:
+    """
+    Read a "--name value" option from the command line
+    """
+    import sys
+    if name in sys.argv:
+        idx = sys.argv.index(name)
+        if idx + 1 < len(sys.argv) and not sys.argv[idx + 1].startswith("--"):
+            return sys.argv[idx + 1]
+    return default
+
 if __name__ == "__main__":
     import sys
     import json
     
+    if "--no-cache" in sys.argv:
+        score_cache.enabled = False
+        scoring_cascade.near_dups = None
+    if "--no-local-scorer" in sys.argv:
+        scoring_cascade.local = None
+    
+    # Long-lived modes answer near-duplicate lookups from memory; the
+    # one-shot CLI modes query the index file instead of loading it all
+    one_shot = len(sys.argv) > 1 and sys.argv[1] in ("--analyze-batch", "--analyze-tweet")
+    if scoring_cascade.near_dups is not None and not one_shot:
+        scoring_cascade.near_dups.load()
+    
+    serve_mode = len(sys.argv) > 1 and sys.argv[1] in ("--serve-stdio", "--serve-unix", "--serve-http")
+    if not serve_mode:
+        # One-shot CLI and agent runs report their metrics on exit
+        dump_on_exit(_get_option("--metrics-out", ""))
+    
+    # Long-lived worker modes: one process, one warm OpenAI client
+    # and connection pool for many tweets
+    if serve_mode:
+        import warnings
+        warnings.filterwarnings("ignore")
+        import scoring_worker
+
+        workers = int(_get_option("--workers", os.getenv("SCORING_WORKERS", "4")))
+        # The HTTP worker serves /metrics itself; the others can expose
+        # it on a port of their own
+        metrics_port = _get_option("--metrics-port", os.getenv("METRICS_PORT", ""))
+        if metrics_port and sys.argv[1] != "--serve-http":
+            serve_metrics_http(port=int(metrics_port))
+        if sys.argv[1] == "--serve-stdio" and "--async" in sys.argv:
+            # Every request as its own task on the scoring engine
+            from async_scoring import serve_stdio_async
+            asyncio.run(serve_stdio_async(scoring_engine))
+        elif sys.argv[1] == "--serve-stdio":
+            scoring_worker.serve_stdio(handle_worker_request, workers=workers)
+        elif sys.argv[1] == "--serve-unix":
+            path = _get_option("--serve-unix", "/tmp/tylo-scorer.sock")
+            scoring_worker.serve_unix(handle_worker_request, path, workers=workers)
+        else:
+            port = int(_get_option("--port", "8765"))
+            scoring_worker.serve_http(handle_worker_request, port=port)
+
+    # Queue worker: score jobs from the local job queue (job_queue.py);
+    # start more processes for more throughput. --write-scores stores
+    # the scores of jobs with a tweet id in collected_tweets.
+    elif len(sys.argv) > 1 and sys.argv[1] == "--queue-worker":
+        from job_queue import JobQueue, QueueWorker
+
+        on_results = None
+        if "--write-scores" in sys.argv:
+            from tweet_pipeline import TABLE, PostgrestClient
+            rest = PostgrestClient()
+
+            def on_results(done):
+                # Only updates existing rows; a tweet deleted meanwhile stays deleted
+                rest.update_scores(TABLE, {
+                    int(job.tweet_id): result["score"]
+                    for job, result in done
+                    if job.tweet_id is not None and job.tweet_id.isdigit()
+                })
+
+        worker = QueueWorker(JobQueue(), scoring_engine, on_results=on_results)
+        asyncio.run(worker.run(drain="--drain" in sys.argv))
+
+    # Backlog mode: score unscored collected_tweets rows straight from
+    # the database; run several of these in parallel to go faster
+    elif len(sys.argv) > 1 and sys.argv[1] == "--score-backlog":
+        from tweet_pipeline import TweetPipeline
+
+        # --leaderboard keeps the leaderboard rollups up to date as
+        # scores are written. Only one worker can own the leaderboard; it
+        # catches up with the database (scores written after the last
+        # checkpoint or by other writers) on startup and after every pass.
+        leaderboard = None
+        extra_columns: Tuple[str, ...] = ()
+        on_scored = None
+        if "--leaderboard" in sys.argv:
+            from leaderboard import Leaderboard, catch_up_from_db, pipeline_rows
+            leaderboard = Leaderboard()
+            if not leaderboard.acquire():
+                print(
+                    f"Error: another worker owns {leaderboard.path}; "
+                    "run only one --score-backlog worker with --leaderboard",
+                    file=sys.stderr
+                )
+                sys.exit(1)
+            catch_up_from_db(leaderboard)
+            campaign_column = os.getenv("LEADERBOARD_CAMPAIGN_COLUMN", "")
+            extra_columns = ("author_username", "posted_at") + ((campaign_column,) if campaign_column else ())
+            on_scored = lambda scored: leaderboard.add_many(pipeline_rows(scored))
+
+        pipeline = TweetPipeline(
+            lambda contents: score_tweets(contents, "score"),
+            page_size=int(_get_option("--page-size", os.getenv("PIPELINE_PAGE_SIZE", "500"))),
+            flush_size=int(_get_option("--flush-size", os.getenv("PIPELINE_FLUSH_SIZE", "1000"))),
+            extra_columns=extra_columns,
+            on_scored=on_scored
+        )
+        catch_up = (lambda: catch_up_from_db(leaderboard)) if leaderboard is not None else None
+        try:
+            if "--forever" in sys.argv:
+                pipeline.run_forever(after_pass=catch_up)
+            else:
+                pipeline.run()
+                if catch_up is not None:
+                    catch_up()
+        finally:
+            if leaderboard is not None:
+                leaderboard.checkpoint()
+
+    # Batch mode: a JSON array of tweets (strings or {"content": ...})
+    # as the argument, or on stdin when the argument is omitted or "-"
+    elif len(sys.argv) > 1 and sys.argv[1] == "--analyze-batch":
+        import warnings
+        warnings.filterwarnings("ignore")
+
+        given = len(sys.argv) > 2 and sys.argv[2] != "-" and not sys.argv[2].startswith("--")
+        raw = sys.argv[2] if given else sys.stdin.read()
+        protocol_out = sys.stdout
+        sys.stdout = sys.stderr
+        try:
+            tweets = json.loads(raw)
+            contents = [t["content"] if isinstance(t, dict) else t for t in tweets]
+            profile = check_profile(_get_option("--profile", DEFAULT_PROFILE))
+            output = [public_result(r, profile) for r in score_tweets(contents, profile)]
+        except Exception as e:
+            output = {"error": f"Error: {str(e)}"}
+        sys.stdout = protocol_out
+        print(json.dumps(output))
+
     # Check if called with command line arguments for analysis
-    if len(sys.argv) > 2 and sys.argv[1] == "--analyze-tweet":
+    elif len(sys.argv) > 2 and sys.argv[1] == "--analyze-tweet":
         try:
             # Suppress warnings and other output
             import warnings
@@ -306,18 +404,15 @@ if __name__ == "__main__":
             sys.stderr = open(os.devnull, 'w')
             
             tweet_data = json.loads(sys.argv[2])
-            result = score_tweet_content(tweet_data["content"])
+            profile = check_profile(_get_option("--profile", DEFAULT_PROFILE))
+            result = score_tweet_content(tweet_data["content"], profile)
             
             # Restore stderr
             sys.stderr.close()
             sys.stderr = stderr
             
             # Output JSON result to stdout
-            print(json.dumps({
-                "score": result["score"],
-                "sentiment": result["sentiment"],
-                "explanation": result["explanation"]
-            }))
+            print(json.dumps(public_result(result, profile)))
         except Exception as e:
             # Restore stderr in case of error
             if 'stderr' in locals():
@@ -325,9 +420,10 @@ if __name__ == "__main__":
                 sys.stderr = stderr
             
             print(json.dumps({
-                "score": 0,
-                "sentiment": "Neutral",
-                "explanation": f"Error: {str(e)}"
+                "score": None,
+                "sentiment": None,
+                "explanation": f"Error: {str(e)}",
+                "error": str(e)
             }))
     else:
         # Run the agent normally
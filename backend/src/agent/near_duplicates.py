@@ -0,0 +1,509 @@
+"""
+Near-duplicate tweet index based on 64-bit SimHash.
+
+Templated campaign posts that only differ in handles, hashtags, emojis or
+links canonicalize to almost the same text, so their SimHash signatures
+are within a few bits of each other. Signatures are split into bands
+for LSH lookups: with max_distance + 1 bands, any two signatures within
+max_distance bits share at least one identical band.
+
+Entries are partitioned by namespace (the model and prompt version that
+produced the score), so a prompt or model change never reuses an old
+score, and are evicted by age and LRU like the score cache.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "near_dup_index.sqlite3")
+
+_URL_RE = re.compile(r"https?://\S+|www\.\S+")
+_HANDLE_RE = re.compile(r"[@#$]\w+")
+_NON_WORD_RE = re.compile(r"[^\w\s]|_")
+
+# Popcount of every byte value, for counting differing bits
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Shingle count above which signatures are computed in slices, to bound memory
+_MAX_SHINGLES_PER_PASS = 250_000
+
+# Corpus size above which build() rebuilds the SQLite indexes afterwards
+_BULK_ROWS = 50_000
+
+
+def canonicalize(text: str) -> str:
+    """
+    Strip the parts templated posts vary in: links, handles, hashtags,
+    cashtags, emojis and punctuation
+    """
+    text = _URL_RE.sub(" ", text.lower())
+    text = _HANDLE_RE.sub(" ", text)
+    text = _NON_WORD_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+def _word_hash(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _rotl(values: np.ndarray, bits: int) -> np.ndarray:
+    return (values << np.uint64(bits)) | (values >> np.uint64(64 - bits))
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """
+    splitmix64 finalizer, so combined word hashes spread over all 64 bits
+    """
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def _signatures(word_hashes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    SimHash over word 3-gram shingles (single words for tweets shorter than
+    three words) for texts laid out back to back in `word_hashes`
+    """
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    shingle_counts = np.where(lengths >= 3, lengths - 2, np.maximum(lengths, 1))
+    shingle_offsets = np.concatenate(([0], np.cumsum(shingle_counts)[:-1]))
+
+    # Position of every shingle's first word, and which text it belongs to
+    owners = np.repeat(np.arange(len(lengths)), shingle_counts)
+    positions = starts[owners] + np.arange(shingle_counts.sum()) - shingle_offsets[owners]
+
+    padded = np.concatenate((word_hashes, np.zeros(2, dtype=np.uint64)))
+    trigrams = _mix(
+        padded[positions]
+        ^ _rotl(padded[positions + 1], 21) * np.uint64(0x9E3779B97F4A7C15)
+        ^ _rotl(padded[positions + 2], 42) * np.uint64(0xC2B2AE3D27D4EB4F)
+    )
+    owner_lengths = lengths[owners]
+    shingles = np.where(owner_lengths >= 3, trigrams, padded[positions])
+    shingles = np.where(owner_lengths == 0, np.uint64(0), shingles)
+
+    # (shingles x 64) matrix of 0/1 bits. Each row of 64 one-byte bit
+    # counters is viewed as 8 uint64 lanes, so summing per text only adds
+    # 8 columns; a lane byte never carries while a text has < 256 shingles.
+    bits = np.unpackbits(shingles.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    if shingle_counts.max() < 256:
+        ones = np.add.reduceat(bits.view(np.uint64), shingle_offsets, axis=0).view(np.uint8)
+    else:
+        ones = np.add.reduceat(bits, shingle_offsets, axis=0, dtype=np.int32)
+
+    majority = ones.astype(np.int32) * 2 > shingle_counts[:, None]
+    return np.packbits(majority, axis=1, bitorder="little").view(np.uint64).ravel()
+
+
+def simhash_many(texts: List[str]) -> np.ndarray:
+    """
+    SimHash signatures for many texts at once, as a uint64 array.
+    Only the distinct words are hashed in Python; shingling and bit voting
+    run vectorized over slices of texts.
+    """
+    signatures = np.zeros(len(texts), dtype=np.uint64)
+    word_hashes: Dict[str, int] = {}
+    start = 0
+    while start < len(texts):
+        hashes: List[int] = []
+        lengths: List[int] = []
+        end = start
+        while end < len(texts) and (end == start or len(hashes) < _MAX_SHINGLES_PER_PASS):
+            words = canonicalize(texts[end]).split()
+            for word in words:
+                if word not in word_hashes:
+                    word_hashes[word] = _word_hash(word)
+            hashes.extend(map(word_hashes.__getitem__, words))
+            lengths.append(len(words))
+            end += 1
+
+        signatures[start:end] = _signatures(
+            np.array(hashes, dtype=np.uint64),
+            np.array(lengths, dtype=np.int64)
+        )
+        start = end
+    return signatures
+
+
+def hamming_distances(signature: int, others: np.ndarray) -> np.ndarray:
+    """
+    Number of differing bits between one signature and an array of them
+    """
+    diff = np.bitwise_xor(others, np.uint64(signature))
+    return _POPCOUNT_TABLE[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _grown(values: np.ndarray, capacity: int, used: int) -> np.ndarray:
+    grown = np.zeros(capacity, dtype=values.dtype)
+    grown[:used] = values[:used]
+    return grown
+
+
+class NearDuplicateIndex:
+    """
+    SimHash index of already-scored tweets, persisted to SQLite and
+    updated incrementally.
+
+    Until load() is called, lookups go to SQLite through one expression
+    index per band, so short-lived processes pay nothing up front.
+    Long-lived processes load() the live entries once and answer from
+    memory.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = os.getenv("NEAR_DUP_INDEX_PATH", DEFAULT_INDEX_PATH),
+        max_distance: int = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "3")),
+        max_entries: int = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "300000")),
+        max_age_seconds: float = float(os.getenv("NEAR_DUP_MAX_AGE_DAYS", "30")) * 86400,
+        preload: bool = False,
+    ):
+        self.path = path
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.band_count = max_distance + 1
+        self.band_bits = 64 // self.band_count
+        self._namespaces: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_evict = 0
+        self.hits = 0
+        self._clear()
+        # Without a file the index only ever lives in memory
+        self.loaded = not path
+        if preload:
+            self.load()
+
+    def __len__(self) -> int:
+        if self.loaded:
+            return self._size - self._dead
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM near_duplicates").fetchone()[0]
+
+    def _clear(self) -> None:
+        self.signatures = np.zeros(0, dtype=np.uint64)
+        self.namespace_ids = np.zeros(0, dtype=np.int32)
+        self.created = np.zeros(0, dtype=np.float64)
+        self.row_ids = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.results: List[Dict[str, Any]] = []
+        self._size = 0
+        self._dead = 0
+        self._row_slots: Dict[int, int] = {}
+        self._bands: List[Dict[int, List[int]]] = [{} for _ in range(self.band_count)]
+
+    def _namespace_id(self, namespace: str) -> int:
+        return self._namespaces.setdefault(namespace, len(self._namespaces))
+
+    def _band_values(self, signatures: np.ndarray) -> np.ndarray:
+        """
+        (bands x n) array of the band slices of each signature
+        """
+        mask = np.uint64((1 << self.band_bits) - 1)
+        shifts = np.arange(self.band_count, dtype=np.uint64) * np.uint64(self.band_bits)
+        return (signatures[None, :] >> shifts[:, None]) & mask
+
+    def _band_expressions(self) -> List[str]:
+        """
+        The same band slices as SQL over the stored (signed) signature
+        """
+        mask = (1 << self.band_bits) - 1
+        return [f"((signature >> {band * self.band_bits}) & {mask})" for band in range(self.band_count)]
+
+    def _index(
+        self,
+        signatures: np.ndarray,
+        namespace_ids: np.ndarray,
+        created: np.ndarray,
+        row_ids: np.ndarray,
+        results: List[Dict[str, Any]],
+    ) -> None:
+        start = self._size
+        needed = start + len(signatures)
+        if needed > len(self.signatures):
+            capacity = max(needed, 2 * len(self.signatures), 1024)
+            self.signatures = _grown(self.signatures, capacity, start)
+            self.namespace_ids = _grown(self.namespace_ids, capacity, start)
+            self.created = _grown(self.created, capacity, start)
+            self.row_ids = _grown(self.row_ids, capacity, start)
+            self.alive = _grown(self.alive, capacity, start)
+        self.signatures[start:needed] = signatures
+        self.namespace_ids[start:needed] = namespace_ids
+        self.created[start:needed] = created
+        self.row_ids[start:needed] = row_ids
+        self.alive[start:needed] = True
+        self.results.extend(results)
+        self._size = needed
+
+        for offset, row_id in enumerate(row_ids.tolist()):
+            if row_id >= 0:
+                self._row_slots[row_id] = start + offset
+        for band, values in zip(self._bands, self._band_values(signatures).tolist()):
+            for offset, value in enumerate(values):
+                band.setdefault(value, []).append(start + offset)
+
+    def _compact(self) -> None:
+        """
+        Rebuild the in-memory index without its evicted entries
+        """
+        keep = np.flatnonzero(self.alive[:self._size])
+        arrays = [a[keep] for a in (self.signatures, self.namespace_ids, self.created, self.row_ids)]
+        results = [self.results[i] for i in keep.tolist()]
+        self._clear()
+        self._index(*arrays, results)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS near_duplicates (
+                    id INTEGER PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    signature INTEGER NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._create_indexes(conn)
+            self._conn = conn
+        return self._conn
+
+    def _index_names(self) -> List[str]:
+        return ["near_duplicates_accessed_at"] + [
+            f"near_duplicates_band_{self.band_bits}_{band}" for band in range(self.band_count)
+        ]
+
+    def _create_indexes(self, conn: sqlite3.Connection) -> None:
+        names = self._index_names()
+        columns = ["accessed_at"] + self._band_expressions()
+        for name, column in zip(names, columns):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON near_duplicates ({column})")
+        conn.commit()
+
+    def load(self) -> None:
+        """
+        Read the live entries into memory and answer lookups from there
+        from now on
+        """
+        with self._lock:
+            if self.loaded:
+                return
+            rows = self._connect().execute(
+                "SELECT id, namespace, signature, result, created_at FROM near_duplicates "
+                "WHERE created_at >= ? ORDER BY id",
+                (time.time() - self.max_age_seconds,)
+            ).fetchall()
+            if rows:
+                self._index(
+                    # SQLite integers are signed; signatures are stored bit-for-bit
+                    np.array([r[2] for r in rows], dtype=np.int64).view(np.uint64),
+                    np.array([self._namespace_id(r[1]) for r in rows], dtype=np.int32),
+                    np.array([r[4] for r in rows], dtype=np.float64),
+                    np.array([r[0] for r in rows], dtype=np.int64),
+                    [json.loads(r[3]) for r in rows]
+                )
+            self.loaded = True
+
+    def _query_memory(
+        self,
+        signatures: np.ndarray,
+        namespaces: Optional[List[str]],
+        oldest: float,
+    ) -> List[Optional[Tuple[Dict[str, Any], int, int]]]:
+        allowed = None
+        if namespaces is not None:
+            allowed = np.array([self._namespaces[n] for n in namespaces if n in self._namespaces], dtype=np.int32)
+
+        matches: List[Optional[Tuple[Dict[str, Any], int, int]]] = []
+        band_values = self._band_values(signatures).T.tolist()
+        for signature, values in zip(signatures.tolist(), band_values):
+            candidates = set()
+            for band, value in zip(self._bands, values):
+                candidates.update(band.get(value, ()))
+            ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            ids = ids[self.alive[ids] & (self.created[ids] >= oldest)]
+            if allowed is not None:
+                ids = ids[np.isin(self.namespace_ids[ids], allowed)]
+            if len(ids) == 0:
+                matches.append(None)
+                continue
+
+            distances = hamming_distances(signature, self.signatures[ids])
+            best = int(np.argmin(distances))
+            if distances[best] <= self.max_distance:
+                slot = int(ids[best])
+                matches.append((self.results[slot], int(distances[best]), int(self.row_ids[slot])))
+            else:
+                matches.append(None)
+        return matches
+
+    def _query_disk(
+        self,
+        signatures: np.ndarray,
+        namespaces: Optional[List[str]],
+        oldest: float,
+    ) -> List[Optional[Tuple[Dict[str, Any], int, int]]]:
+        conditions = "created_at >= ?"
+        if namespaces is not None:
+            conditions += f" AND namespace IN ({','.join('?' * len(namespaces))})"
+        sql = " UNION ".join(
+            f"SELECT id, signature, result FROM near_duplicates WHERE {expression} = ? AND {conditions}"
+            for expression in self._band_expressions()
+        )
+
+        conn = self._connect()
+        matches: List[Optional[Tuple[Dict[str, Any], int, int]]] = []
+        band_values = self._band_values(signatures).T.tolist()
+        for signature, values in zip(signatures.tolist(), band_values):
+            params: List[Any] = []
+            for value in values:
+                params += [value, oldest] + (namespaces or [])
+            rows = conn.execute(sql, params).fetchall()
+            if not rows:
+                matches.append(None)
+                continue
+
+            stored = np.array([r[1] for r in rows], dtype=np.int64).view(np.uint64)
+            distances = hamming_distances(signature, stored)
+            best = int(np.argmin(distances))
+            if distances[best] <= self.max_distance:
+                row_id, _, result = rows[best]
+                matches.append((json.loads(result), int(distances[best]), row_id))
+            else:
+                matches.append(None)
+        return matches
+
+    def query_many(
+        self,
+        signatures: np.ndarray,
+        namespaces: Optional[List[str]] = None,
+    ) -> List[Optional[Tuple[Dict[str, Any], int]]]:
+        """
+        For each signature, the stored result of the closest live tweet
+        within max_distance bits in one of `namespaces` (any namespace
+        when None), with its distance, or None
+        """
+        oldest = time.time() - self.max_age_seconds
+        with self._lock:
+            if self.loaded:
+                found = self._query_memory(signatures, namespaces, oldest)
+            else:
+                found = self._query_disk(signatures, namespaces, oldest)
+
+            now = time.time()
+            touched = [(now, m[2]) for m in found if m is not None and m[2] >= 0]
+            self.hits += sum(1 for m in found if m is not None)
+            if touched and self.path:
+                conn = self._connect()
+                conn.executemany("UPDATE near_duplicates SET accessed_at = ? WHERE id = ?", touched)
+                conn.commit()
+        return [(m[0], m[1]) if m is not None else None for m in found]
+
+    def add_many(self, signatures: np.ndarray, results: List[Dict[str, Any]], namespace: str = "") -> None:
+        """
+        Index newly scored tweets and append them to the persisted store
+        """
+        if len(signatures) == 0:
+            return
+        now = time.time()
+        with self._lock:
+            row_ids = np.full(len(signatures), -1, dtype=np.int64)
+            if self.path:
+                conn = self._connect()
+                # Under the write lock new rows get consecutive ids after
+                # the current maximum
+                conn.execute("BEGIN IMMEDIATE")
+                (last_id,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM near_duplicates").fetchone()
+                conn.executemany(
+                    "INSERT INTO near_duplicates (namespace, signature, result, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (namespace, signature, json.dumps(result), now, now)
+                        for signature, result in zip(signatures.view(np.int64).tolist(), results)
+                    )
+                )
+                conn.commit()
+                row_ids = np.arange(last_id + 1, last_id + 1 + len(signatures), dtype=np.int64)
+                self._writes_since_evict += len(signatures)
+
+            if self.loaded:
+                self._index(
+                    signatures,
+                    np.full(len(signatures), self._namespace_id(namespace), dtype=np.int32),
+                    np.full(len(signatures), now),
+                    row_ids,
+                    list(results)
+                )
+            if self.path and self._writes_since_evict >= 1000:
+                self._evict(self._connect())
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        self._writes_since_evict = 0
+        deleted = conn.execute(
+            "DELETE FROM near_duplicates WHERE created_at < ? RETURNING id",
+            (time.time() - self.max_age_seconds,)
+        ).fetchall()
+        (count,) = conn.execute("SELECT COUNT(*) FROM near_duplicates").fetchone()
+        if count > self.max_entries:
+            deleted += conn.execute(
+                "DELETE FROM near_duplicates WHERE id IN "
+                "(SELECT id FROM near_duplicates ORDER BY accessed_at ASC LIMIT ?) RETURNING id",
+                (count - self.max_entries,)
+            ).fetchall()
+        conn.commit()
+
+        if self.loaded:
+            for (row_id,) in deleted:
+                slot = self._row_slots.pop(row_id, None)
+                if slot is not None:
+                    self.alive[slot] = False
+                    self._dead += 1
+            if self._dead > self._size // 2:
+                self._compact()
+
+    def evict(self) -> None:
+        """
+        Drop expired entries and trim the index down to max_entries
+        """
+        if not self.path:
+            return
+        with self._lock:
+            self._evict(self._connect())
+
+    def build(self, texts: List[str], results: List[Dict[str, Any]], namespace: str = "") -> None:
+        """
+        Bulk-index an existing scored corpus. Large corpora are loaded
+        with the lookup indexes dropped and rebuilt afterwards, which is
+        several times faster than maintaining them row by row.
+        """
+        signatures = simhash_many(texts)
+        bulk = bool(self.path) and len(signatures) >= _BULK_ROWS
+        if bulk:
+            with self._lock:
+                conn = self._connect()
+                for name in self._index_names():
+                    conn.execute(f"DROP INDEX IF EXISTS {name}")
+                conn.commit()
+        try:
+            self.add_many(signatures, results, namespace)
+        finally:
+            if bulk:
+                with self._lock:
+                    self._create_indexes(self._connect())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,169 @@
+"""
+Persistent, content-addressed cache of tweet scores.
+
+Entries are keyed on the normalized tweet text, the model name and a hash
+of the prompts, so changing a prompt or model naturally misses the old
+entries. Stored in SQLite with age- and size-based LRU eviction.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from metrics import metrics
+from tweet_prompts import DEFAULT_PROFILE, prompt_version
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "score_cache.sqlite3")
+
+# SQLite limits the number of bound parameters per statement
+_SQL_CHUNK = 500
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize tweet text so trivially different copies share a cache key
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(text: str, model: str, profile: str = DEFAULT_PROFILE) -> str:
+    """
+    Content address of a tweet for a given model and prompt version
+    """
+    raw = f"{model}\0{prompt_version(profile)}\0{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    """
+    SQLite-backed score cache with hit/miss counters
+    """
+
+    def __init__(
+        self,
+        path: str = os.getenv("SCORE_CACHE_PATH", DEFAULT_CACHE_PATH),
+        max_entries: int = int(os.getenv("SCORE_CACHE_MAX_ENTRIES", "500000")),
+        max_age_seconds: float = float(os.getenv("SCORE_CACHE_MAX_AGE_DAYS", "30")) * 86400,
+        enabled: bool = os.getenv("SCORE_CACHE_BYPASS", "") not in ("1", "true", "yes"),
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS scores (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS scores_accessed_at ON scores (accessed_at)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Look up many keys at once; returns only the keys that hit
+        """
+        if not self.enabled or not keys:
+            return {}
+
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        oldest = now - self.max_age_seconds
+        found: Dict[str, Dict[str, Any]] = {}
+
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(unique), _SQL_CHUNK):
+                chunk = unique[start:start + _SQL_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, result FROM scores WHERE key IN ({placeholders}) AND created_at >= ?",
+                    (*chunk, oldest)
+                ).fetchall()
+                for key, result in rows:
+                    found[key] = json.loads(result)
+
+            if found:
+                conn.executemany(
+                    "UPDATE scores SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                conn.commit()
+
+        hits = sum(1 for key in keys if key in found)
+        metrics.inc("cache_lookups_total", hits, result="hit")
+        metrics.inc("cache_lookups_total", len(keys) - hits, result="miss")
+        return found
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        Store (key, result) pairs, evicting old entries every so often
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        rows = [(key, json.dumps(result), now, now) for key, result in items]
+        if not rows:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO scores (key, result, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+            self._writes_since_evict += len(rows)
+            if self._writes_since_evict >= 1000:
+                self._evict(conn)
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        self.put_many([(key, result)])
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        self._writes_since_evict = 0
+        conn.execute("DELETE FROM scores WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM scores").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        conn.commit()
+
+    def evict(self) -> None:
+        """
+        Drop expired entries and trim the cache down to max_entries
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._evict(self._connect())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,218 @@
+"""
+Cheap stages that run before GPT scoring.
+
+Given a list of tweets, the cascade answers as many as it can without a
+GPT call (exact cache hits, near-duplicates of already-scored tweets,
+repeats within the same request, confident local scores) and hands back
+only the distinct tweets that still need GPT. Once those are scored, complete() fans the
+results out and remembers them for next time.
+"""
+import os
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from local_scorer import LocalScorer
+from metrics import metrics
+from near_duplicates import NearDuplicateIndex, canonicalize, simhash_many
+from score_cache import ScoreCache, cache_key
+from tweet_prompts import DEFAULT_PROFILE, MODEL, PROFILE_FIELDS, prompt_version
+
+
+class PendingTweet(NamedTuple):
+    """
+    A distinct tweet that still needs GPT, and every input position
+    (exact or near-duplicate copies) that shares its result
+    """
+    key: str
+    text: str
+    indexes: List[int]
+    duplicate_keys: List[str]
+    signature: Optional[int]
+    namespace: str
+
+
+def _stored(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The part of a GPT result worth remembering
+    """
+    return {
+        field: result[field]
+        for field in ("score", "sentiment", "explanation")
+        if field in result
+    }
+
+
+class ScoringCascade:
+    """
+    Score cache, near-duplicate index and local scorer in front of GPT
+    """
+
+    def __init__(
+        self,
+        cache: ScoreCache,
+        near_dups: Optional[NearDuplicateIndex] = None,
+        local: Optional[LocalScorer] = None,
+        model: str = MODEL,
+        near_dup_min_words: int = int(os.getenv("NEAR_DUP_MIN_WORDS", "5")),
+    ):
+        self.cache = cache
+        self.near_dups = near_dups
+        self.local = local
+        self.model = model
+        self.near_dup_min_words = near_dup_min_words
+
+    def namespace(self, profile: str = DEFAULT_PROFILE) -> str:
+        """
+        Near-duplicate namespace of the scores made by this model with
+        this profile's prompts
+        """
+        return f"{self.model}:{prompt_version(profile)}"
+
+    def resolve(
+        self,
+        tweets: List[str],
+        profile: str = DEFAULT_PROFILE,
+    ) -> Tuple[List[Optional[Dict[str, Any]]], List[PendingTweet]]:
+        """
+        Answer what can be answered without GPT. Returns the per-tweet
+        results (None where GPT is still needed) and the pending tweets.
+        """
+        with metrics.time("cache_lookup"):
+            keys = [cache_key(t, self.model, profile) for t in tweets]
+            cached = self.cache.get_many(keys)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(tweets)
+        # Identical tweets within the request are only sent to GPT once
+        misses: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            if key in cached:
+                results[i] = dict(cached[key], gpt_response=None, cached=True)
+            else:
+                misses.setdefault(key, []).append(i)
+        metrics.inc("tweets_total", len(tweets) - sum(map(len, misses.values())), source="cache")
+
+        miss_keys = list(misses)
+        namespace = self.namespace(profile)
+        if self.near_dups is None or not miss_keys:
+            pending = [
+                PendingTweet(key, tweets[misses[key][0]], misses[key], [], None, namespace)
+                for key in miss_keys
+            ]
+            return results, self._score_locally(results, pending)
+
+        # Very short tweets carry too little text for similarity to mean much
+        texts = [tweets[misses[key][0]] for key in miss_keys]
+        eligible = [
+            j for j, text in enumerate(texts)
+            if len(canonicalize(text).split()) >= self.near_dup_min_words
+        ]
+        signatures: List[Optional[int]] = [None] * len(miss_keys)
+        if eligible:
+            # Only scores from the current model and prompts count; a
+            # profile with more fields can answer a smaller one
+            fields = set(PROFILE_FIELDS[profile])
+            namespaces = [
+                self.namespace(other)
+                for other, other_fields in PROFILE_FIELDS.items()
+                if fields <= set(other_fields)
+            ]
+            with metrics.time("near_duplicate_lookup"):
+                computed = simhash_many([texts[j] for j in eligible])
+                for j, signature in zip(eligible, computed.tolist()):
+                    signatures[j] = signature
+                matches = self.near_dups.query_many(computed, namespaces)
+        else:
+            matches = []
+        matched = {j: match for j, match in zip(eligible, matches) if match is not None}
+
+        # Group the remaining near-duplicates within this request
+        local = NearDuplicateIndex(path=None, max_distance=self.near_dups.max_distance)
+        pending: List[PendingTweet] = []
+        for j, key in enumerate(miss_keys):
+            if j in matched:
+                result, distance = matched[j]
+                metrics.inc("tweets_total", len(misses[key]), source="near_duplicate")
+                for i in misses[key]:
+                    results[i] = dict(result, gpt_response=None, near_duplicate=True, distance=distance)
+                continue
+
+            signature = signatures[j]
+            if signature is not None:
+                signature_array = np.array([signature], dtype=np.uint64)
+                (local_match,) = local.query_many(signature_array)
+                if local_match is not None:
+                    leader = pending[local_match[0]["pending"]]
+                    leader.duplicate_keys.append(key)
+                    leader.indexes.extend(misses[key])
+                    continue
+                local.add_many(signature_array, [{"pending": len(pending)}])
+
+            pending.append(PendingTweet(key, texts[j], list(misses[key]), [], signature, namespace))
+
+        return results, self._score_locally(results, pending)
+
+    def _score_locally(
+        self,
+        results: List[Optional[Dict[str, Any]]],
+        pending: List[PendingTweet],
+    ) -> List[PendingTweet]:
+        """
+        Resolve the pending tweets the local scorer is confident about and
+        return the ones that still need GPT
+        """
+        if self.local is None or not pending:
+            return pending
+
+        with metrics.time("local_score"):
+            predicted = self.local.predict([item.text for item in pending])
+        remaining = []
+        for item, result in zip(pending, predicted):
+            if result is None:
+                remaining.append(item)
+                continue
+            metrics.inc("tweets_total", len(item.indexes), source="local")
+            for i in item.indexes:
+                results[i] = result
+        return remaining
+
+    def complete(
+        self,
+        results: List[Optional[Dict[str, Any]]],
+        pending: List[PendingTweet],
+        scored: List[Dict[str, Any]],
+    ) -> None:
+        """
+        Fill in the GPT results for the pending tweets and remember the
+        successful ones. Failed analyses are not stored so they get
+        another chance later.
+        """
+        to_cache = []
+        to_index: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+        for item, result in zip(pending, scored):
+            for i in item.indexes:
+                results[i] = result
+
+            if result.get("error"):
+                # Failed analyses come back without a score (they used to
+                # be reported as a neutral 0)
+                metrics.inc("tweets_total", len(item.indexes), source="failed")
+                metrics.inc("failed_scores_total", len(item.indexes))
+                continue
+            metrics.inc("tweets_total", len(item.indexes), source="gpt")
+            if result.get("gpt_response") is None:
+                continue
+            stored = _stored(result)
+            to_cache.append((item.key, stored))
+            to_cache.extend((key, stored) for key in item.duplicate_keys)
+            if item.signature is not None:
+                to_index.setdefault(item.namespace, []).append((item.signature, stored))
+
+        self.cache.put_many(to_cache)
+        if self.near_dups is not None:
+            for namespace, entries in to_index.items():
+                self.near_dups.add_many(
+                    np.array([s for s, _ in entries], dtype=np.uint64),
+                    [r for _, r in entries],
+                    namespace
+                )
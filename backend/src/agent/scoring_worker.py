@@ -0,0 +1,177 @@
+"""
+Long-lived scoring worker for the Twitter scorer agent.
+
+Instead of spawning one Python process per tweet, the Node side keeps a
+single worker alive and talks to it with JSON lines:
+
+    request:  {"id": "42", "content": "tweet text"}
+    response: {"id": "42", "score": 73, "sentiment": "Positive", ...}
+
+{"op": "ping"} and {"op": "metrics"} are answered without scoring.
+
+Responses may come back out of order (requests are handled by a small
+thread pool), so callers must match them to requests by "id".
+"""
+import json
+import os
+import socketserver
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, TextIO
+
+from metrics import metrics
+
+Handler = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def handle_line(handle: Handler, line: str) -> Dict[str, Any]:
+    """
+    Decode one JSON request line and run it through the handler
+    """
+    request_id = None
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("Request must be a JSON object")
+        request_id = request.get("id")
+
+        if request.get("op") == "ping":
+            return {"id": request_id, "ok": True, "pid": os.getpid()}
+        if request.get("op") == "metrics":
+            return dict(metrics.snapshot(), id=request_id)
+
+        response = handle(request)
+    except Exception as e:
+        response = {"error": str(e)}
+
+    response["id"] = request_id
+    return response
+
+
+def serve_lines(handle: Handler, lines, out: TextIO, workers: int = 4) -> None:
+    """
+    Read JSON-lines requests from an iterable and write JSON-lines responses
+    to `out` as each one completes
+    """
+    write_lock = threading.Lock()
+
+    def process(line: str):
+        response = handle_line(handle, line)
+        payload = json.dumps(response) + "\n"
+        with write_lock:
+            out.write(payload)
+            out.flush()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for line in lines:
+            if line.strip():
+                pool.submit(process, line)
+
+
+def serve_stdio(handle: Handler, workers: int = 4) -> None:
+    """
+    Serve JSON-lines requests on stdin/stdout until stdin is closed
+    """
+    # Keep the protocol stream clean: anything else that prints
+    # (warnings, error logging) goes to stderr instead of stdout
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    try:
+        serve_lines(handle, sys.stdin, protocol_out, workers)
+    finally:
+        sys.stdout = protocol_out
+
+
+def serve_unix(handle: Handler, path: str, workers: int = 4) -> None:
+    """
+    Serve the JSON-lines protocol on a Unix domain socket, one stream per
+    connection
+    """
+    score = handle
+    if os.path.exists(path):
+        os.unlink(path)
+
+    class LineHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            out = self.wfile
+
+            class _Writer:
+                def write(self, data: str):
+                    out.write(data.encode("utf-8"))
+
+                def flush(self):
+                    out.flush()
+
+            lines = (raw.decode("utf-8") for raw in self.rfile)
+            serve_lines(score, lines, _Writer(), workers)
+
+    with socketserver.ThreadingUnixStreamServer(path, LineHandler) as server:
+        print(f"Scoring worker listening on unix socket {path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+def serve_http(handle: Handler, host: str = "127.0.0.1", port: int = 8765) -> None:
+    """
+    Serve scoring requests over local HTTP:
+    POST /score with a single request object or a list of them,
+    GET /metrics (Prometheus text) or /metrics.json
+    """
+
+    class ScoreHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, body: Any):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"ok": True, "pid": os.getpid()})
+            elif self.path == "/metrics.json":
+                self._send_json(200, metrics.snapshot())
+            elif self.path == "/metrics":
+                payload = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send_json(404, {"error": "Not found"})
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length).decode("utf-8")
+            try:
+                request = json.loads(body)
+            except json.JSONDecodeError as e:
+                self._send_json(400, {"error": f"Invalid JSON: {e}"})
+                return
+
+            if isinstance(request, list):
+                self._send_json(200, [handle_line(handle, json.dumps(r)) for r in request])
+            else:
+                self._send_json(200, handle_line(handle, body))
+
+        def log_message(self, format, *args):
+            # Keep per-request access logs out of the way
+            pass
+
+    server = ThreadingHTTPServer((host, port), ScoreHandler)
+    print(f"Scoring worker listening on http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,8 @@
+"""
+The agent modules import each other by bare name, as when run from
+backend/src/agent
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
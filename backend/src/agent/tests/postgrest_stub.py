@@ -0,0 +1,206 @@
+"""
+Local stand-in for PostgREST over SQLite, for testing the pipeline
+without a database server.
+
+Covers the subset of the PostgREST API the pipeline uses: GET with
+select/order/limit, exact counts and eq, neq, gt, lt, is.null, in.(...),
+not.* and or=(...) filters, PATCH with the same filters (optionally returning the
+updated rows), and the score_claimed_tweets() function. Every request runs as
+one SQL statement under a lock, like a single-statement transaction in
+Postgres. Writes can be made to fail with fail_next().
+"""
+import json
+import sqlite3
+import threading
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+SCHEMA = """CREATE TABLE collected_tweets (
+    id INTEGER PRIMARY KEY,
+    text TEXT,
+    full_text TEXT,
+    author_username TEXT NOT NULL,
+    posted_at TEXT,
+    score REAL,
+    scoring_claimed_by TEXT,
+    scoring_claimed_at TEXT
+)"""
+
+_OPERATORS = {"eq": "=", "neq": "<>", "gt": ">", "lt": "<", "gte": ">=", "lte": "<="}
+_RESERVED = ("select", "order", "limit", "on_conflict")
+
+
+def _condition(column: str, expression: str) -> Tuple[str, List[Any]]:
+    operator, _, value = expression.partition(".")
+    if operator == "not":
+        sql, args = _condition(column, value)
+        return f"NOT ({sql})", args
+    if operator == "is" and value == "null":
+        return f"{column} IS NULL", []
+    if operator == "in":
+        values = [v for v in value.strip("()").split(",") if v]
+        return f"{column} IN ({','.join('?' * len(values))})", values
+    return f"{column} {_OPERATORS[operator]} ?", [value]
+
+
+def _where(params: List[Tuple[str, str]]) -> Tuple[str, List[Any]]:
+    clauses: List[str] = []
+    args: List[Any] = []
+    for key, value in params:
+        if key in _RESERVED:
+            continue
+        if key == "or":
+            parts = []
+            for term in value.strip("()").split(","):
+                column, _, expression = term.partition(".")
+                sql, term_args = _condition(column, expression)
+                parts.append(sql)
+                args.extend(term_args)
+            clauses.append("(" + " OR ".join(parts) + ")")
+        else:
+            sql, term_args = _condition(key, value)
+            clauses.append(sql)
+            args.extend(term_args)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+
+class PostgrestStub:
+    """
+    Serves the stand-in on a free local port; `url` is its base URL
+    """
+
+    def __init__(self, rpc: bool = True):
+        self.db = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        self.db.execute(SCHEMA)
+        self.rpc = rpc
+        self.requests: Counter = Counter()
+        self.lock = threading.Lock()
+        self._failures: List[Tuple[str, int]] = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def insert(self, rows: List[Dict[str, Any]]) -> None:
+        with self.lock:
+            for row in rows:
+                columns = ",".join(row)
+                self.db.execute(
+                    f"INSERT INTO collected_tweets ({columns}) VALUES ({','.join('?' * len(row))})",
+                    list(row.values())
+                )
+
+    def rows(self) -> Dict[int, Dict[str, Any]]:
+        with self.lock:
+            cursor = self.db.execute("SELECT * FROM collected_tweets ORDER BY id")
+            columns = [c[0] for c in cursor.description]
+            return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+
+    def execute(self, sql: str, args: Tuple[Any, ...] = ()) -> None:
+        with self.lock:
+            self.db.execute(sql, args)
+
+    def fail_next(self, method: str, count: int = 1, status: int = 503) -> None:
+        """
+        Answer the next `count` requests with this method with `status`
+        """
+        self._failures.extend([(method, status)] * count)
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: Any = None, headers: Optional[Dict[str, str]] = None):
+                payload = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _parse(self) -> Tuple[str, List[Tuple[str, str]], Any]:
+                url = urllib.parse.urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                return url.path.strip("/"), urllib.parse.parse_qsl(url.query), body
+
+            def _injected_failure(self) -> bool:
+                for i, (method, status) in enumerate(stub._failures):
+                    if method == self.command:
+                        del stub._failures[i]
+                        self._send(status, {"message": "injected failure"})
+                        return True
+                return False
+
+            def do_GET(self):
+                table, params, _ = self._parse()
+                stub.requests["GET"] += 1
+                options = dict(params)
+                where, args = _where(params)
+                columns = options.get("select", "*")
+                sql = f"SELECT {columns} FROM {table}{where} ORDER BY id"
+                if "limit" in options:
+                    sql += f" LIMIT {int(options['limit'])}"
+                headers = {}
+                with stub.lock:
+                    cursor = stub.db.execute(sql, args)
+                    names = [c[0] for c in cursor.description]
+                    rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+                    if "count=exact" in self.headers.get("Prefer", ""):
+                        total = stub.db.execute(f"SELECT count(*) FROM {table}{where}", args).fetchone()[0]
+                        headers["Content-Range"] = f"0-{len(rows) - 1}/{total}" if rows else f"*/{total}"
+                self._send(200, rows, headers)
+
+            def do_PATCH(self):
+                table, params, body = self._parse()
+                stub.requests["PATCH"] += 1
+                if self._injected_failure():
+                    return
+                where, args = _where(params)
+                returning = dict(params).get("select", "id")
+                assignments = ",".join(f"{column} = ?" for column in body)
+                with stub.lock:
+                    cursor = stub.db.execute(
+                        f"UPDATE {table} SET {assignments}{where} RETURNING {returning}",
+                        list(body.values()) + args
+                    )
+                    names = [c[0] for c in cursor.description]
+                    rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+                if "return=representation" in self.headers.get("Prefer", ""):
+                    self._send(200, rows)
+                else:
+                    self._send(204)
+
+            def do_POST(self):
+                path, _, body = self._parse()
+                stub.requests["POST"] += 1
+                if path != "rpc/score_claimed_tweets" or not stub.rpc:
+                    self._send(404, {"code": "PGRST202", "message": f"Could not find the function {path}"})
+                    return
+                if self._injected_failure():
+                    return
+                with stub.lock:
+                    stub.db.execute("BEGIN")
+                    updated = []
+                    for item in body["scores"]:
+                        updated += stub.db.execute(
+                            """UPDATE collected_tweets
+                            SET score = ?, scoring_claimed_by = NULL, scoring_claimed_at = NULL
+                            WHERE id = ? AND scoring_claimed_by = ? RETURNING id""",
+                            (item["score"], item["id"], body["worker"])
+                        ).fetchall()
+                    stub.db.execute("COMMIT")
+                self._send(200, [{"id": row[0]} for row in updated])
+
+        return Handler
@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from job_queue import BACKFILL_PRIORITY, FRESH_PRIORITY, JobQueue, QueueWorker
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2, visibility_timeout=60, retry_delay=60)
+    yield queue
+    queue.close()
+
+
+def status_of(queue, tweet_id):
+    return queue._connect().execute("SELECT status, attempts FROM jobs WHERE tweet_id = ?", (tweet_id,)).fetchone()
+
+
+def test_lease_hands_out_highest_priority_first_and_only_once(queue):
+    queue.enqueue([{"tweet_id": 1, "content": "old"}], fresh=False)
+    queue.enqueue([{"tweet_id": 2, "content": "new"}, {"tweet_id": 3, "content": "newer"}])
+
+    first = queue.lease("a", 2)
+    second = queue.lease("b", 2)
+
+    assert [job.tweet_id for job in first] == ["2", "3"]
+    assert [job.priority for job in first] == [FRESH_PRIORITY, FRESH_PRIORITY]
+    assert [(job.tweet_id, job.priority) for job in second] == [("1", BACKFILL_PRIORITY)]
+    assert queue.lease("c", 10) == []
+
+
+def test_enqueue_keeps_one_job_at_the_higher_priority(queue):
+    queue.enqueue([{"tweet_id": 1, "content": "a"}], fresh=False)
+    queue.enqueue([{"tweet_id": 1, "content": "a"}], fresh=True)
+
+    (job,) = queue.lease("a", 10)
+    assert job.priority == FRESH_PRIORITY
+    assert queue.stats()["leased"] == 1
+
+
+def test_jobs_default_to_the_score_profile(queue):
+    queue.enqueue([{"tweet_id": 1, "content": "a"}])
+    (job,) = queue.lease("a", 1)
+    assert job.profile == "score"
+
+
+def test_expired_lease_goes_back_to_the_queue(queue):
+    queue.enqueue([{"tweet_id": 1, "content": "a"}])
+    (job,) = queue.lease("a", 1, visibility_timeout=0)
+
+    (again,) = queue.lease("b", 1)
+    assert again.id == job.id
+    assert again.attempts == 2
+
+    # The first worker lost its lease, so its late result is ignored
+    queue.complete("a", [(job.id, {"score": 1})])
+    assert status_of(queue, "1") == ("leased", 2)
+    queue.complete("b", [(job.id, {"score": 1})])
+    assert status_of(queue, "1") == ("done", 2)
+
+
+def test_extend_keeps_the_lease(queue):
+    queue.enqueue([{"tweet_id": 1, "content": "a"}])
+    (job,) = queue.lease("a", 1, visibility_timeout=0)
+    queue.extend("a", [job.id], visibility_timeout=60)
+    assert queue.lease("b", 1) == []
+
+
+def test_expired_lease_without_attempts_left_is_dead_lettered(queue):
+    queue.enqueue([{"tweet_id": 1, "content": "a"}])
+    queue.lease("a", 1, visibility_timeout=0)
+    queue.lease("b", 1, visibility_timeout=0)
+
+    assert queue.lease("c", 1) == []
+    assert status_of(queue, "1") == ("dead", 2)
+
+
+def test_failed_jobs_back_off_then_dead_letter(queue):
+    queue.enqueue([{"tweet_id": 1, "content": "a"}])
+    (job,) = queue.lease("a", 1)
+    queue.fail("a", [(job, "boom")])
+
+    assert status_of(queue, "1") == ("queued", 1)
+    assert queue.lease("a", 1) == []
+
+    queue._connect().execute("UPDATE jobs SET available_at = ?", (time.time(),))
+    (job,) = queue.lease("a", 1)
+    queue.fail("a", [(job, "boom")])
+    assert status_of(queue, "1") == ("dead", 2)
+
+    assert queue.requeue_dead() == 1
+    assert status_of(queue, "1") == ("queued", 0)
+
+
+def test_done_jobs_are_only_requeued_with_rescore(queue):
+    queue.enqueue([{"tweet_id": 1, "content": "a"}, {"tweet_id": 2, "content": "b"}])
+    first, second = queue.lease("a", 2)
+    queue.complete("a", [(first.id, {"score": 1})])
+    queue.enqueue([{"tweet_id": 3, "content": "c"}])
+    (leased,) = queue.lease("b", 1)
+
+    assert queue.enqueue([{"tweet_id": 1, "content": "a"}]) == 0
+    assert status_of(queue, "1") == ("done", 1)
+
+    written = queue.enqueue([{"tweet_id": i, "content": "new"} for i in (1, 2, 3)], rescore=True)
+    # Job 2 and 3 are still leased and are left alone
+    assert written == 1
+    assert status_of(queue, "1") == ("queued", 0)
+    assert status_of(queue, "2") == ("leased", 1)
+    (job,) = queue.lease("c", 10)
+    assert (job.tweet_id, job.content) == ("1", "new")
+
+
+class FakeEngine:
+    limiter = SimpleNamespace(fraction=1.0, requests=SimpleNamespace(blocked_until=0.0))
+    concurrency = 2
+
+    async def score_many(self, contents, profile="score"):
+        return [{"score": len(content)} for content in contents]
+
+
+def test_worker_writes_results_off_the_event_loop(queue):
+    queue.enqueue([{"tweet_id": 1, "content": "a"}, {"tweet_id": 2, "content": "bb"}])
+    written = []
+
+    def on_results(done):
+        written.append((threading.get_ident(), [(job.tweet_id, result["score"]) for job, result in done]))
+
+    async def run():
+        await QueueWorker(queue, FakeEngine(), on_results=on_results).run(drain=True)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    ((thread, results),) = written
+    assert thread != loop_thread
+    assert sorted(results) == [("1", 1), ("2", 2)]
+    assert queue.stats()["done"] == 2
+
+
+def test_heartbeat_keeps_extending_after_an_error(tmp_path):
+    class FlakyQueue(JobQueue):
+        calls = 0
+
+        def extend(self, worker_id, job_ids, visibility_timeout=None):
+            self.calls += 1
+            if self.calls == 1:
+                raise RuntimeError("database is locked")
+
+    queue = FlakyQueue(str(tmp_path / "jobs.sqlite3"), visibility_timeout=0.03)
+    worker = QueueWorker(queue, FakeEngine())
+    worker._in_flight[1] = None
+
+    async def beat():
+        heartbeat = asyncio.ensure_future(worker._heartbeat())
+        await asyncio.sleep(0.1)
+        heartbeat.cancel()
+
+    asyncio.run(beat())
+    assert queue.calls >= 2
@@ -0,0 +1,99 @@
+import pytest
+
+from leaderboard import Leaderboard, catch_up_from_db, rebuild_from_db
+from postgrest_stub import PostgrestStub
+from tweet_pipeline import PostgrestClient
+
+
+@pytest.fixture
+def stub():
+    stub = PostgrestStub()
+    yield stub
+    stub.close()
+
+
+def scored_rows(ids):
+    return [
+        {"id": i, "text": f"tweet {i}", "author_username": f"@author{i % 3}", "score": i % 5}
+        for i in ids
+    ]
+
+
+@pytest.mark.parametrize("count", [3, 10, 25])
+def test_rebuild_from_db_reads_every_page(stub, tmp_path, count):
+    stub.insert(scored_rows(range(1, count + 1)))
+    stub.insert([{"id": 100, "text": "unscored", "author_username": "@author0"}])
+    leaderboard = Leaderboard(path=str(tmp_path / "leaderboard.npz"))
+
+    assert rebuild_from_db(leaderboard, page_size=10, client=PostgrestClient(stub.url)) == count
+    assert leaderboard.last_tweet_id == count
+    assert sum(leaderboard.authors.count) == count
+    assert Leaderboard(path=str(tmp_path / "leaderboard.npz")).last_tweet_id == count
+
+
+def test_only_one_process_owns_the_checkpoint(tmp_path):
+    path = str(tmp_path / "leaderboard.npz")
+    owner, other = Leaderboard(path=path), Leaderboard(path=path)
+
+    assert owner.acquire()
+    assert not other.acquire()
+    other.add("@someone", 3.0)
+    with pytest.raises(RuntimeError):
+        other.checkpoint()
+
+
+def test_acquire_picks_up_the_previous_owners_checkpoint(tmp_path):
+    path = str(tmp_path / "leaderboard.npz")
+    stale = Leaderboard(path=path)
+    previous = Leaderboard(path=path)
+    assert previous.acquire()
+    previous.add_many([{"id": 7, "author": "@a", "score": 2.0}])
+    previous.checkpoint()
+    previous._owner.close()
+
+    assert stale.acquire()
+    assert stale.last_tweet_id == 7
+    assert stale.top_k(1, "sum") == [("@a", 2.0)]
+
+
+def test_catch_up_applies_scores_written_after_the_checkpoint(stub, tmp_path):
+    path = str(tmp_path / "leaderboard.npz")
+    client = PostgrestClient(stub.url)
+    stub.insert(scored_rows(range(1, 21)))
+    crashed = Leaderboard(path=path)
+    assert crashed.acquire()
+    catch_up_from_db(crashed, page_size=8, client=client)
+    # Scores written to the database after that checkpoint, then a crash
+    crashed.add_many([
+        {"id": row["id"], "author": row["author_username"], "score": row["score"]}
+        for row in scored_rows(range(21, 31))
+    ])
+    stub.insert(scored_rows(range(21, 31)))
+    crashed._owner.close()
+
+    restarted = Leaderboard(path=path)
+    assert restarted.acquire()
+    assert restarted.last_tweet_id == 20
+    assert catch_up_from_db(restarted, page_size=8, client=client) == 10
+    assert restarted.last_tweet_id == 30
+    assert sum(restarted.authors.count) == 30
+    assert catch_up_from_db(restarted, page_size=8, client=client) == 0
+
+
+def test_catch_up_rebuilds_when_rows_were_scored_below_last_tweet_id(stub, tmp_path):
+    client = PostgrestClient(stub.url)
+    stub.insert(scored_rows(range(1, 21)))
+    stub.insert([{"id": 25, "text": "unscored", "author_username": "@author0"}])
+    stub.execute("UPDATE collected_tweets SET score = NULL WHERE id IN (3, 4)")
+    leaderboard = Leaderboard(path=str(tmp_path / "leaderboard.npz"))
+    assert leaderboard.acquire()
+    catch_up_from_db(leaderboard, page_size=8, client=client)
+    assert leaderboard.applied() == 18
+
+    # Another writer scores rows the id watermark has already passed
+    stub.execute("UPDATE collected_tweets SET score = 7 WHERE id IN (3, 4)")
+    assert client.count("collected_tweets", [("score", "not.is.null")]) == 20
+
+    assert catch_up_from_db(leaderboard, page_size=8, client=client) == 20
+    assert leaderboard.applied() == 20
+    assert leaderboard.last_tweet_id == 20
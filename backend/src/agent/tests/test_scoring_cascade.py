@@ -0,0 +1,83 @@
+import pytest
+
+from local_scorer import LocalScorer
+from metrics import metrics
+from near_duplicates import NearDuplicateIndex
+from score_cache import ScoreCache
+from scoring_cascade import ScoringCascade
+
+TWEET = "Flow blockchain is absolutely amazing, the speed and scalability are incredible for developers"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ScoreCache(str(tmp_path / "cache.sqlite3"))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def near_dups(tmp_path):
+    return NearDuplicateIndex(str(tmp_path / "near_dups.sqlite3"))
+
+
+def gpt(score, **fields):
+    return dict(fields, score=score, gpt_response="{}")
+
+
+def test_repeats_go_to_gpt_once_and_are_cached(cache):
+    metrics.reset()
+    cascade = ScoringCascade(cache)
+
+    results, pending = cascade.resolve(["gm", "gm ", "wagmi"], profile="score")
+    assert results == [None, None, None]
+    assert [(item.text, item.indexes) for item in pending] == [("gm", [0, 1]), ("wagmi", [2])]
+
+    cascade.complete(results, pending, [gpt(20), gpt(-10)])
+    assert [r["score"] for r in results] == [20, 20, -10]
+
+    again, pending = cascade.resolve(["wagmi", "GM"], profile="score")
+    assert pending == []
+    assert again == [
+        {"score": -10, "gpt_response": None, "cached": True},
+        {"score": 20, "gpt_response": None, "cached": True},
+    ]
+    assert metrics.counter("cache_lookups_total", result="miss") == 3
+    assert metrics.counter("cache_lookups_total", result="hit") == 2
+
+
+def test_failed_analyses_are_not_remembered(cache):
+    cascade = ScoringCascade(cache)
+    results, pending = cascade.resolve(["gm"], profile="score")
+    cascade.complete(results, pending, [{"score": None, "error": "timeout"}])
+
+    assert results == [{"score": None, "error": "timeout"}]
+    _, pending = cascade.resolve(["gm"], profile="score")
+    assert len(pending) == 1
+
+
+def test_near_duplicates_share_one_gpt_call_and_answer_later_copies(cache, near_dups):
+    cascade = ScoringCascade(cache, near_dups)
+
+    results, pending = cascade.resolve([TWEET, TWEET + " #Flow @dev"], profile="full")
+    (item,) = pending
+    assert item.indexes == [0, 1]
+    cascade.complete(results, pending, [gpt(80, sentiment="Positive", explanation="Praise")])
+
+    # A "full" score can answer the smaller "score" profile, not the other way round
+    (result,), pending = cascade.resolve([TWEET + " https://t.co/x"], profile="score")
+    assert pending == []
+    assert (result["score"], result["near_duplicate"], result["distance"]) == (80, True, 0)
+
+    cascade.complete(*cascade.resolve(["gm gm gm gm gm"], profile="score"), [gpt(5)])
+    _, pending = cascade.resolve(["gm gm gm gm gm!"], profile="full")
+    assert len(pending) == 1
+
+
+def test_confident_local_scores_skip_gpt(cache):
+    cascade = ScoringCascade(cache, local=LocalScorer(weights_path=None, threshold=0.5))
+
+    results, pending = cascade.resolve(["this is terrible awful scam", "gm"], profile="score")
+
+    assert [item.text for item in pending] == ["gm"]
+    assert results[0]["score"] < 0 and results[1] is None
@@ -0,0 +1,23 @@
+import pytest
+
+from tweet_ids import MAX_TWEETS_PER_COMMAND, parse_tweet_ids
+
+
+def test_lists_and_ranges_are_expanded_in_order_without_repeats():
+    assert parse_tweet_ids("1,2, 5 - 8 3") == [1, 2, 5, 6, 7, 8, 3]
+    assert parse_tweet_ids("4,4,3-5") == [4, 3, 5]
+    assert parse_tweet_ids("  ") == []
+
+
+@pytest.mark.parametrize("spec", ["1,abc", "5-2", "1-x", "-3"])
+def test_malformed_ids_are_rejected(spec):
+    with pytest.raises(ValueError, match="Invalid tweet id"):
+        parse_tweet_ids(spec)
+
+
+def test_oversized_ranges_are_rejected_before_they_are_expanded():
+    with pytest.raises(ValueError, match="At most"):
+        parse_tweet_ids("1-1000000000000")
+    with pytest.raises(ValueError, match="At most"):
+        parse_tweet_ids(",".join(str(i) for i in range(MAX_TWEETS_PER_COMMAND + 1)))
+    assert len(parse_tweet_ids(f"1-{MAX_TWEETS_PER_COMMAND}")) == MAX_TWEETS_PER_COMMAND
@@ -0,0 +1,149 @@
+import threading
+from collections import Counter
+
+import pytest
+
+from postgrest_stub import PostgrestStub
+from tweet_pipeline import WRITE_ATTEMPTS, PostgrestClient, PostgrestError, TweetPipeline
+
+
+def fake_score(text):
+    return {"score": len(text) % 7 - 3}
+
+
+@pytest.fixture
+def stub():
+    stub = PostgrestStub()
+    stub.insert([
+        {"id": i, "text": f"tweet {i}", "author_username": f"@author{i % 5}"}
+        for i in range(1, 201)
+    ])
+    yield stub
+    stub.close()
+
+
+def make_pipeline(stub, worker_id="w1", **options):
+    options.setdefault("page_size", 25)
+    options.setdefault("flush_size", 50)
+    options.setdefault("retry_delay", 0)
+    return TweetPipeline(
+        lambda contents: [fake_score(c) for c in contents],
+        client=PostgrestClient(stub.url),
+        worker_id=worker_id,
+        **options
+    )
+
+
+def test_scores_the_backlog_with_bulk_writes(stub):
+    pipeline = make_pipeline(stub)
+    stats = pipeline.run()
+
+    rows = stub.rows()
+    assert stats["scored"] == 200
+    assert all(row["score"] == fake_score(row["text"])["score"] for row in rows.values())
+    assert all(row["scoring_claimed_by"] is None for row in rows.values())
+    # 8 pages, each fetched and claimed, one final empty fetch, 4 flushes
+    assert stats["round_trips"] == 8 * 2 + 1 + 4
+
+
+def test_parallel_workers_never_score_a_row_twice(stub):
+    seen = Counter()
+    lock = threading.Lock()
+
+    def score_many(contents):
+        with lock:
+            seen.update(contents)
+        return [fake_score(c) for c in contents]
+
+    pipelines = [
+        TweetPipeline(score_many, client=PostgrestClient(stub.url), page_size=10, flush_size=20, worker_id=f"w{n}")
+        for n in range(4)
+    ]
+    threads = [threading.Thread(target=p.run) for p in pipelines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(seen) == 200
+    assert max(seen.values()) == 1
+    assert sum(p.stats["scored"] for p in pipelines) == 200
+    assert all(row["score"] is not None for row in stub.rows().values())
+
+
+def test_claim_is_won_by_one_worker(stub):
+    first, second = make_pipeline(stub, "w1"), make_pipeline(stub, "w2")
+    ids = list(range(1, 11))
+
+    assert first._claim(ids) == set(ids)
+    assert second._claim(ids) == set()
+
+    # An expired claim can be taken over
+    expired = make_pipeline(stub, "w3", claim_ttl=-1)
+    assert expired._claim(ids) == set(ids)
+
+
+def test_flush_only_writes_rows_still_claimed(stub):
+    written = []
+    pipeline = make_pipeline(stub, on_scored=written.extend)
+    page = next(pipeline.pages())
+    pipeline._score_page(page)
+
+    # Meanwhile the claim on row 1 expired and another worker took it,
+    # and row 2 was deleted
+    stub.execute("UPDATE collected_tweets SET scoring_claimed_by = 'w2' WHERE id = 1")
+    stub.execute("DELETE FROM collected_tweets WHERE id = 2")
+    pipeline.flush()
+
+    rows = stub.rows()
+    assert rows[1]["score"] is None and rows[1]["scoring_claimed_by"] == "w2"
+    assert 2 not in rows
+    assert all(rows[i]["score"] is not None for i in range(3, 26))
+    assert pipeline.stats["lost"] == 2
+    assert sorted(row["id"] for row, _ in written) == list(range(3, 26))
+
+
+def test_flush_falls_back_to_patches_without_the_function(stub):
+    stub.rpc = False
+    pipeline = make_pipeline(stub)
+    pipeline.run()
+
+    assert pipeline.write_function is None
+    rows = stub.rows()
+    assert all(row["score"] == fake_score(row["text"])["score"] for row in rows.values())
+    assert all(row["scoring_claimed_by"] is None for row in rows.values())
+
+
+def test_transient_write_failures_are_retried(stub):
+    pipeline = make_pipeline(stub)
+    stub.fail_next("POST", WRITE_ATTEMPTS - 1)
+    pipeline.run()
+    assert all(row["score"] is not None for row in stub.rows().values())
+
+
+def test_failed_write_keeps_the_buffer(stub):
+    pipeline = make_pipeline(stub, flush_size=1000)
+    page = next(pipeline.pages())
+    pipeline._score_page(page)
+
+    stub.fail_next("POST", WRITE_ATTEMPTS)
+    with pytest.raises(PostgrestError):
+        pipeline.flush()
+    assert len(pipeline._pending) == len(page)
+
+    pipeline.flush()
+    assert pipeline._pending == []
+    assert all(stub.rows()[row["id"]]["score"] is not None for row in page)
+
+
+def test_failed_scores_release_their_claims(stub):
+    pipeline = TweetPipeline(
+        lambda contents: [{"score": None, "error": "x"} if c.endswith("7") else fake_score(c) for c in contents],
+        client=PostgrestClient(stub.url), page_size=50, flush_size=50, worker_id="w1"
+    )
+    stats = pipeline.run()
+
+    rows = stub.rows()
+    failed = [row for row in rows.values() if row["text"].endswith("7")]
+    assert stats["failed"] == len(failed)
+    assert all(row["score"] is None and row["scoring_claimed_by"] is None for row in failed)
@@ -0,0 +1,70 @@
+import json
+
+from tweet_prompts import (
+    BATCH_OUTPUT_TOKEN_BUDGET,
+    OUTPUT_TOKENS_PER_TWEET,
+    complete_items,
+    parse_batch_response,
+    plan_batches,
+    retry_groups,
+)
+
+
+def reply(*items):
+    return json.dumps({"results": list(items)})
+
+
+def test_batch_results_are_mapped_back_by_id():
+    text = reply({"id": 2, "score": -40}, {"id": "0", "score": 75}, {"id": 7, "score": 1})
+
+    results = parse_batch_response(text, 3, profile="score")
+
+    assert results == [{"score": 75}, None, {"score": -40}]
+
+
+def test_invalid_and_repeated_batch_entries_are_left_for_a_retry():
+    text = "```json\n" + reply(
+        {"id": 0, "score": "high"},
+        {"id": 1, "score": 250, "sentiment": "POSITIVE"},
+        {"id": 1, "score": -5},
+        {"id": 2, "score": True},
+    ) + "\n```"
+
+    results = parse_batch_response(text, 3, profile="sentiment")
+
+    assert results == [None, {"score": 100, "sentiment": "Positive"}, None]
+
+
+def test_truncated_batch_reply_keeps_its_complete_entries():
+    full = reply({"id": 0, "score": 10}, {"id": 1, "score": -20}, {"id": 2, "score": 30})
+    cut = full[:full.index('{"id": 2') + 12]
+
+    assert complete_items(cut) == [{"id": 0, "score": 10}, {"id": 1, "score": -20}]
+    assert parse_batch_response(cut, 3, profile="score") == [{"score": 10}, {"score": -20}, None]
+
+
+def test_reply_without_results_fails_every_entry():
+    assert complete_items("Sorry, I can't help with that.") == []
+    assert parse_batch_response("Sorry, I can't help with that.", 2) == [None, None]
+    assert parse_batch_response(json.dumps({"results": "none"}), 2) == [None, None]
+
+
+def test_failed_entries_are_split_in_half_for_the_retry():
+    ok = {"score": 1}
+
+    assert retry_groups([ok, ok]) == []
+    assert retry_groups([ok, None]) == [[1]]
+    assert retry_groups([None, ok, None, None, ok, None, None]) == [[0, 2], [3, 5, 6]]
+
+
+def test_plan_batches_respects_the_size_limit_and_keeps_order():
+    assert plan_batches(["a tweet"] * 5, max_size=2, profile="score") == [[0, 1], [2, 3], [4]]
+
+
+def test_plan_batches_caps_batches_at_the_output_budget():
+    (first, *_) = plan_batches(["hi"] * 100, max_size=100, profile="full")
+    assert len(first) == BATCH_OUTPUT_TOKEN_BUDGET // OUTPUT_TOKENS_PER_TWEET["full"]
+
+
+def test_plan_batches_gives_long_tweets_smaller_batches():
+    assert plan_batches(["x" * 8000, "x" * 8000, "short"], profile="score") == [[0], [1, 2]]
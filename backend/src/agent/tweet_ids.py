@@ -0,0 +1,35 @@
+"""
+Parsing of the tweet id lists in "score tweets" chat commands.
+"""
+import os
+import re
+from typing import List
+
+# Most ids a single "score tweets" command may ask for
+MAX_TWEETS_PER_COMMAND = int(os.getenv("MAX_TWEETS_PER_COMMAND", "200"))
+
+
+def parse_tweet_ids(spec: str) -> List[int]:
+    """
+    Parse an id list like "1,2,5-40" (or "1 2 5-40") into
+    [1, 2, 5, 6, ..., 40]. Oversized requests are rejected before any
+    range is expanded.
+    """
+    ids: List[int] = []
+    for part in re.split(r"[,\s]+", re.sub(r"\s*-\s*", "-", spec.strip())):
+        if not part:
+            continue
+        if "-" in part:
+            start, _, end = part.partition("-")
+            if not (start.isdigit() and end.isdigit()) or int(start) > int(end):
+                raise ValueError(f"Invalid tweet id range '{part}'")
+            if len(ids) + int(end) - int(start) + 1 > MAX_TWEETS_PER_COMMAND:
+                raise ValueError(f"At most {MAX_TWEETS_PER_COMMAND} tweets can be scored per message")
+            ids.extend(range(int(start), int(end) + 1))
+        elif part.isdigit():
+            ids.append(int(part))
+        else:
+            raise ValueError(f"Invalid tweet id '{part}'")
+        if len(ids) > MAX_TWEETS_PER_COMMAND:
+            raise ValueError(f"At most {MAX_TWEETS_PER_COMMAND} tweets can be scored per message")
+    return list(dict.fromkeys(ids))
@@ -0,0 +1,425 @@
+"""
+Bulk scoring pipeline over the collected_tweets table.
+
+Streams unscored tweets through PostgREST (Supabase's REST layer, or a
+plain local PostgREST in front of Postgres) and writes scores back in
+bulk:
+
+- keyset pagination on id, selecting only the columns scoring needs
+- every page is claimed with one conditional PATCH, so parallel workers
+  never score the same row; claims left behind by a crashed worker
+  expire after PIPELINE_CLAIM_TTL seconds
+- scores are flushed every PIPELINE_FLUSH_SIZE rows with one bulk
+  UPDATE that only touches rows this worker still holds a claim on, so
+  rows deleted or re-claimed in the meantime are left alone
+
+Memory stays flat (one page plus one flush buffer) and the number of
+round trips is O(rows / page size).
+
+The claim needs two extra columns, and the bulk write a function
+(PIPELINE_WRITE_FUNCTION):
+
+    alter table collected_tweets
+        add column if not exists scoring_claimed_by text,
+        add column if not exists scoring_claimed_at timestamptz;
+    create index if not exists collected_tweets_unscored
+        on collected_tweets (id) where score is null;
+
+    create or replace function score_claimed_tweets(worker text, scores jsonb)
+    returns table (id bigint) language sql as $$
+        update collected_tweets t
+        set score = s.score, scoring_claimed_by = null, scoring_claimed_at = null
+        from jsonb_to_recordset(scores) as s(id bigint, score double precision)
+        where t.id = s.id and t.scoring_claimed_by = worker
+        returning t.id
+    $$;
+
+Without the function, scores are written with one conditional PATCH per
+distinct score value instead.
+"""
+import json
+import os
+import socket
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metrics import metrics
+
+TABLE = "collected_tweets"
+CONTENT_COLUMNS = ("full_text", "text")
+
+# Attempts per database write before the rows stay buffered for later
+WRITE_ATTEMPTS = 3
+
+ScoreMany = Callable[[List[str]], List[Dict[str, Any]]]
+# Called with (row, score) pairs as scores are written
+ScoredSink = Callable[[List[Tuple[Dict[str, Any], float]]], None]
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"PostgREST error {status}: {message}")
+        self.status = status
+
+
+def _rest_url() -> str:
+    """
+    POSTGREST_URL for a bare PostgREST, else the Supabase REST endpoint
+    """
+    if os.getenv("POSTGREST_URL"):
+        return os.getenv("POSTGREST_URL", "")
+    supabase_url = os.getenv("SUPABASE_URL", "")
+    return supabase_url.rstrip("/") + "/rest/v1" if supabase_url else ""
+
+
+class PostgrestClient:
+    """
+    Minimal PostgREST client on urllib; one HTTP request per call
+    """
+
+    def __init__(
+        self,
+        url: str = _rest_url(),
+        key: Optional[str] = os.getenv("SUPABASE_KEY"),
+        timeout: float = 30.0,
+    ):
+        if not url:
+            raise ValueError("Set SUPABASE_URL (or POSTGREST_URL for a local PostgREST)")
+        self.url = url.rstrip("/")
+        self.key = key
+        self.timeout = timeout
+
+    def request(
+        self,
+        method: str,
+        table: str,
+        params: List[Tuple[str, str]],
+        body: Any = None,
+        prefer: Optional[str] = None,
+    ) -> Any:
+        payload, _ = self._send(method, table, params, body, prefer)
+        return json.loads(payload) if payload else None
+
+    def _send(
+        self,
+        method: str,
+        table: str,
+        params: List[Tuple[str, str]],
+        body: Any = None,
+        prefer: Optional[str] = None,
+    ) -> Tuple[bytes, Any]:
+        """
+        One HTTP request; returns the raw body and the response headers
+        """
+        url = f"{self.url}/{table}"
+        if params:
+            url += "?" + urllib.parse.urlencode(params, safe=",.()*:")
+        headers = {"Accept": "application/json"}
+        if self.key:
+            headers["apikey"] = self.key
+            headers["Authorization"] = f"Bearer {self.key}"
+        if prefer:
+            headers["Prefer"] = prefer
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        req = urllib.request.Request(url, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            raise PostgrestError(e.code, e.read().decode("utf-8", "replace")) from e
+
+    def select(self, table: str, params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        return self.request("GET", table, params) or []
+
+    def count(self, table: str, filters: Iterable[Tuple[str, str]] = ()) -> int:
+        """
+        Number of rows matching `filters`, from the Content-Range of an
+        exact-count select
+        """
+        _, headers = self._send("GET", table, [*filters, ("select", "id"), ("limit", "1")], prefer="count=exact")
+        return int((headers.get("Content-Range") or "*/0").rsplit("/", 1)[1])
+
+    def update(
+        self,
+        table: str,
+        params: List[Tuple[str, str]],
+        values: Dict[str, Any],
+        returning: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        PATCH the matching rows; with `returning`, the updated rows come
+        back with those columns
+        """
+        if returning:
+            params = params + [("select", returning)]
+            return self.request("PATCH", table, params, values, prefer="return=representation") or []
+        self.request("PATCH", table, params, values, prefer="return=minimal")
+        return []
+
+    def rpc(self, function: str, args: Dict[str, Any]) -> Any:
+        return self.request("POST", f"rpc/{function}", [], args)
+
+    def update_scores(
+        self,
+        table: str,
+        scores: Dict[int, float],
+        filters: Iterable[Tuple[str, str]] = (),
+        values: Optional[Dict[str, Any]] = None,
+    ) -> List[int]:
+        """
+        Set the score of existing rows with one PATCH per distinct score,
+        only where `filters` still match. Returns the ids updated.
+        """
+        by_score: Dict[float, List[int]] = {}
+        for row_id, score in scores.items():
+            by_score.setdefault(score, []).append(row_id)
+        updated: List[int] = []
+        for score, ids in by_score.items():
+            rows = self.update(
+                table,
+                [("id", _in_list(ids)), *filters],
+                dict(values or {}, score=score),
+                returning="id",
+            )
+            updated.extend(row["id"] for row in rows)
+        return updated
+
+
+def _in_list(ids: Iterable[int]) -> str:
+    return "in.(" + ",".join(str(i) for i in ids) + ")"
+
+
+def _transient(error: Exception) -> bool:
+    if isinstance(error, PostgrestError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (urllib.error.URLError, OSError))
+
+
+class TweetPipeline:
+    """
+    Claim, score and write back unscored tweets page by page
+    """
+
+    def __init__(
+        self,
+        score_many: ScoreMany,
+        client: Optional[PostgrestClient] = None,
+        page_size: int = int(os.getenv("PIPELINE_PAGE_SIZE", "500")),
+        flush_size: int = int(os.getenv("PIPELINE_FLUSH_SIZE", "1000")),
+        claim_ttl: float = float(os.getenv("PIPELINE_CLAIM_TTL", "600")),
+        worker_id: Optional[str] = None,
+        table: str = TABLE,
+        extra_columns: Tuple[str, ...] = (),
+        on_scored: Optional[ScoredSink] = None,
+        write_function: Optional[str] = os.getenv("PIPELINE_WRITE_FUNCTION", "score_claimed_tweets"),
+        retry_delay: float = 1.0,
+    ):
+        self.score_many = score_many
+        self.client = client or PostgrestClient()
+        self.page_size = max(1, page_size)
+        self.flush_size = max(1, flush_size)
+        self.claim_ttl = claim_ttl
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.table = table
+        self.extra_columns = extra_columns
+        self.on_scored = on_scored
+        self.write_function = write_function or None
+        self.retry_delay = retry_delay
+        self.stats = {"claimed": 0, "scored": 0, "failed": 0, "skipped": 0, "lost": 0, "round_trips": 0}
+        # (row, score) pairs waiting to be written
+        self._pending: List[Tuple[Dict[str, Any], float]] = []
+        self._released: List[int] = []
+
+    def _claimable(self) -> List[Tuple[str, str]]:
+        """
+        Filters for unscored rows that nobody holds a live claim on
+        """
+        expired = (datetime.now(timezone.utc) - timedelta(seconds=self.claim_ttl)).isoformat()
+        return [
+            ("score", "is.null"),
+            ("or", f"(scoring_claimed_at.is.null,scoring_claimed_at.lt.{expired})"),
+        ]
+
+    def _fetch_page(self, after_id: int) -> List[Dict[str, Any]]:
+        with metrics.time("db_fetch"):
+            self.stats["round_trips"] += 1
+            return self.client.select(self.table, [
+                ("select", ",".join(("id",) + CONTENT_COLUMNS + self.extra_columns)),
+                ("id", f"gt.{after_id}"),
+                *self._claimable(),
+                ("order", "id.asc"),
+                ("limit", str(self.page_size)),
+            ])
+
+    def _claim(self, ids: List[int]) -> set:
+        """
+        Claim the rows that are still unclaimed; returns the ids this
+        worker now holds. Postgres re-checks the filters under the row
+        lock, so two workers can't both win the same row.
+        """
+        with metrics.time("db_claim"):
+            self.stats["round_trips"] += 1
+            claimed = self.client.update(
+                self.table,
+                [("id", _in_list(ids)), *self._claimable()],
+                {
+                    "scoring_claimed_by": self.worker_id,
+                    "scoring_claimed_at": datetime.now(timezone.utc).isoformat(),
+                },
+                returning="id",
+            )
+        return {row["id"] for row in claimed}
+
+    def pages(self, start_after: int = 0) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield pages of rows claimed by this worker, in id order
+        """
+        last_id = start_after
+        while True:
+            rows = self._fetch_page(last_id)
+            if not rows:
+                return
+            last_id = rows[-1]["id"]
+            claimed = self._claim([row["id"] for row in rows])
+            self.stats["claimed"] += len(claimed)
+            self.stats["skipped"] += len(rows) - len(claimed)
+            page = [row for row in rows if row["id"] in claimed]
+            if page:
+                yield page
+            if len(rows) < self.page_size:
+                return
+
+    def _score_page(self, page: List[Dict[str, Any]]) -> None:
+        contents = [row.get("full_text") or row.get("text") or "" for row in page]
+        results = self.score_many(contents)
+        for row, result in zip(page, results):
+            if result.get("score") is None:
+                # Release the claim so the tweet is retried on a later run
+                self.stats["failed"] += 1
+                self._released.append(row["id"])
+                continue
+            self.stats["scored"] += 1
+            self._pending.append((row, result["score"]))
+        if len(self._pending) >= self.flush_size:
+            self.flush()
+
+    def _retrying(self, write: Callable[[], Any]) -> Any:
+        """
+        Run one database write, retrying transient failures with backoff
+        """
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                self.stats["round_trips"] += 1
+                return write()
+            except Exception as e:
+                if attempt == WRITE_ATTEMPTS or not _transient(e):
+                    raise
+                print(f"Pipeline {self.worker_id}: write failed ({e}), retrying", file=sys.stderr)
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    def _write_scores(self, scores: Dict[int, float]) -> List[int]:
+        """
+        Store scores for rows this worker still holds a claim on, and
+        release those claims. Returns the ids written.
+        """
+        if self.write_function:
+            try:
+                written = self._retrying(lambda: self.client.rpc(self.write_function, {
+                    "worker": self.worker_id,
+                    "scores": [{"id": row_id, "score": score} for row_id, score in scores.items()],
+                }))
+                return [row["id"] for row in written or []]
+            except PostgrestError as e:
+                if e.status != 404:
+                    raise
+                print(
+                    f"Pipeline {self.worker_id}: no {self.write_function}() function, "
+                    f"writing scores with one PATCH per score value",
+                    file=sys.stderr
+                )
+                self.write_function = None
+
+        return self._retrying(lambda: self.client.update_scores(
+            self.table,
+            scores,
+            [("scoring_claimed_by", f"eq.{self.worker_id}")],
+            {"scoring_claimed_by": None, "scoring_claimed_at": None},
+        ))
+
+    def flush(self) -> None:
+        """
+        Write buffered scores in bulk and release the claims of failed
+        rows. Rows whose claim was lost in the meantime (expired and
+        taken over, or the row was deleted) are not written. If a write
+        keeps failing, the rows not yet written stay buffered for the
+        next flush and the error is raised.
+        """
+        with metrics.time("db_write"):
+            while self._pending:
+                chunk = self._pending[:self.flush_size]
+                written = set(self._write_scores({row["id"]: score for row, score in chunk}))
+                del self._pending[:len(chunk)]
+
+                self.stats["lost"] += len(chunk) - len(written)
+                metrics.inc("db_rows_written_total", len(written))
+                if self.on_scored is not None and written:
+                    # Only once the scores are stored
+                    self.on_scored([(row, score) for row, score in chunk if row["id"] in written])
+
+            if self._released:
+                self._retrying(lambda: self.client.update(
+                    self.table,
+                    [("id", _in_list(self._released)), ("scoring_claimed_by", f"eq.{self.worker_id}")],
+                    {"scoring_claimed_by": None, "scoring_claimed_at": None},
+                ))
+                self._released = []
+
+    def run(self, start_after: int = 0, max_rows: Optional[int] = None) -> Dict[str, int]:
+        """
+        Score the backlog once, front to back. Returns the run's counters.
+        """
+        started = time.perf_counter()
+        try:
+            for page in self.pages(start_after):
+                self._score_page(page)
+                if max_rows is not None and self.stats["claimed"] >= max_rows:
+                    break
+        finally:
+            self.flush()
+        print(
+            f"Pipeline {self.worker_id}: {self.stats} in {time.perf_counter() - started:.1f}s",
+            file=sys.stderr
+        )
+        return dict(self.stats)
+
+    def run_forever(
+        self,
+        poll_seconds: float = float(os.getenv("PIPELINE_POLL_SECONDS", "30")),
+        after_pass: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Keep scoring new tweets, sleeping whenever a pass scores nothing.
+        A pass that fails (e.g. the database is down) is retried after the
+        same pause; scores it couldn't write stay buffered until then.
+        `after_pass` runs after every pass.
+        """
+        while True:
+            try:
+                scored = self.run()["scored"]
+                if after_pass is not None:
+                    after_pass()
+            except Exception as e:
+                print(f"Pipeline {self.worker_id}: pass failed: {e}", file=sys.stderr)
+                scored = 0
+            if not scored:
+                time.sleep(poll_seconds)
+            self.stats = dict.fromkeys(self.stats, 0)
@@ -0,0 +1,368 @@
+"""
+Prompt building and response parsing for GPT tweet scoring.
+
+Kept separate from my_first_agent.py so other scoring paths can share
+the exact same prompts without importing the uagents agent.
+
+Three response profiles trade detail for tokens:
+- "score":     {"score": n}
+- "sentiment": {"score": n, "sentiment": "..."}
+- "full":      {"score": n, "sentiment": "...", "explanation": "..."}
+"""
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+
+SYSTEM_PROMPT = "You are a sentiment analysis expert. Always respond with valid JSON."
+
+COMPACT_SYSTEM_PROMPT = "Rate tweets about Flow blockchain from -100 (very negative) to 100 (very positive). Reply with JSON only."
+
+SENTIMENTS = ("Positive", "Neutral", "Negative")
+
+PROFILES = ("score", "sentiment", "full")
+DEFAULT_PROFILE = os.getenv("SCORING_PROFILE", "full")
+
+PROFILE_FIELDS = {
+    "score": ("score",),
+    "sentiment": ("score", "sentiment"),
+    "full": ("score", "sentiment", "explanation"),
+}
+
+# Completion budget for a single tweet, and per tweet in a batch.
+# Measured with the cl100k tokenizer on indented JSON (JSON mode often
+# pretty-prints): a single {"score": n} is 9 tokens (13 in a code fence),
+# and a batch entry costs about 18 tokens with just the score, 26 with
+# the sentiment and 51 with a one-sentence explanation. The budgets
+# leave about a third on top for longer ids and explanations.
+MAX_TOKENS = {"score": 16, "sentiment": 28, "full": 200}
+OUTPUT_TOKENS_PER_TWEET = {"score": 24, "sentiment": 34, "full": 90}
+
+# Rough token budget for one batched completion
+BATCH_PROMPT_TOKEN_BUDGET = int(os.getenv("BATCH_PROMPT_TOKEN_BUDGET", "3000"))
+BATCH_OUTPUT_TOKEN_BUDGET = int(os.getenv("BATCH_OUTPUT_TOKEN_BUDGET", "3000"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "40"))
+BATCH_PROMPT_OVERHEAD_TOKENS = 200
+
+# Sent after an unparseable reply, together with that reply
+REPAIR_PROMPT = "That reply was not the requested JSON. Reply again with only the JSON object."
+
+_SCORE_RE = re.compile(r'"?score"?\s*[:=]\s*(-?\d+(?:\.\d+)?)', re.IGNORECASE)
+_SENTIMENT_RE = re.compile(r"\b(positive|neutral|negative)\b", re.IGNORECASE)
+
+
+def check_profile(profile: str) -> str:
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile '{profile}', expected one of {', '.join(PROFILES)}")
+    return profile
+
+
+def _json_shape(profile: str) -> str:
+    fields = ['"score": <integer -100..100>']
+    if "sentiment" in PROFILE_FIELDS[profile]:
+        fields.append('"sentiment": "<Positive/Neutral/Negative>"')
+    if "explanation" in PROFILE_FIELDS[profile]:
+        fields.append('"explanation": "<one short sentence>"')
+    return "{" + ", ".join(fields) + "}"
+
+
+def build_tweet_prompt(tweet_content: str) -> str:
+    """
+    Build the single-tweet analysis prompt for the full profile
+    """
+    return f"""
+        Analyze the following tweet about Flow blockchain and provide:
+        1. A sentiment score between -100 and +100 (negative to positive)
+        2. A sentiment category: "Positive", "Neutral", or "Negative"
+        3. A brief explanation of your analysis
+
+        Tweet: "{tweet_content}"
+
+        Respond in JSON format:
+        {{
+            "score": <number between -100 and 100>,
+            "sentiment": "<Positive/Neutral/Negative>",
+            "explanation": "<brief explanation>"
+        }}
+        """
+
+
+def build_messages(tweet_content: str, profile: str = DEFAULT_PROFILE) -> List[Dict[str, str]]:
+    """
+    Chat messages for scoring one tweet. The compact profiles use a
+    minimal prompt with the tweet as the whole user message.
+    """
+    if profile == "full":
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": build_tweet_prompt(tweet_content)}
+        ]
+    return [
+        {"role": "system", "content": f"{COMPACT_SYSTEM_PROMPT} Format: {_json_shape(profile)}"},
+        {"role": "user", "content": tweet_content}
+    ]
+
+
+def build_batch_prompt(tweets: List[str], profile: str = DEFAULT_PROFILE) -> str:
+    """
+    Build one prompt that scores several tweets, each tagged with an id
+    """
+    items = json.dumps(
+        [{"id": i, "text": text} for i, text in enumerate(tweets)],
+        ensure_ascii=False
+    )
+    shape = _json_shape(profile).replace("{", '{"id": <id>, ', 1)
+    return f"""Score each tweet about Flow blockchain below from -100 (very negative) to 100 (very positive).
+
+Tweets (JSON): {items}
+
+Respond with JSON only, one entry per tweet id:
+{{"results": [{shape}]}}"""
+
+
+def build_batch_messages(tweets: List[str], profile: str = DEFAULT_PROFILE) -> List[Dict[str, str]]:
+    system = SYSTEM_PROMPT if profile == "full" else COMPACT_SYSTEM_PROMPT
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": build_batch_prompt(tweets, profile)}
+    ]
+
+
+def batch_max_tokens(count: int, profile: str = DEFAULT_PROFILE) -> int:
+    # Plus the {"results": [...]} wrapper and a possible code fence
+    return OUTPUT_TOKENS_PER_TWEET[profile] * count + 20
+
+
+@lru_cache(maxsize=None)
+def prompt_version(profile: str = DEFAULT_PROFILE) -> str:
+    """
+    Short hash of the prompt templates of a profile; changes whenever
+    one of them does
+    """
+    templates = json.dumps(build_messages("{tweet}", profile) + build_batch_messages(["{tweet}"], profile))
+    return hashlib.sha256(f"{profile}\0{templates}".encode("utf-8")).hexdigest()[:12]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token) used for batch sizing
+    """
+    return len(text) // 4 + 1
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+def plan_batches(tweets: List[str], max_size: int = BATCH_MAX_SIZE, profile: str = DEFAULT_PROFILE) -> List[List[int]]:
+    """
+    Group tweet indexes into batches that fit the prompt and output token
+    budgets, so long tweets get smaller batches
+    """
+    max_by_output = max(1, BATCH_OUTPUT_TOKEN_BUDGET // OUTPUT_TOKENS_PER_TWEET[profile])
+    max_size = max(1, min(max_size, max_by_output))
+
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = BATCH_PROMPT_OVERHEAD_TOKENS
+
+    for i, text in enumerate(tweets):
+        # Per-item JSON wrapping adds a few tokens on top of the text
+        tokens = estimate_tokens(text) + 8
+        if current and (len(current) >= max_size or current_tokens + tokens > BATCH_PROMPT_TOKEN_BUDGET):
+            batches.append(current)
+            current = []
+            current_tokens = BATCH_PROMPT_OVERHEAD_TOKENS
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def extract_json(response_text: str) -> Any:
+    """
+    Pull the outermost JSON object out of a GPT response
+    """
+    start_idx = response_text.find('{')
+    end_idx = response_text.rfind('}') + 1
+    if start_idx == -1 or end_idx == 0:
+        raise ValueError("No JSON found in response")
+    return json.loads(response_text[start_idx:end_idx])
+
+
+def sentiment_for(score: float) -> str:
+    """
+    Sentiment category implied by a score
+    """
+    if score > 15:
+        return "Positive"
+    if score < -15:
+        return "Negative"
+    return "Neutral"
+
+
+def validate_result(item: Any, profile: str = DEFAULT_PROFILE) -> Optional[Dict[str, Any]]:
+    """
+    Check one per-tweet result and normalize it to the profile's fields,
+    or return None if it has no usable score. A missing or invalid
+    sentiment is derived from the score.
+    """
+    if not isinstance(item, dict):
+        return None
+    score = item.get("score")
+    if isinstance(score, str):
+        try:
+            score = float(score)
+        except ValueError:
+            return None
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        return None
+
+    score = max(-100, min(100, round(score)))
+    result: Dict[str, Any] = {"score": score}
+    if "sentiment" in PROFILE_FIELDS[profile]:
+        sentiment = item.get("sentiment")
+        if isinstance(sentiment, str) and sentiment.capitalize() in SENTIMENTS:
+            result["sentiment"] = sentiment.capitalize()
+        else:
+            result["sentiment"] = sentiment_for(score)
+    if "explanation" in PROFILE_FIELDS[profile]:
+        result["explanation"] = str(item.get("explanation") or "Analysis completed")
+    return result
+
+
+def parse_tweet_response(response_text: str, profile: str = DEFAULT_PROFILE) -> Optional[Dict[str, Any]]:
+    """
+    Parse a single-tweet GPT response. Malformed JSON is repaired from
+    the "score"/sentiment text where possible; returns None when there
+    is no score to recover.
+    """
+    try:
+        return validate_result(extract_json(response_text), profile)
+    except (ValueError, json.JSONDecodeError):
+        pass
+
+    match = _SCORE_RE.search(response_text)
+    if not match:
+        return None
+    item: Dict[str, Any] = {"score": float(match.group(1))}
+    sentiment = _SENTIMENT_RE.search(response_text)
+    if sentiment:
+        item["sentiment"] = sentiment.group(1)
+    return validate_result(item, profile)
+
+
+def complete_items(response_text: str) -> List[Any]:
+    """
+    The complete objects at the start of the "results" array of a reply
+    that is not valid JSON as a whole, e.g. one cut off at max_tokens
+    """
+    decoder = json.JSONDecoder()
+    items: List[Any] = []
+    position = response_text.find("[")
+    if position == -1:
+        return items
+    while True:
+        position = response_text.find("{", position)
+        if position == -1:
+            return items
+        try:
+            item, position = decoder.raw_decode(response_text, position)
+        except json.JSONDecodeError:
+            # The cut-off (or garbled) entry; nothing after it is trusted
+            return items
+        items.append(item)
+
+
+def parse_batch_response(response_text: str, count: int, profile: str = DEFAULT_PROFILE) -> List[Optional[Dict[str, Any]]]:
+    """
+    Map a batched GPT response back to per-tweet results by id.
+    Entries that are missing or fail validation come back as None; the
+    complete entries of a truncated reply are kept.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * count
+    try:
+        data = extract_json(response_text)
+        items = data.get("results") if isinstance(data, dict) else None
+    except (ValueError, json.JSONDecodeError):
+        items = complete_items(response_text)
+
+    if not isinstance(items, list):
+        return results
+
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item_id = item.get("id")
+        if isinstance(item_id, str) and item_id.isdigit():
+            item_id = int(item_id)
+        if isinstance(item_id, int) and 0 <= item_id < count and results[item_id] is None:
+            results[item_id] = validate_result(item, profile)
+    return results
+
+
+def retry_groups(results: List[Optional[Dict[str, Any]]]) -> List[List[int]]:
+    """
+    Indexes of failed batch items, split in half for the next attempt
+    """
+    failed = [i for i, item in enumerate(results) if item is None]
+    if len(failed) <= 1:
+        return [failed] if failed else []
+    mid = len(failed) // 2
+    return [failed[:mid], failed[mid:]]
+
+
+def truncated(response: Any) -> bool:
+    """
+    Whether a completion stopped at max_tokens
+    """
+    choices = getattr(response, "choices", None) or []
+    return bool(choices) and getattr(choices[0], "finish_reason", None) == "length"
+
+
+def usage_of(response: Any) -> Dict[str, int]:
+    """
+    Token usage reported by the API for one completion
+    """
+    usage = getattr(response, "usage", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0
+    }
+
+
+def add_usage(total: Dict[str, int], usage: Dict[str, int]) -> Dict[str, int]:
+    return {key: total.get(key, 0) + value for key, value in usage.items()}
+
+
+def failed_result(reason: str, response_text: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Result for a tweet that could not be scored. The score is None rather
+    than 0, so callers can tell it apart from a neutral tweet.
+    """
+    return {
+        "score": None,
+        "sentiment": None,
+        "explanation": reason,
+        "gpt_response": response_text,
+        "error": reason
+    }
+
+
+def public_result(result: Dict[str, Any], profile: str = DEFAULT_PROFILE) -> Dict[str, Any]:
+    """
+    The fields of a result returned to callers for a profile, plus the
+    error and token usage when present
+    """
+    output = {field: result.get(field) for field in PROFILE_FIELDS[profile]}
+    for extra in ("error", "usage"):
+        if result.get(extra) is not None:
+            output[extra] = result[extra]
+    return output
@@ -1,6 +1,7 @@
 import { createClient, SupabaseClient } from "@supabase/supabase-js";
 import * as dotenv from "dotenv";
-import { spawn } from "child_process";
+import { spawn, ChildProcessWithoutNullStreams } from "child_process";
+import { hostname } from "os";
 
 dotenv.config();
 
@@ -18,6 +19,9 @@ interface Tweet {
   gpt_used?: boolean;
 }
 
+// The columns scoring needs
+type UnscoredTweet = Pick<Tweet, "id" | "text" | "full_text">;
+
 interface ScoredTweet extends Tweet {
   score: number;
   sentiment: string;
@@ -25,10 +29,33 @@ interface ScoredTweet extends Tweet {
   gpt_used: boolean;
 }
 
+// One Python worker process and the requests sent to it, by id; when it
+// dies only its own requests fail, not those of its replacement
+interface AgentWorker {
+  process: ChildProcessWithoutNullStreams;
+  pending: Map<string, (response: any) => void>;
+}
+
+/**
+ * Scores collected_tweets rows with the Python agent. Rows are claimed
+ * with the scoring_claimed_by/scoring_claimed_at columns before they are
+ * scored, the same way the Python backlog pipeline does
+ * (src/agent/tweet_pipeline.py documents the columns and the
+ * score_claimed_tweets() function), so the two can run side by side
+ * without scoring a row twice.
+ */
 class TweetScoringService {
   private supabase: SupabaseClient;
   private isRunning: boolean = false;
   private checkInterval: number = 30000; // Check every 30 seconds
+  private agentWorker: AgentWorker | null = null;
+  private requestCounter: number = 0;
+  private batchSize: number = parseInt(process.env.SCORING_BATCH_SIZE || "20", 10);
+  private maxBatchesInFlight: number = parseInt(process.env.SCORING_BATCHES_IN_FLIGHT || "4", 10);
+  private requestTimeout: number = parseInt(process.env.SCORING_REQUEST_TIMEOUT_MS || "120000", 10);
+  private workerId: string = `scoring-service-${hostname()}-${process.pid}`;
+  private claimTtl: number = parseFloat(process.env.PIPELINE_CLAIM_TTL || "600");
+  private writeFunction: string | null = process.env.PIPELINE_WRITE_FUNCTION || "score_claimed_tweets";
 
   constructor() {
     const supabaseUrl = process.env.SUPABASE_URL || "";
@@ -42,118 +69,155 @@ class TweetScoringService {
   }
 
   /**
-   * Analyze tweet content using the Python agent
+   * Start (or reuse) the long-lived Python scoring worker.
+   * The worker speaks JSON lines on stdin/stdout and answers by request id.
    */
-  private async analyzeTweetWithAgent(content: string): Promise<{
-    score: number;
-    sentiment: string;
-    explanation: string;
-  }> {
-    return new Promise((resolve, reject) => {
-      try {
-        // Create a mock tweet for the agent
-        const mockTweet = {
-          id: Date.now(), // Use timestamp as temporary ID
-          content: content,
-          author: "temp_author"
-        };
-
-        // Spawn Python process to run the agent
-        const pythonProcess = spawn('python3', [
-          'src/agent/my_first_agent.py',
-          '--analyze-tweet',
-          JSON.stringify(mockTweet)
-        ]);
-
-        let output = '';
-        let errorOutput = '';
-
-        pythonProcess.stdout.on('data', (data) => {
-          output += data.toString();
-        });
-
-        pythonProcess.stderr.on('data', (data) => {
-          errorOutput += data.toString();
-        });
+  private getAgentWorker(): AgentWorker {
+    if (this.agentWorker) {
+      return this.agentWorker;
+    }
 
-        pythonProcess.on('close', (code) => {
-          if (code === 0) {
-            try {
-              // Try to extract JSON from the output (handle warnings)
-              const lines = output.split('\n');
-              let jsonLine = '';
-              
-              // Find the line that contains JSON
-              for (const line of lines) {
-                if (line.trim().startsWith('{') && line.trim().endsWith('}')) {
-                  jsonLine = line.trim();
-                  break;
-                }
-              }
-              
-              if (jsonLine) {
-                const result = JSON.parse(jsonLine);
-                resolve({
-                  score: result.score || 0,
-                  sentiment: result.sentiment || "Neutral",
-                  explanation: result.explanation || "Analysis completed",
-                });
-              } else {
-                console.error("No JSON found in agent output:", output);
-                resolve({
-                  score: 0,
-                  sentiment: "Neutral",
-                  explanation: "No JSON response from agent",
-                });
-              }
-            } catch (parseError) {
-              console.error("Error parsing agent response:", parseError);
-              console.error("Raw output:", output);
-              resolve({
-                score: 0,
-                sentiment: "Neutral",
-                explanation: "Failed to parse agent response",
-              });
-            }
-          } else {
-            console.error("Agent process failed:", errorOutput);
-            resolve({
-              score: 0,
-              sentiment: "Neutral",
-              explanation: `Agent analysis failed: ${errorOutput}`,
-            });
+    const child = spawn('python3', [
+      'src/agent/my_first_agent.py',
+      '--serve-stdio',
+      '--async'
+    ]);
+    const worker: AgentWorker = { process: child, pending: new Map() };
+
+    let buffered = '';
+    child.stdout.on('data', (data) => {
+      buffered += data.toString();
+      const lines = buffered.split('\n');
+      buffered = lines.pop() || '';
+
+      for (const line of lines) {
+        if (!line.trim()) {
+          continue;
+        }
+        try {
+          const response = JSON.parse(line);
+          const pending = worker.pending.get(String(response.id));
+          if (pending) {
+            worker.pending.delete(String(response.id));
+            pending(response);
           }
-        });
+        } catch (parseError) {
+          console.error("Error parsing agent worker response:", line);
+        }
+      }
+    });
 
-        pythonProcess.on('error', (error) => {
-          console.error("Error spawning agent process:", error);
-          resolve({
-            score: 0,
-            sentiment: "Neutral",
-            explanation: `Agent process error: ${error.message}`,
-          });
-        });
+    child.stderr.on('data', (data) => {
+      console.error(`Agent worker: ${data.toString().trim()}`);
+    });
 
-      } catch (error) {
-        console.error("Error in agent analysis:", error);
-        resolve({
-          score: 0,
-          sentiment: "Neutral",
-          explanation: `Agent analysis failed: ${error}`,
+    const failPending = (reason: string) => {
+      if (this.agentWorker === worker) {
+        this.agentWorker = null;
+      }
+      for (const [id, pending] of worker.pending) {
+        pending({ id, error: reason });
+      }
+      worker.pending.clear();
+    };
+
+    child.on('close', (code) => {
+      console.error(`Agent worker exited with code ${code}`);
+      failPending(`Agent worker exited with code ${code}`);
+    });
+
+    child.on('error', (error) => {
+      console.error("Error spawning agent worker:", error);
+      failPending(`Agent process error: ${error.message}`);
+    });
+
+    // Writing to a worker that just died fails with EPIPE; without a
+    // handler that error would crash the service
+    child.stdin.on('error', (error) => {
+      console.error("Error writing to agent worker:", error);
+      failPending(`Agent worker stdin error: ${error.message}`);
+      child.kill();
+    });
+
+    this.agentWorker = worker;
+    return worker;
+  }
+
+  /**
+   * Send one JSON request to the agent worker and wait for its response.
+   * A request that gets no answer within the timeout fails, and the
+   * worker is restarted in case it hung.
+   */
+  private sendWorkerRequest(payload: Record<string, any>): Promise<any> {
+    return new Promise((resolve) => {
+      try {
+        const worker = this.getAgentWorker();
+        const id = String(++this.requestCounter);
+        const timer = setTimeout(() => {
+          if (!worker.pending.has(id)) {
+            return;
+          }
+          worker.pending.delete(id);
+          console.error(`Agent worker request ${id} timed out after ${this.requestTimeout} ms; restarting worker`);
+          resolve({ id, error: `Agent worker timed out after ${this.requestTimeout} ms` });
+          if (this.agentWorker === worker) {
+            this.agentWorker = null;
+          }
+          worker.process.kill();
+        }, this.requestTimeout);
+        worker.pending.set(id, (response) => {
+          clearTimeout(timer);
+          resolve(response);
         });
+        worker.process.stdin.write(JSON.stringify({ ...payload, id }) + '\n');
+      } catch (error) {
+        resolve({ error: `${error}` });
       }
     });
   }
 
   /**
-   * Fetch unscored tweets from Supabase
+   * Analyze several tweets with one batched request to the Python agent worker.
+   * Only the score is stored, so the agent is asked for the compact
+   * score-only profile. A null score means the analysis failed.
+   */
+  private async analyzeTweetsWithAgent(contents: string[]): Promise<{
+    score: number | null;
+    error?: string;
+  }[]> {
+    const response = await this.sendWorkerRequest({ tweets: contents, profile: "score" });
+
+    if (response.error || !Array.isArray(response.results)) {
+      const reason = response.error || "No results from agent";
+      console.error("Agent analysis failed:", reason);
+      return contents.map(() => ({ score: null, error: reason }));
+    }
+
+    return response.results.map((result: any) => ({
+      score: typeof result.score === "number" ? result.score : null,
+      error: result.error,
+    }));
+  }
+
+  /**
+   * Filter for rows nobody holds a live claim on; claims left behind by
+   * a crashed worker expire after PIPELINE_CLAIM_TTL seconds
    */
-  private async getUnscoredTweets(): Promise<Tweet[]> {
+  private unclaimedFilter(): string {
+    const expired = new Date(Date.now() - this.claimTtl * 1000).toISOString();
+    return `scoring_claimed_at.is.null,scoring_claimed_at.lt.${expired}`;
+  }
+
+  /**
+   * Fetch unscored, unclaimed tweets from Supabase
+   */
+  private async getUnscoredTweets(): Promise<UnscoredTweet[]> {
     try {
       const { data, error } = await this.supabase
         .from("collected_tweets")
-        .select("*")
+        .select("id, text, full_text")
         .is("score", null)
+        .or(this.unclaimedFilter())
         .order("created_at", { ascending: true });
 
       if (error) {
@@ -168,43 +232,129 @@ class TweetScoringService {
   }
 
   /**
-   * Update tweet with score and sentiment
+   * Claim the rows that are still unscored and unclaimed; returns the ids
+   * this service now holds. Postgres re-checks the filters under the row
+   * lock, so two workers can't both win the same row.
    */
-  private async updateTweetScore(
-    tweetId: number,
-    score: number
-  ): Promise<void> {
-    try {
-      const { error } = await this.supabase
+  private async claimTweets(ids: number[]): Promise<Set<number>> {
+    const { data, error } = await this.supabase
+      .from("collected_tweets")
+      .update({ scoring_claimed_by: this.workerId, scoring_claimed_at: new Date().toISOString() })
+      .in("id", ids)
+      .is("score", null)
+      .or(this.unclaimedFilter())
+      .select("id");
+
+    if (error) {
+      throw new Error(`Error claiming tweets: ${error.message}`);
+    }
+    return new Set((data || []).map((row: { id: number }) => row.id));
+  }
+
+  /**
+   * Store scores for rows this service still holds a claim on and release
+   * those claims. Returns the ids written; rows whose claim expired and was
+   * taken by another worker are left alone.
+   */
+  private async writeScores(scores: Map<number, number>): Promise<number[]> {
+    if (this.writeFunction) {
+      const { data, error, status } = await this.supabase.rpc(this.writeFunction, {
+        worker: this.workerId,
+        scores: Array.from(scores, ([id, score]) => ({ id, score })),
+      });
+      if (!error) {
+        return (data || []).map((row: { id: number }) => row.id);
+      }
+      if (status !== 404) {
+        throw new Error(`Error writing tweet scores: ${error.message}`);
+      }
+      console.warn(`⚠️ No ${this.writeFunction}() function, writing scores with one update per score value`);
+      this.writeFunction = null;
+    }
+
+    const idsByScore = new Map<number, number[]>();
+    for (const [id, score] of scores) {
+      idsByScore.set(score, [...(idsByScore.get(score) || []), id]);
+    }
+    const written: number[] = [];
+    for (const [score, ids] of idsByScore) {
+      const { data, error } = await this.supabase
         .from("collected_tweets")
-        .update({
-          score,
-        })
-        .eq("id", tweetId);
+        .update({ score, scoring_claimed_by: null, scoring_claimed_at: null })
+        .in("id", ids)
+        .eq("scoring_claimed_by", this.workerId)
+        .select("id");
 
       if (error) {
-        throw new Error(`Error updating tweet score: ${error.message}`);
+        throw new Error(`Error writing tweet scores: ${error.message}`);
       }
+      written.push(...(data || []).map((row: { id: number }) => row.id));
+    }
+    return written;
+  }
 
-      console.log(`✅ Tweet ${tweetId} scored: ${score}`);
-    } catch (error) {
-      console.error(`❌ Error updating tweet ${tweetId}:`, error);
+  /**
+   * Give up the claim on rows that could not be scored, so they are
+   * retried on a later pass
+   */
+  private async releaseClaims(ids: number[]): Promise<void> {
+    const { error } = await this.supabase
+      .from("collected_tweets")
+      .update({ scoring_claimed_by: null, scoring_claimed_at: null })
+      .in("id", ids)
+      .eq("scoring_claimed_by", this.workerId);
+
+    if (error) {
+      console.error(`❌ Error releasing claims on ${ids.length} tweets:`, error.message);
     }
   }
 
   /**
-   * Process a single tweet
+   * Claim a batch of tweets, score it with one agent request and write the
+   * scores back in bulk
    */
-  private async processTweet(tweet: Tweet): Promise<void> {
+  private async processTweetBatch(tweets: UnscoredTweet[]): Promise<void> {
     try {
-      const tweetContent = tweet.full_text || tweet.text;
-      console.log(`🤖 Analyzing tweet ${tweet.id}: "${tweetContent.substring(0, 50)}..."`);
-      
-      const analysis = await this.analyzeTweetWithAgent(tweetContent);
-      
-      await this.updateTweetScore(tweet.id, analysis.score);
+      const claimed = await this.claimTweets(tweets.map((tweet) => tweet.id));
+      const batch = tweets.filter((tweet) => claimed.has(tweet.id));
+      if (batch.length < tweets.length) {
+        console.log(`⏭️ Skipping ${tweets.length - batch.length} tweets claimed by another worker`);
+      }
+      if (batch.length === 0) {
+        return;
+      }
+
+      const contents = batch.map((tweet) => tweet.full_text || tweet.text);
+      console.log(`🤖 Analyzing ${batch.length} tweets (${batch[0].id}..${batch[batch.length - 1].id})`);
+
+      const analyses = await this.analyzeTweetsWithAgent(contents);
+
+      const scores = new Map<number, number>();
+      const failed: number[] = [];
+      for (let i = 0; i < batch.length; i++) {
+        const { score, error } = analyses[i];
+        if (score === null) {
+          // Leave the tweet unscored so it is retried, rather than storing 0
+          console.error(`❌ Tweet ${batch[i].id} not scored: ${error}`);
+          failed.push(batch[i].id);
+          continue;
+        }
+        scores.set(batch[i].id, score);
+      }
+
+      if (scores.size > 0) {
+        const written = await this.writeScores(scores);
+        console.log(`✅ Scored ${written.length} tweets`);
+        if (written.length < scores.size) {
+          console.warn(`⚠️ ${scores.size - written.length} tweets lost their claim before the write and were left alone`);
+        }
+      }
+      if (failed.length > 0) {
+        await this.releaseClaims(failed);
+      }
     } catch (error) {
-      console.error(`❌ Error processing tweet ${tweet.id}:`, error);
+      // Claims still held expire after the claim TTL, and the rows are retried
+      console.error(`❌ Error processing tweet batch:`, error);
     }
   }
 
@@ -222,12 +372,23 @@ class TweetScoringService {
 
       console.log(`📊 Found ${unscoredTweets.length} unscored tweets to process`);
       
-      // Process tweets sequentially to avoid rate limits
-      for (const tweet of unscoredTweets) {
-        await this.processTweet(tweet);
-        // Small delay between requests
-        await new Promise(resolve => setTimeout(resolve, 1000));
+      // Send tweets to the agent in batches; the agent packs each batch
+      // into as few GPT calls as its token budget allows and paces them
+      // with its own rate limiter, so several batches can be in flight
+      const batches: UnscoredTweet[][] = [];
+      for (let i = 0; i < unscoredTweets.length; i += this.batchSize) {
+        batches.push(unscoredTweets.slice(i, i + this.batchSize));
       }
+
+      let nextBatch = 0;
+      const runBatches = async () => {
+        while (nextBatch < batches.length) {
+          await this.processTweetBatch(batches[nextBatch++]);
+        }
+      };
+      await Promise.all(
+        Array.from({ length: Math.min(this.maxBatchesInFlight, batches.length) }, runBatches)
+      );
       
       console.log(`✅ Finished processing ${unscoredTweets.length} tweets`);
     } catch (error) {
@@ -271,6 +432,11 @@ class TweetScoringService {
   public stop(): void {
     console.log("🛑 Stopping Tweet Scoring Service...");
     this.isRunning = false;
+
+    if (this.agentWorker) {
+      this.agentWorker.process.stdin.end();
+      this.agentWorker = null;
+    }
   }
 
   /**